@@ -0,0 +1,131 @@
+"""
+Registro de acceso estructurado.
+Asigna un ID a cada petición y escribe una línea JSON por petición con la
+ruta, el estado, la latencia total, el tiempo y número de consultas SQL,
+los aciertos de caché y el tamaño de la respuesta. El ID también se agrega
+a las líneas de app.log para correlacionarlas con la petición.
+"""
+
+import json
+import logging
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Logger del registro de acceso; su handler se configura en setup_logging()
+logger = logging.getLogger("app.acceso")
+logger.propagate = False
+
+# Medición de la petición en curso; el diccionario se comparte con los
+# hilos de los handlers porque el contexto se copia por referencia
+_medicion: ContextVar[Optional[dict]] = ContextVar("medicion", default=None)
+
+# IDs recibidos en X-Request-ID que se aceptan tal cual
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def request_id_actual() -> Optional[str]:
+    """Retorna el ID de la petición en curso, o None fuera de una petición"""
+    medicion = _medicion.get()
+    return medicion["request_id"] if medicion else None
+
+
+def contar_acierto_cache() -> None:
+    """Suma un acierto de caché a la petición en curso (lo llaman las cachés)"""
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion["cache_hits"] += 1
+
+
+class RequestIdFilter(logging.Filter):
+    """Agrega `request_id` a los registros de log ("-" fuera de una petición)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_actual() or "-"
+        return True
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes_consulta(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _medicion.get() is not None:
+        conn.info.setdefault("inicio_acceso", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues_consulta(conn, cursor, statement, parameters, context, executemany) -> None:
+    medicion = _medicion.get()
+    inicios = conn.info.get("inicio_acceso")
+    if medicion is None or not inicios:
+        return
+    medicion["db_ms"] += (time.perf_counter() - inicios.pop()) * 1000
+    medicion["consultas"] += 1
+
+
+class AccessLogMiddleware:
+    """
+    Middleware ASGI que mide cada petición HTTP y escribe su línea de acceso.
+
+    Usa el encabezado `X-Request-ID` recibido si es válido o genera uno, y
+    lo retorna en la respuesta. El tiempo SQL se mide con listeners sobre
+    todos los engines, sumando solo las consultas de la petición en curso.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recibido = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        medicion = {
+            "request_id": recibido if _ID_VALIDO.match(recibido) else uuid.uuid4().hex,
+            "db_ms": 0.0,
+            "consultas": 0,
+            "cache_hits": 0,
+        }
+        respuesta = {"estado": 500, "bytes": 0}
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+
+        async def send_con_medicion(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                respuesta["estado"] = message["status"]
+                MutableHeaders(scope=message)["X-Request-ID"] = medicion["request_id"]
+            elif message["type"] == "http.response.body":
+                respuesta["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_con_medicion)
+        finally:
+            _medicion.reset(token)
+            self._escribir(scope, medicion, respuesta, time.perf_counter() - inicio)
+
+    @staticmethod
+    def _escribir(scope: Scope, medicion: dict, respuesta: dict, segundos: float) -> None:
+        ruta = scope.get("route")
+        linea = {
+            "fecha": datetime.now().isoformat(timespec="milliseconds"),
+            "request_id": medicion["request_id"],
+            "metodo": scope["method"],
+            "ruta": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "plantilla": getattr(ruta, "path", None),
+            "estado": respuesta["estado"],
+            "duracion_ms": round(segundos * 1000, 2),
+            "db_ms": round(medicion["db_ms"], 2),
+            "consultas": medicion["consultas"],
+            "cache_hits": medicion["cache_hits"],
+            "bytes": respuesta["bytes"],
+        }
+        logger.info(json.dumps(linea, ensure_ascii=False))
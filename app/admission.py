@@ -0,0 +1,267 @@
+"""
+Control de admisión y descarte de carga.
+Limita las peticiones simultáneas por grupo de rutas y rechaza con 503
+cuando la cola de espera está llena, en lugar de dejar que la latencia
+crezca para todas las rutas.
+"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from typing import Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Rutas que nunca se limitan: monitoreo, métricas y conexiones de larga duración
+RUTAS_EXCLUIDAS = ("/health", "/api/admin", "/api/eventos")
+
+METODOS_LECTURA = {"GET", "HEAD", "OPTIONS"}
+
+
+class GrupoAdmision:
+    """
+    Semáforo con cola acotada para un grupo de rutas.
+
+    Hasta `concurrencia` peticiones se ejecutan a la vez; las siguientes
+    esperan en orden de llegada hasta `max_cola`. Las que no caben en la
+    cola, o esperan más de `espera_max` segundos, se rechazan.
+    Se usa siempre desde el event loop, por lo que no necesita locks.
+    """
+
+    def __init__(self, nombre: str, concurrencia: int, max_cola: int, espera_max: float):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.activas = 0
+        self._espera: deque[asyncio.Future] = deque()
+        self.admitidas = 0
+        self.rechazadas = 0
+
+    @property
+    def en_cola(self) -> int:
+        """Número de peticiones esperando turno"""
+        return len(self._espera)
+
+    async def adquirir(self) -> bool:
+        """Espera un turno; retorna False si la petición debe rechazarse"""
+        if self.activas < self.concurrencia and not self._espera:
+            self.activas += 1
+            self.admitidas += 1
+            return True
+
+        if len(self._espera) >= self.max_cola:
+            self.rechazadas += 1
+            return False
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._espera.append(futuro)
+        try:
+            await asyncio.wait_for(futuro, self.espera_max)
+        except asyncio.TimeoutError:
+            self._quitar(futuro)
+            self.rechazadas += 1
+            return False
+        except asyncio.CancelledError:
+            # El cliente se desconectó; si ya había recibido el turno, lo cede
+            if futuro.done() and not futuro.cancelled():
+                self.liberar()
+            else:
+                self._quitar(futuro)
+            raise
+        self.admitidas += 1
+        return True
+
+    def liberar(self) -> None:
+        """Cede el turno a la siguiente petición en espera o lo libera"""
+        while self._espera:
+            futuro = self._espera.popleft()
+            if not futuro.done():
+                futuro.set_result(None)
+                return
+        self.activas -= 1
+
+    def _quitar(self, futuro: asyncio.Future) -> None:
+        with suppress(ValueError):
+            self._espera.remove(futuro)
+
+    def metricas(self) -> dict:
+        """Retorna la ocupación y los contadores del grupo"""
+        return {
+            "activas": self.activas,
+            "en_cola": self.en_cola,
+            "concurrencia": self.concurrencia,
+            "max_cola": self.max_cola,
+            "admitidas": self.admitidas,
+            "rechazadas": self.rechazadas,
+        }
+
+
+class AdmissionController:
+    """Clasifica las peticiones de la API en grupos de admisión"""
+
+    def __init__(self, grupos: dict[str, GrupoAdmision], retry_after: int = 1):
+        self.grupos = grupos
+        self.retry_after = retry_after
+
+    def clasificar(self, metodo: str, ruta: str) -> Optional[GrupoAdmision]:
+        """Retorna el grupo de la petición o None si no se limita"""
+        if not ruta.startswith("/api/") or ruta.startswith(RUTAS_EXCLUIDAS):
+            return None
+        return self.grupos["lectura" if metodo in METODOS_LECTURA else "escritura"]
+
+    def metricas(self) -> dict:
+        """Retorna las métricas de todos los grupos"""
+        return {nombre: grupo.metricas() for nombre, grupo in self.grupos.items()}
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI que aplica el control de admisión"""
+
+    def __init__(self, app: ASGIApp, controlador: AdmissionController):
+        self.app = app
+        self.controlador = controlador
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        grupo = self.controlador.clasificar(scope["method"], scope["path"])
+        if grupo is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await grupo.adquirir():
+            logger.warning(
+                f"Petición rechazada por sobrecarga: {scope['method']} {scope['path']} "
+                f"(grupo={grupo.nombre}, en_cola={grupo.en_cola})"
+            )
+            respuesta = JSONResponse(
+                status_code=503,
+                content={"detail": "Servidor saturado, intente más tarde"},
+                headers={
+                    "Retry-After": str(self.controlador.retry_after),
+                    "X-Queue-Depth": str(grupo.en_cola),
+                },
+            )
+            await respuesta(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            grupo.liberar()
+
+
+class MantenimientoOcupadoError(Exception):
+    """Hay otras peticiones en curso o ya hay una operación de mantenimiento"""
+
+
+# Conexiones de larga duración que no usan la base de datos
+RUTAS_SIN_CONTEO = ("/api/eventos", "/static")
+
+
+class Mantenimiento:
+    """
+    Cuenta las peticiones en curso para que una operación de mantenimiento
+    (restaurar un respaldo) se ejecute sola: solo empieza si no hay otras
+    peticiones en curso y, mientras dura, las nuevas se rechazan con 503.
+    El contador se usa desde el event loop y desde los hilos de los
+    handlers, por eso lleva un lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.en_curso = 0
+        self.activo = False
+
+    def entrar(self) -> bool:
+        """Registra una petición; retorna False si hay un mantenimiento en curso"""
+        with self._lock:
+            if self.activo:
+                return False
+            self.en_curso += 1
+            return True
+
+    def salir(self) -> None:
+        """Registra el fin de una petición"""
+        with self._lock:
+            self.en_curso -= 1
+
+    @contextmanager
+    def exclusivo(self) -> Iterator[None]:
+        """
+        Ejecuta el bloque sin otras peticiones en curso (la que lo pide cuenta
+        como una); lanza MantenimientoOcupadoError si las hay.
+        """
+        with self._lock:
+            if self.activo or self.en_curso > 1:
+                raise MantenimientoOcupadoError(f"{max(self.en_curso - 1, 0)} peticiones en curso")
+            self.activo = True
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.activo = False
+
+
+class MantenimientoMiddleware:
+    """Middleware ASGI que cuenta las peticiones y las rechaza durante un mantenimiento"""
+
+    def __init__(self, app: ASGIApp, mantenimiento: Mantenimiento, retry_after: int = 1):
+        self.app = app
+        self.mantenimiento = mantenimiento
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(RUTAS_SIN_CONTEO):
+            await self.app(scope, receive, send)
+            return
+
+        if not self.mantenimiento.entrar():
+            respuesta = JSONResponse(
+                status_code=503,
+                content={"detail": "Restauración en curso, intente más tarde"},
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await respuesta(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.mantenimiento.salir()
+
+
+settings = get_settings()
+
+# Instancia compartida por el middleware y el endpoint de restauración
+mantenimiento = Mantenimiento()
+
+# Instancia compartida por el middleware y el endpoint de métricas
+admision = AdmissionController(
+    {
+        "lectura": GrupoAdmision(
+            "lectura",
+            settings.admission_read_concurrency,
+            settings.admission_read_queue,
+            settings.admission_queue_timeout_seconds,
+        ),
+        "escritura": GrupoAdmision(
+            "escritura",
+            settings.admission_write_concurrency,
+            settings.admission_write_queue,
+            settings.admission_queue_timeout_seconds,
+        ),
+    },
+    retry_after=settings.admission_retry_after_seconds,
+)
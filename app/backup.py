@@ -0,0 +1,336 @@
+"""
+Respaldos en línea de la base de datos.
+Copia la base de datos con la API de backup de SQLite en pasos de pocas
+páginas, con una pausa entre pasos, para que los routers puedan seguir
+escribiendo mientras se respalda. Los respaldos se verifican con
+PRAGMA integrity_check antes de darlos por buenos y antes de restaurarlos.
+
+Con favoritos repartidos en shards, cada respaldo es un conjunto: el archivo
+de la base principal y, junto a él, un archivo por shard con el sufijo
+`.shardN`. El conjunto se crea, se lista, se rota y se restaura como una unidad.
+
+Uso desde la línea de comandos:
+    python -m app.backup crear
+    python -m app.backup listar
+    python -m app.backup verificar backups/musica-20240101-120000-000000.db
+    python -m app.backup restaurar backups/musica-20240101-120000-000000.db
+"""
+
+import argparse
+import asyncio
+import logging
+import re
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+
+from app.cache import CacheManager
+from app.changefeed import _lock_traslado
+from app.config import get_settings
+from app.database import engine, inicializar_esquema
+from app.sharding import shards
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PREFIJO = "musica-"
+_ARCHIVO_SHARD = re.compile(r"\.shard\d+\.db$")
+
+
+class RespaldoInvalidoError(Exception):
+    """El archivo de respaldo no existe o no pasa la verificación de integridad"""
+
+
+class _CopiaAbandonadaError(Exception):
+    """La copia por pasos se reinició demasiadas veces o superó su plazo"""
+
+
+def directorio_respaldos() -> Path:
+    """Carpeta donde se guardan los respaldos"""
+    return Path(settings.backup_dir)
+
+
+def archivo_shard(respaldo: Path, shard: int) -> Path:
+    """Archivo del shard dentro del conjunto del respaldo"""
+    return respaldo.with_name(f"{respaldo.stem}.shard{shard}{respaldo.suffix}")
+
+
+def shards_del_respaldo(respaldo: Path) -> list[Path]:
+    """Archivos de shard que acompañan al respaldo, en orden de shard"""
+    archivos = []
+    while archivo_shard(respaldo, len(archivos)).is_file():
+        archivos.append(archivo_shard(respaldo, len(archivos)))
+    return archivos
+
+
+def _engines_shards() -> list[Engine]:
+    """Engines de los shards que se respaldan junto con la base principal"""
+    return shards.engines if shards.activo else []
+
+
+def verificar(ruta: Path) -> bool:
+    """Retorna True si el archivo es una base de datos SQLite íntegra"""
+    if not ruta.is_file():
+        return False
+    conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    try:
+        return conexion.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conexion.close()
+
+
+def _copiar(origen: sqlite3.Connection, destino: sqlite3.Connection) -> tuple[int, int]:
+    """
+    Copia por pasos de settings.backup_pages páginas; retorna (páginas, reinicios).
+
+    Cada escritura de otra conexión hace que SQLite reinicie la copia, así
+    que con escrituras continuas podría no terminar nunca. Un reinicio se
+    detecta porque las páginas restantes vuelven a subir; tras
+    settings.backup_max_restarts reinicios, o pasados
+    settings.backup_max_seconds, se abandona la copia por pasos y se hace
+    una sola copia completa, que mantiene el bloqueo de lectura hasta el final.
+    """
+    paginas = reinicios = 0
+    anteriores = None
+    limite = time.monotonic() + settings.backup_max_seconds
+
+    def progreso(estado, restantes, total):
+        nonlocal paginas, reinicios, anteriores
+        paginas = total
+        if anteriores is not None and restantes > anteriores:
+            reinicios += 1
+        anteriores = restantes
+        if reinicios > settings.backup_max_restarts or time.monotonic() > limite:
+            raise _CopiaAbandonadaError
+
+    try:
+        origen.backup(
+            destino,
+            pages=settings.backup_pages,
+            progress=progreso,
+            sleep=settings.backup_sleep_ms / 1000,
+        )
+    except _CopiaAbandonadaError:
+        logger.warning(
+            f"Copia por pasos abandonada tras {reinicios} reinicios; se copia en un solo paso"
+        )
+        origen.backup(destino, pages=-1)
+        paginas = origen.execute("PRAGMA page_count").fetchone()[0]
+    return paginas, reinicios
+
+
+def crear_respaldo(
+    engine: Engine = engine,
+    destino: Optional[Path] = None,
+    engines_shards: Optional[list[Engine]] = None,
+) -> dict:
+    """
+    Crea un respaldo de la base de datos sin detener la aplicación.
+
+    Entre cada paso se libera el bloqueo de lectura, así que las escrituras
+    solo esperan un paso; si otra conexión modifica la base de datos durante
+    la copia, SQLite reinicia la copia para que el respaldo sea consistente
+    (con un límite de reinicios, ver _copiar).
+    Con shards activos se copia también cada shard al conjunto del respaldo.
+    Cada archivo se escribe con extensión `.parcial` y solo se renombran
+    cuando todos pasan la verificación (la base principal la última, así
+    un respaldo listado siempre tiene sus shards completos). Se conservan
+    los últimos settings.backup_keep respaldos.
+    """
+    if destino is None:
+        marca = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        destino = directorio_respaldos() / f"{PREFIJO}{marca}.db"
+    if engines_shards is None:
+        engines_shards = _engines_shards()
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    copias = [
+        (engine_shard, archivo_shard(destino, shard))
+        for shard, engine_shard in enumerate(engines_shards)
+    ] + [(engine, destino)]
+
+    inicio = time.perf_counter()
+    paginas = reinicios = 0
+    parciales = []
+    try:
+        for engine_origen, archivo in copias:
+            parcial = archivo.with_suffix(".parcial")
+            parciales.append(parcial)
+            conexion = engine_origen.raw_connection()
+            copia = sqlite3.connect(parcial)
+            try:
+                paginas_archivo, reinicios_archivo = _copiar(conexion.driver_connection, copia)
+            finally:
+                copia.close()
+                conexion.close()
+            paginas += paginas_archivo
+            reinicios += reinicios_archivo
+            if not verificar(parcial):
+                raise RespaldoInvalidoError(f"El respaldo {archivo.name} no pasó la verificación")
+    except Exception:
+        for parcial in parciales:
+            parcial.unlink(missing_ok=True)
+        raise
+    for parcial, (_, archivo) in zip(parciales, copias, strict=False):
+        parcial.replace(archivo)
+
+    eliminados = _rotar()
+    resultado = {
+        "archivo": str(destino),
+        "shards": len(engines_shards),
+        "paginas": paginas,
+        "reinicios": reinicios,
+        "bytes": sum(archivo.stat().st_size for _, archivo in copias),
+        "segundos": round(time.perf_counter() - inicio, 3),
+        "rotados": eliminados,
+    }
+    logger.info(f"Respaldo creado: {destino} ({paginas} páginas en {resultado['segundos']} s)")
+    return resultado
+
+
+def _rotar() -> int:
+    """Elimina los respaldos más antiguos que exceden settings.backup_keep"""
+    if settings.backup_keep <= 0:
+        return 0
+    sobrantes = listar_respaldos()[settings.backup_keep :]
+    for respaldo in sobrantes:
+        archivo = Path(respaldo["archivo"])
+        for archivo_del_conjunto in [archivo, *shards_del_respaldo(archivo)]:
+            archivo_del_conjunto.unlink(missing_ok=True)
+    return len(sobrantes)
+
+
+def listar_respaldos() -> list[dict]:
+    """Lista los respaldos del directorio, del más reciente al más antiguo"""
+    archivos = sorted(directorio_respaldos().glob(f"{PREFIJO}*.db"), reverse=True)
+    respaldos = []
+    for archivo in archivos:
+        if _ARCHIVO_SHARD.search(archivo.name):
+            continue
+        del_conjunto = shards_del_respaldo(archivo)
+        respaldos.append(
+            {
+                "nombre": archivo.name,
+                "archivo": str(archivo),
+                "shards": len(del_conjunto),
+                "bytes": sum(a.stat().st_size for a in [archivo, *del_conjunto]),
+                "fecha": datetime.fromtimestamp(archivo.stat().st_mtime),
+            }
+        )
+    return respaldos
+
+
+def restaurar_respaldo(
+    origen: Path,
+    engine: Engine = engine,
+    engines_shards: Optional[list[Engine]] = None,
+) -> dict:
+    """
+    Restaura un respaldo sobre la base de datos en uso.
+
+    Todos los archivos del conjunto se verifican antes de copiar ninguno, y
+    el conjunto debe tener tantos shards como la configuración actual; cada
+    base de datos restaurada se verifica después. La copia usa la misma API
+    por pasos, en sentido inverso, y se hace sin traslados de eventos en
+    curso. Al terminar se sincroniza el esquema (el respaldo puede ser de
+    una versión anterior) y se vacían los cachés e índices en memoria.
+    """
+    if engines_shards is None:
+        engines_shards = _engines_shards()
+    if not verificar(origen):
+        raise RespaldoInvalidoError(f"El respaldo {origen} no existe o está dañado")
+    del_conjunto = shards_del_respaldo(origen)
+    if len(del_conjunto) != len(engines_shards):
+        raise RespaldoInvalidoError(
+            f"El respaldo {origen} tiene {len(del_conjunto)} shards y la "
+            f"configuración actual {len(engines_shards)}"
+        )
+    for archivo in del_conjunto:
+        if not verificar(archivo):
+            raise RespaldoInvalidoError(f"El respaldo {archivo} está dañado")
+
+    inicio = time.perf_counter()
+    paginas = 0
+    with _lock_traslado:
+        for engine_destino, archivo in [
+            (engine, origen),
+            *zip(engines_shards, del_conjunto, strict=False),
+        ]:
+            conexion = engine_destino.raw_connection()
+            respaldo = sqlite3.connect(f"file:{archivo}?mode=ro", uri=True)
+            try:
+                paginas_archivo, _ = _copiar(respaldo, conexion.driver_connection)
+                integridad = conexion.driver_connection.execute(
+                    "PRAGMA integrity_check"
+                ).fetchone()[0]
+            finally:
+                respaldo.close()
+                conexion.close()
+            if integridad != "ok":
+                raise RespaldoInvalidoError(
+                    f"La base de datos restaurada desde {archivo.name} no es íntegra: {integridad}"
+                )
+            paginas += paginas_archivo
+
+    inicializar_esquema(engine)
+    shards.crear_tablas()
+    CacheManager.clear_all()
+    CacheManager.invalidate_indexes()
+
+    segundos = round(time.perf_counter() - inicio, 3)
+    logger.warning(f"Base de datos restaurada desde {origen} ({paginas} páginas en {segundos} s)")
+    return {
+        "archivo": str(origen),
+        "shards": len(del_conjunto),
+        "paginas": paginas,
+        "segundos": segundos,
+    }
+
+
+async def respaldos_periodicos(enviar) -> None:
+    """
+    Encola un respaldo cada settings.backup_interval_hours horas.
+    `enviar` es una función sin argumentos que encola el trabajo.
+    """
+    intervalo = settings.backup_interval_hours * 3600
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await asyncio.to_thread(enviar)
+        except Exception:
+            logger.exception("No se pudo encolar el respaldo programado")
+
+
+def main() -> None:
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Respaldos en línea de la base de datos")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    crear = comandos.add_parser("crear", help="Crear un respaldo")
+    crear.add_argument("--destino", type=Path, help="Archivo de destino")
+    comandos.add_parser("listar", help="Listar los respaldos")
+    for nombre, ayuda in (("verificar", "Verificar un respaldo"), ("restaurar", "Restaurar")):
+        comando = comandos.add_parser(nombre, help=ayuda)
+        comando.add_argument("archivo", type=Path)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level, format="%(levelname)s - %(message)s")
+    if args.comando == "crear":
+        print(crear_respaldo(destino=args.destino)["archivo"])
+    elif args.comando == "listar":
+        for respaldo in listar_respaldos():
+            print(f"{respaldo['nombre']}\t{respaldo['bytes']} bytes\t{respaldo['fecha']}")
+    elif args.comando == "verificar":
+        integro = verificar(args.archivo)
+        print("ok" if integro else "dañado")
+        raise SystemExit(0 if integro else 1)
+    else:
+        print(restaurar_respaldo(args.archivo))
+
+
+if __name__ == "__main__":
+    main()
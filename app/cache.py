@@ -4,18 +4,33 @@ Implementa caché para consultas frecuentes.
 """
 
 import logging
-from functools import lru_cache
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from collections.abc import Callable, Hashable
+from functools import lru_cache, wraps
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+from app.access_log import contar_acierto_cache
+from app.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
 
 class CacheManager:
     """
     Gestor de caché centralizado.
-    Permite limpiar el caché cuando sea necesario.
+    Permite limpiar el caché cuando sea necesario. Cada limpieza avanza la
+    generación, que identifica el estado de los datos que vio una lectura.
     """
 
     _cache_functions = []
+    _indexes = []
+    _generacion = 0
 
     @classmethod
     def register(cls, func):
@@ -26,11 +41,47 @@ class CacheManager:
     @classmethod
     def clear_all(cls):
         """Limpia todo el caché registrado"""
+        cls._generacion += 1
         for func in cls._cache_functions:
             if hasattr(func, "cache_clear"):
                 func.cache_clear()
                 logger.info(f"Caché limpiado para: {func.__name__}")
 
+    @classmethod
+    def generacion(cls) -> int:
+        """Número de limpiezas hechas; cambia tras cada escritura que limpia el caché"""
+        return cls._generacion
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Retorna aciertos, fallos y tasa de aciertos de cada función con caché"""
+        funciones = {}
+        for func in cls._cache_functions:
+            if not hasattr(func, "cache_info"):
+                continue
+            info = func.cache_info()
+            total = info.hits + info.misses
+            funciones[func.__name__] = {
+                "hits": info.hits,
+                "misses": info.misses,
+                "entradas": info.currsize,
+                "tasa_aciertos": round(info.hits / total, 4) if total else 0.0,
+            }
+        return funciones
+
+    @classmethod
+    def register_index(cls, index):
+        """Registra un índice en memoria que se reconstruye desde la base de datos"""
+        cls._indexes.append(index)
+        return index
+
+    @classmethod
+    def invalidate_indexes(cls):
+        """Descarta los índices en memoria para que se reconstruyan en su siguiente uso"""
+        for index in cls._indexes:
+            index.invalidar()
+            logger.info(f"Índice invalidado: {type(index).__name__}")
+
 
 def cached_query(maxsize=128):
     """
@@ -46,3 +97,159 @@ def cached_query(maxsize=128):
         return cached_func
 
     return decorator
+
+
+def cached_session_query(maxsize=128, ttl=None):
+    """
+    Decorador para cachear queries que reciben la sesión como primer argumento.
+
+    La sesión no forma parte de la clave, así que el resultado se comparte
+    entre peticiones hasta que una escritura llame a CacheManager.clear_all().
+    Como en IdentityCache, un resultado cuyo cálculo empezó antes de la
+    última limpieza no se guarda: podría no incluir esa escritura.
+
+    Args:
+        maxsize: Número máximo de entradas en caché
+        ttl: Segundos de vida de cada entrada (por defecto settings.cache_ttl)
+    """
+    if ttl is None:
+        ttl = get_settings().cache_ttl
+
+    def decorator(func):
+        entradas = {}
+        contadores = {"hits": 0, "misses": 0}
+        lock = threading.Lock()
+        # Cambia con cada limpieza; un cálculo iniciado antes no se guarda
+        generacion = [0]
+
+        @wraps(func)
+        def wrapper(session, *args):
+            ahora = time.monotonic()
+            with lock:
+                entrada = entradas.get(args)
+                if entrada is not None and entrada[0] > ahora:
+                    contadores["hits"] += 1
+                    contar_acierto_cache()
+                    return entrada[1]
+                contadores["misses"] += 1
+                inicio = generacion[0]
+
+            resultado = func(session, *args)
+
+            with lock:
+                if inicio == generacion[0]:
+                    if args not in entradas and len(entradas) >= maxsize:
+                        entradas.pop(next(iter(entradas)))
+                    entradas[args] = (ahora + ttl, resultado)
+            return resultado
+
+        def cache_clear():
+            with lock:
+                generacion[0] += 1
+                entradas.clear()
+
+        def cache_info():
+            with lock:
+                return CacheInfo(contadores["hits"], contadores["misses"], maxsize, len(entradas))
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_info = cache_info
+        CacheManager.register(wrapper)
+        return wrapper
+
+    return decorator
+
+
+class IdentityCache:
+    """
+    Caché por ID para las consultas de detalle.
+
+    Guarda la respuesta ya serializada (bytes JSON del esquema de lectura) de
+    cada ID encontrado y una entrada negativa de vida corta para los IDs que
+    no existen. Es un LRU acotado a `maxsize` entradas.
+
+    No se vacía con CacheManager.clear_all(): los handlers que crean,
+    modifican o eliminan un objeto invalidan solo su ID. Se registra como
+    índice para que invalidate_indexes() la vacíe tras cambios masivos.
+    """
+
+    def __init__(
+        self,
+        schema: type[BaseModel],
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        ttl_negativo: Optional[float] = None,
+    ):
+        settings = get_settings()
+        self.schema = schema
+        self.maxsize = maxsize or settings.identity_cache_size
+        self.ttl = ttl if ttl is not None else settings.cache_ttl
+        self.ttl_negativo = (
+            ttl_negativo if ttl_negativo is not None else settings.identity_cache_negative_ttl
+        )
+        self._entradas: OrderedDict[Hashable, tuple[float, Optional[bytes]]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Cambia con cada invalidación; una lectura iniciada antes no se guarda
+        self._generacion = 0
+        self.hits = 0
+        self.hits_negativos = 0
+        self.misses = 0
+
+    def obtener(self, clave: Hashable, cargar: Callable[[], Any]) -> Optional[bytes]:
+        """
+        Retorna el JSON del objeto con ese ID, o None si no existe.
+        `cargar` se llama solo si la clave no está en caché o expiró.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                if entrada[1] is None:
+                    self.hits_negativos += 1
+                else:
+                    self.hits += 1
+                contar_acierto_cache()
+                return entrada[1]
+            self.misses += 1
+            generacion = self._generacion
+
+        objeto = cargar()
+        datos = None
+        if objeto is not None:
+            datos = self.schema.model_validate(objeto).model_dump_json().encode()
+
+        with self._lock:
+            if generacion == self._generacion:
+                ttl = self.ttl if datos is not None else self.ttl_negativo
+                self._entradas[clave] = (ahora + ttl, datos)
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.maxsize:
+                    self._entradas.popitem(last=False)
+        return datos
+
+    def invalidar_id(self, *claves: Hashable) -> None:
+        """Descarta las entradas de los IDs creados, modificados o eliminados"""
+        with self._lock:
+            self._generacion += 1
+            for clave in claves:
+                self._entradas.pop(clave, None)
+
+    def invalidar(self) -> None:
+        """Descarta todas las entradas"""
+        with self._lock:
+            self._generacion += 1
+            self._entradas.clear()
+
+    def metricas(self) -> dict:
+        """Retorna aciertos (positivos y negativos), fallos y entradas"""
+        with self._lock:
+            total = self.hits + self.hits_negativos + self.misses
+            aciertos = self.hits + self.hits_negativos
+            return {
+                "hits": self.hits,
+                "hits_negativos": self.hits_negativos,
+                "misses": self.misses,
+                "entradas": len(self._entradas),
+                "tasa_aciertos": round(aciertos / total, 4) if total else 0.0,
+            }
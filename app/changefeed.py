@@ -0,0 +1,272 @@
+"""
+Registro de cambios (change feed).
+Los handlers de escritura agregan un evento por cada alta, modificación o
+baja en la misma transacción; los clientes lo leen de forma incremental.
+Al confirmarse la transacción, los eventos se publican a los clientes SSE.
+
+Con shards activos los eventos de favoritos se guardan en la tabla de
+cambios del shard, en la transacción de la escritura, y se trasladan en
+lotes a la base principal (al leer el registro y periódicamente), que les
+asigna el ID que sirve de cursor.
+"""
+
+import asyncio
+import heapq
+import logging
+import threading
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, event, func
+from sqlmodel import Session, SQLModel, select
+
+from app.config import get_settings
+from app.events import broker
+from app.models import Cambio, CambioRead, CancionRead, FavoritoRead, UsuarioRead
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+CREAR = "crear"
+ACTUALIZAR = "actualizar"
+ELIMINAR = "eliminar"
+
+# Esquema con el que se guarda el estado de cada entidad en el evento
+ESQUEMAS = {"usuario": UsuarioRead, "cancion": CancionRead, "favorito": FavoritoRead}
+
+# Clave de session.info con los eventos pendientes de publicar
+_PENDIENTES = "cambios_pendientes"
+
+# Eventos trasladados desde cada shard por transacción de la base principal
+LOTE_TRASLADO = 500
+
+# Un solo traslado a la vez en el proceso; el índice único (origen, origen_id)
+# evita duplicados si otro proceso traslada el mismo shard
+_lock_traslado = threading.Lock()
+
+
+def _crear_evento(operacion: str, objeto: SQLModel) -> Cambio:
+    """Evento de cambio con el estado actual del objeto (sin datos en las bajas)"""
+    entidad = type(objeto).__tablename__
+    datos = None
+    if operacion != ELIMINAR:
+        datos = ESQUEMAS[entidad].model_validate(objeto).model_dump(mode="json")
+    return Cambio(entidad=entidad, entidad_id=objeto.id, operacion=operacion, datos=datos)
+
+
+def _agregar(session: Session, cambio: Cambio) -> Cambio:
+    """Agrega el evento a la sesión principal y lo deja pendiente de publicar"""
+    session.add(cambio)
+
+    # El ID del evento se necesita para publicarlo tras el commit, cuando
+    # la sesión ya no puede consultar la base de datos
+    session.flush()
+    evento = CambioRead.model_validate(cambio).model_dump(mode="json")
+    session.info.setdefault(_PENDIENTES, []).append(evento)
+    return cambio
+
+
+def registrar_cambio(session: Session, operacion: str, objeto: SQLModel) -> Cambio:
+    """
+    Agrega a la sesión el evento de cambio de un objeto.
+    Se confirma junto con la escritura, así que un cambio revertido nunca
+    aparece en el registro.
+
+    En SQLite la transacción que escribe mantiene el bloqueo hasta su commit,
+    por lo que los IDs de los eventos crecen en el orden de confirmación y
+    sirven como cursor.
+    """
+    if objeto.id is None:
+        session.flush()
+    return _agregar(session, _crear_evento(operacion, objeto))
+
+
+def registrar_en_shard(sesion_shard: Session, operacion: str, objeto: SQLModel) -> Cambio:
+    """
+    Agrega el evento de un favorito (con su ID global) a la transacción de
+    su shard. Con shards activos queda en la tabla de cambios del shard
+    hasta que trasladar_cambios lo pasa a la principal; con uno solo es
+    registrar_cambio.
+    """
+    if not shards.activo:
+        return registrar_cambio(sesion_shard, operacion, objeto)
+    cambio = _crear_evento(operacion, objeto)
+    sesion_shard.add(cambio)
+    return cambio
+
+
+def _prefijo(lote: list[Cambio], horizonte: Optional[datetime]) -> list[Cambio]:
+    """Eventos iniciales del lote (en orden de ID) con fecha hasta el horizonte"""
+    if horizonte is None:
+        return lote
+    prefijo = []
+    for cambio in lote:
+        if cambio.fecha > horizonte:
+            break
+        prefijo.append(cambio)
+    return prefijo
+
+
+def _trasladar_lote(session: Session, sesiones: list[Session]) -> tuple[int, bool]:
+    """
+    Traslada el siguiente lote de eventos de todos los shards, mezclados por
+    fecha. Retorna (eventos trasladados, si quedaron eventos por leer).
+    """
+    lotes = [
+        sesion_shard.exec(select(Cambio).order_by(Cambio.id).limit(LOTE_TRASLADO)).all()
+        for sesion_shard in sesiones
+    ]
+    if not any(lotes):
+        return 0, False
+
+    # Un shard con el lote lleno puede tener eventos sin leer anteriores a los
+    # últimos leídos de otro shard: solo se trasladan los eventos hasta la
+    # menor de las últimas fechas de los lotes llenos
+    llenos = [lote[-1].fecha for lote in lotes if len(lote) == LOTE_TRASLADO]
+    horizonte = min(llenos) if llenos else None
+    seleccion = [_prefijo(lote, horizonte) for lote in lotes]
+    if not any(seleccion):
+        seleccion = lotes
+
+    # Un traslado interrumpido tras el commit de la principal deja eventos
+    # ya copiados en el shard: se reconocen por su origen y no se repiten
+    copiados = set(
+        map(
+            tuple,
+            session.exec(
+                select(Cambio.origen, Cambio.origen_id).where(
+                    Cambio.origen_id.in_([cambio.id for lote in seleccion for cambio in lote])
+                )
+            ),
+        )
+    )
+    # heapq.merge conserva el orden de ID dentro de cada shard
+    mezcla = heapq.merge(
+        *[
+            [(cambio.fecha, shard, cambio) for cambio in lote]
+            for shard, lote in enumerate(seleccion)
+        ],
+        key=lambda elemento: (elemento[0], elemento[1]),
+    )
+    for _, shard, cambio in mezcla:
+        if (shard, cambio.id) not in copiados:
+            _agregar(
+                session,
+                Cambio(
+                    entidad=cambio.entidad,
+                    entidad_id=cambio.entidad_id,
+                    operacion=cambio.operacion,
+                    datos=cambio.datos,
+                    fecha=cambio.fecha,
+                    origen=shard,
+                    origen_id=cambio.id,
+                ),
+            )
+    session.commit()
+
+    for sesion_shard, lote in zip(sesiones, seleccion, strict=True):
+        if lote:
+            sesion_shard.exec(delete(Cambio).where(Cambio.id.in_([c.id for c in lote])))
+            sesion_shard.commit()
+    trasladados = sum(len(lote) for lote in seleccion)
+    quedan = any(len(lote) == LOTE_TRASLADO for lote in lotes) or trasladados < sum(
+        len(lote) for lote in lotes
+    )
+    return trasladados, quedan
+
+
+def trasladar_cambios(session: Session) -> int:
+    """
+    Pasa a la base principal los eventos guardados en los shards, mezclando
+    los de todos los shards por fecha (y conservando el orden de cada shard).
+    Cada lote es un commit en la principal seguido del borrado en los shards.
+    Retorna el número de eventos trasladados.
+    """
+    if not shards.activo:
+        return 0
+    trasladados = 0
+    with _lock_traslado, ExitStack() as pila:
+        sesiones = [pila.enter_context(shards.sesion(session, s)) for s in range(shards.n)]
+        quedan = True
+        while quedan:
+            leidos, quedan = _trasladar_lote(session, sesiones)
+            trasladados += leidos
+    return trasladados
+
+
+async def traslados_periodicos(engine) -> None:
+    """
+    Traslada los eventos de los shards cada settings.changefeed_relay_interval_ms
+    para que lleguen a los clientes SSE sin esperar a que alguien lea el registro.
+    """
+    intervalo = get_settings().changefeed_relay_interval_ms / 1000
+
+    def trasladar() -> None:
+        with Session(engine) as session:
+            trasladar_cambios(session)
+
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await asyncio.to_thread(trasladar)
+        except Exception:
+            logger.exception("No se pudieron trasladar los eventos de los shards")
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar_cambios(session: Session) -> None:
+    """Publica a los suscriptores SSE los eventos de la transacción confirmada"""
+    for evento in session.info.pop(_PENDIENTES, []):
+        broker.publicar(evento)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_cambios(session: Session) -> None:
+    """Descarta los eventos de una transacción revertida"""
+    session.info.pop(_PENDIENTES, None)
+
+
+def listar_cambios(
+    session: Session, desde: int, limit: int, entidad: Optional[str] = None
+) -> tuple[list[Cambio], bool]:
+    """
+    Retorna hasta `limit` eventos posteriores al cursor y si hay más.
+    Antes traslada los eventos pendientes en los shards, así el registro
+    leído incluye todas las escrituras confirmadas.
+    """
+    trasladar_cambios(session)
+    statement = select(Cambio).where(Cambio.id > desde)
+    if entidad:
+        statement = statement.where(Cambio.entidad == entidad)
+    cambios = session.exec(statement.order_by(Cambio.id).limit(limit + 1)).all()
+    return cambios[:limit], len(cambios) > limit
+
+
+def compactar_cambios(session: Session, antes_de: Optional[datetime] = None) -> int:
+    """
+    Compacta los eventos anteriores a una fecha conservando solo el último
+    de cada entidad. Un cliente que lea desde un cursor antiguo sigue
+    obteniendo el estado final de cada entidad, incluidas las bajas.
+    Retorna el número de eventos eliminados.
+    """
+    if antes_de is None:
+        horas = get_settings().changefeed_compact_after_hours
+        antes_de = datetime.now() - timedelta(hours=horas)
+
+    horizonte = session.exec(select(func.max(Cambio.id)).where(Cambio.fecha < antes_de)).one()
+    if horizonte is None:
+        return 0
+
+    ultimos = (
+        select(func.max(Cambio.id))
+        .where(Cambio.id <= horizonte)
+        .group_by(Cambio.entidad, Cambio.entidad_id)
+    )
+    resultado = session.exec(
+        delete(Cambio).where(Cambio.id <= horizonte, Cambio.id.not_in(ultimos))
+    )
+    session.commit()
+
+    logger.info(f"Registro de cambios compactado: {resultado.rowcount} eventos eliminados")
+    return resultado.rowcount
@@ -0,0 +1,103 @@
+"""
+Coalescencia de peticiones de lectura idénticas (single-flight).
+Mientras una consulta con cierta clave está en curso, las peticiones
+concurrentes con la misma clave esperan su resultado en lugar de repetirla.
+"""
+
+import logging
+import threading
+from collections.abc import Callable, Hashable
+
+from fastapi import Response
+
+from app.cache import CacheManager
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Llamada:
+    """Consulta en curso y su resultado compartido"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave en una sola ejecución.
+
+    La primera petición (líder) ejecuta la función; las que llegan mientras
+    está en curso esperan y reciben el mismo resultado o la misma excepción.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_curso: dict[Hashable, _Llamada] = {}
+        self.ejecutadas = 0
+        self.coalescidas = 0
+
+    def do(self, clave: Hashable, func: Callable):
+        """Ejecuta func() o espera el resultado de la ejecución en curso con la misma clave"""
+        with self._lock:
+            llamada = self._en_curso.get(clave)
+            lider = llamada is None
+            if lider:
+                llamada = self._en_curso[clave] = _Llamada()
+            else:
+                self.coalescidas += 1
+
+        if not lider:
+            llamada.evento.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = func()
+        except Exception as exc:
+            llamada.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+                self.ejecutadas += 1
+            llamada.evento.set()
+        return llamada.resultado
+
+    def metricas(self) -> dict:
+        """Retorna los contadores de ejecuciones y peticiones coalescidas"""
+        with self._lock:
+            total = self.ejecutadas + self.coalescidas
+            return {
+                "ejecutadas": self.ejecutadas,
+                "coalescidas": self.coalescidas,
+                "en_curso": len(self._en_curso),
+                "tasa_coalescencia": round(self.coalescidas / total, 4) if total else 0.0,
+            }
+
+
+# Instancia compartida por los routers de lectura
+coalescer = SingleFlight()
+
+
+def responder_coalescido(clave: Hashable, producir: Callable[[], Response]) -> Response:
+    """
+    Retorna la respuesta ya serializada de producir(), compartiéndola con
+    las peticiones idénticas concurrentes. Cada petición recibe su propia
+    copia del objeto Response con el mismo cuerpo.
+
+    La clave incluye la generación de CacheManager, así una petición que
+    llega después de una escritura nunca se une a una consulta anterior a ella.
+    """
+    if not get_settings().coalesce_reads:
+        return producir()
+
+    respuesta = coalescer.do((CacheManager.generacion(), clave), producir)
+    return Response(
+        content=respuesta.body,
+        status_code=respuesta.status_code,
+        headers=dict(respuesta.headers),
+    )
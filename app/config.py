@@ -4,6 +4,7 @@ Define constantes, configuraciones de base de datos y parámetros del sistema.
 """
 
 from functools import lru_cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -26,9 +27,71 @@ class Settings(BaseSettings):
     # Configuración de logging
     log_level: str = "INFO"
     log_file: str = "logs/app.log"
+    slow_query_log: bool = True  # Registrar consultas SQL lentas con su plan de ejecución
+    slow_query_ms: float = 100  # Duración a partir de la cual una consulta es lenta
+    slow_query_log_file: str = "logs/slow_queries.log"
+    access_log: bool = True  # Registrar cada petición como una línea JSON
+    access_log_file: str = "logs/access.log"
 
     # Configuración de caché
     cache_ttl: int = 300  # Tiempo de vida del caché en segundos
+    identity_cache_size: int = 10000  # Objetos por ID en caché para las consultas de detalle
+    identity_cache_negative_ttl: float = 5  # Segundos que se recuerda un ID inexistente (404)
+
+    # Rendimiento
+    coalesce_reads: bool = True  # Agrupar lecturas idénticas concurrentes en una consulta
+    favoritos_group_commit: bool = False  # Confirmar escrituras de favoritos en lotes
+    group_commit_max_batch: int = 64  # Operaciones máximas por lote
+    group_commit_interval_ms: float = 5  # Espera máxima para completar un lote
+    group_commit_timeout_s: float = 10  # Espera máxima de un llamador por su commit (luego 503)
+    favoritos_shards: int = 1  # Archivos SQLite entre los que se reparten los favoritos
+    favoritos_shard_url: str = "sqlite:///./favoritos_{shard}.db"  # URL de cada shard
+
+    # Trabajos en segundo plano
+    jobs_thread_workers: int = 2  # Hilos para trabajos de base de datos
+    jobs_process_workers: int = 1  # Procesos para trabajos pesados (exportaciones)
+    jobs_lease_seconds: float = 30  # Sin latido en este tiempo, un trabajo se da por abandonado
+    export_dir: str = "exports"  # Carpeta de los archivos exportados
+
+    # Respaldos en línea (API de backup de SQLite)
+    backup_dir: str = "backups"  # Carpeta de los respaldos
+    backup_pages: int = 256  # Páginas copiadas por paso
+    backup_sleep_ms: float = 5  # Pausa entre pasos para no bloquear a los escritores
+    backup_keep: int = 7  # Respaldos conservados (0 conserva todos)
+    backup_interval_hours: float = 0  # Respaldo programado cada N horas (0 lo desactiva)
+    backup_max_restarts: int = 5  # Reinicios de la copia por pasos antes de copiar en un paso
+    backup_max_seconds: float = 60  # Plazo de la copia por pasos antes de copiar en un paso
+    backup_restore_enabled: bool = False  # Habilita POST /api/admin/respaldos/{nombre}/restaurar
+    backup_restore_token: str = ""  # Valor requerido en X-Restore-Token; vacío no lo exige
+
+    # Canciones duplicadas (mismo título y artista normalizados)
+    duplicate_policy: Literal["reject", "merge", "allow"] = "reject"
+
+    # Registro de cambios
+    changefeed_compact_after_hours: int = 24  # Antigüedad a partir de la cual se compacta
+    changefeed_relay_interval_ms: float = 500  # Traslado de los eventos de los shards
+
+    # Eventos en tiempo real (SSE)
+    sse_queue_size: int = 100  # Eventos pendientes por cliente antes de descartarlo
+    sse_heartbeat_seconds: float = 15  # Intervalo de los mensajes para mantener la conexión
+    sse_max_subscribers: int = 10000  # Conexiones SSE simultáneas permitidas
+
+    # Perfilado bajo demanda (encabezado X-Profile)
+    profiling_enabled: bool = False  # Sin activar no se instala y no tiene costo
+    profiling_token: str = ""  # Valor requerido en X-Profile; vacío acepta cualquiera
+    profiling_max_reports: int = 50  # Reportes conservados en memoria
+
+    # Health checks
+    health_max_db_latency_ms: float = 250  # Latencia de BD a partir de la cual no está listo
+
+    # Control de admisión
+    admission_control: bool = True  # Limitar peticiones simultáneas por grupo de rutas
+    admission_read_concurrency: int = 32  # Lecturas ejecutándose a la vez
+    admission_read_queue: int = 256  # Lecturas en espera antes de rechazar con 503
+    admission_write_concurrency: int = 8  # Escrituras ejecutándose a la vez
+    admission_write_queue: int = 64  # Escrituras en espera antes de rechazar con 503
+    admission_queue_timeout_seconds: float = 10  # Espera máxima en cola
+    admission_retry_after_seconds: int = 1  # Valor del encabezado Retry-After
 
     class Config:
         env_file = ".env"
@@ -4,10 +4,17 @@ Gestiona la conexión a SQLite y la creación de tablas.
 """
 
 import logging
+import time
+import zlib
 
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel, create_engine, select
 
 from app.config import get_settings
+from app.models import Usuario
+from app.query_log import registro_lento
+from utils import VERSION_NORMALIZACION
 
 # Configuración
 settings = get_settings()
@@ -22,15 +29,158 @@ engine = create_engine(
     connect_args={"check_same_thread": False},  # Necesario para SQLite
 )
 
+# Registrar las consultas que superan settings.slow_query_ms
+if settings.slow_query_log:
+    registro_lento.instalar(engine)
 
-def create_db_and_tables():
+
+def huella_esquema() -> int:
     """
-    Crea todas las tablas definidas en los modelos.
-    Se ejecuta al iniciar la aplicación.
+    Calcula una huella de 31 bits del esquema definido en los modelos
+    (tablas, columnas, tipos e índices). Cambia cuando cambian los modelos
+    o el algoritmo de las claves normalizadas.
+    """
+    partes = [f"normalizacion:{VERSION_NORMALIZACION}"]
+    for tabla in sorted(SQLModel.metadata.tables.values(), key=lambda t: t.name):
+        partes.append(tabla.name)
+        for columna in tabla.columns:
+            partes.append(f"{columna.name}:{columna.type}:{columna.nullable}:{columna.primary_key}")
+        for indice in sorted(tabla.indexes, key=lambda i: i.name):
+            columnas = ",".join(columna.name for columna in indice.columns)
+            partes.append(f"{indice.name}:{columnas}:{indice.unique}")
+    return zlib.crc32("|".join(partes).encode()) & 0x7FFFFFFF
+
+
+def _sincronizar_esquema(conexion) -> list[str]:
     """
-    logger.info("Creando tablas en la base de datos...")
-    SQLModel.metadata.create_all(engine)
+    Crea las tablas que faltan y agrega a las existentes las columnas nuevas
+    que son nullable o tienen valor por defecto, y los índices nuevos
+    (create_all no modifica tablas existentes).
+
+    Retorna las columnas nuevas que no se pudieron agregar (NOT NULL sin
+    valor por defecto); esas requieren una migración manual.
+    """
+    SQLModel.metadata.create_all(conexion)
+
+    omitidas = []
+    inspector = inspect(conexion)
+    for tabla in SQLModel.metadata.sorted_tables:
+        existentes = {columna["name"] for columna in inspector.get_columns(tabla.name)}
+        for columna in tabla.columns:
+            if columna.name in existentes:
+                continue
+            por_defecto = columna.server_default
+            if not columna.nullable and por_defecto is None:
+                omitidas.append(f"{tabla.name}.{columna.name}")
+                logger.warning(
+                    f"Columna sin agregar: {tabla.name}.{columna.name} es NOT NULL "
+                    "sin valor por defecto y requiere una migración manual"
+                )
+                continue
+            definicion = columna.type.compile(dialect=conexion.dialect)
+            if por_defecto is not None:
+                definicion += f" NOT NULL DEFAULT '{por_defecto.arg}'"
+            conexion.execute(
+                text(f'ALTER TABLE "{tabla.name}" ADD COLUMN "{columna.name}" {definicion}')
+            )
+            logger.info(f"Columna agregada: {tabla.name}.{columna.name}")
+
+        for indice in tabla.indexes:
+            indice.create(conexion, checkfirst=True)
+
+    _rellenar_claves(conexion)
+    return omitidas
+
+
+def _rellenar_claves(conexion) -> None:
+    """
+    Calcula la clave normalizada de las canciones que no la tienen (ej: la
+    columna se acaba de agregar) o que la tienen con un algoritmo anterior.
+    """
+    # Import diferido: app.dedup depende (vía sharding) de este módulo
+    from app.dedup import clave_cancion
+    from app.models import Cancion
+
+    tabla = Cancion.__table__
+    filas = conexion.execute(
+        select(tabla.c.id, tabla.c.titulo, tabla.c.artista, tabla.c.clave_normalizada)
+    ).all()
+    cambios = [
+        {"id_": id_, "clave": clave}
+        for id_, titulo, artista, actual in filas
+        if (clave := clave_cancion(titulo, artista)) != actual
+    ]
+    if cambios:
+        conexion.execute(
+            tabla.update()
+            .where(tabla.c.id == bindparam("id_"))
+            .values(clave_normalizada=bindparam("clave")),
+            cambios,
+        )
+        logger.info(f"Clave normalizada calculada para {len(cambios)} canciones")
+
+
+def inicializar_esquema(engine: Engine) -> bool:
+    """
+    Prepara el esquema de la base de datos.
+
+    En SQLite la huella del esquema se guarda en PRAGMA user_version; si
+    coincide con la de los modelos no se ejecuta ningún DDL. Si quedó
+    alguna columna sin agregar la huella no se guarda, así el siguiente
+    arranque lo vuelve a intentar y a advertir. Retorna True si fue
+    necesario crear o actualizar el esquema.
+    """
+    huella = huella_esquema()
+    es_sqlite = engine.dialect.name == "sqlite"
+
+    with engine.begin() as conexion:
+        if es_sqlite and conexion.exec_driver_sql("PRAGMA user_version").scalar() == huella:
+            logger.info("Esquema al día, se omite la creación de tablas")
+            return False
+
+        logger.info("Creando tablas en la base de datos...")
+        omitidas = _sincronizar_esquema(conexion)
+        if es_sqlite and not omitidas:
+            conexion.exec_driver_sql(f"PRAGMA user_version = {huella}")
     logger.info("Tablas creadas exitosamente")
+    return True
+
+
+def create_db_and_tables() -> bool:
+    """
+    Crea todas las tablas definidas en los modelos si el esquema cambió.
+    Se ejecuta al iniciar la aplicación.
+    """
+    return inicializar_esquema(engine)
+
+
+def medir_latencia(session: Session) -> float:
+    """
+    Ejecuta una consulta trivial sobre una tabla real y retorna su duración en ms.
+    Falla si la base de datos no existe, no tiene el esquema o está bloqueada.
+    """
+    inicio = time.perf_counter()
+    session.exec(select(Usuario.id).limit(1)).first()
+    return round((time.perf_counter() - inicio) * 1000, 3)
+
+
+def estadisticas_pool() -> dict:
+    """
+    Retorna el estado del pool de conexiones del engine.
+    No todos los pools exponen estos contadores (ej: StaticPool), en ese caso son None.
+    """
+    pool = engine.pool
+
+    def contador(nombre: str):
+        metodo = getattr(pool, nombre, None)
+        return metodo() if callable(metodo) else None
+
+    return {
+        "tipo": type(pool).__name__,
+        "tamano": contador("size"),
+        "en_uso": contador("checkedout"),
+        "desbordadas": contador("overflow"),
+    }
 
 
 def get_session():
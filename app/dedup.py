@@ -0,0 +1,137 @@
+"""
+Detección de canciones duplicadas.
+Cada canción guarda una clave normalizada (artista y título normalizados)
+en una columna indexada, de modo que comprobar si ya existe es una sola
+búsqueda por índice al crear o importar.
+"""
+
+import logging
+from typing import Optional
+
+from sqlalchemy import event, func
+from sqlmodel import Session, select
+
+from app.changefeed import ACTUALIZAR, ELIMINAR, registrar_cambio, registrar_en_shard
+from app.models import Cancion, CancionCreate, Favorito
+from app.sharding import shards
+from app.vista_favoritos import vista_favoritos
+from utils import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+# Campos opcionales que una fusión completa si la canción existente no los tiene
+CAMPOS_FUSIONABLES = ("album", "año", "genero")
+
+
+def clave_cancion(titulo: str, artista: str) -> str:
+    """Clave que identifica una canción sin importar mayúsculas, tildes ni signos"""
+    return f"{normalizar_texto(artista)}:{normalizar_texto(titulo)}"
+
+
+@event.listens_for(Cancion, "before_insert")
+@event.listens_for(Cancion, "before_update")
+def _asignar_clave(mapper, connection, cancion: Cancion) -> None:
+    """Mantiene la clave normalizada al día en cualquier inserción o actualización"""
+    cancion.clave_normalizada = clave_cancion(cancion.titulo, cancion.artista)
+
+
+def buscar_duplicado(session: Session, clave: str) -> Optional[Cancion]:
+    """Retorna la canción más antigua con la misma clave, o None"""
+    statement = select(Cancion).where(Cancion.clave_normalizada == clave).order_by(Cancion.id)
+    return session.exec(statement.limit(1)).first()
+
+
+def fusionar(existente: Cancion, nueva: CancionCreate) -> bool:
+    """Completa los campos vacíos de la canción existente; retorna True si cambió"""
+    cambios = False
+    for campo in CAMPOS_FUSIONABLES:
+        valor = getattr(nueva, campo)
+        if getattr(existente, campo) is None and valor is not None:
+            setattr(existente, campo, valor)
+            cambios = True
+    return cambios
+
+
+def _reasignar_favoritos(
+    sesion_shard: Session,
+    shard: int,
+    conservada_id: int,
+    ids_duplicadas: list[int],
+    resultado: dict,
+) -> None:
+    """
+    Pasa a la canción conservada los favoritos de las duplicadas en un shard.
+    Los eventos se registran en la transacción del shard; con shards activos
+    sus cambios se confirman aparte, antes que los de la principal.
+    """
+    usuarios = set(
+        sesion_shard.exec(
+            select(Favorito.usuario_id).where(Favorito.cancion_id == conservada_id)
+        ).all()
+    )
+
+    favoritos = sesion_shard.exec(
+        select(Favorito).where(Favorito.cancion_id.in_(ids_duplicadas)).order_by(Favorito.id)
+    ).all()
+    for favorito in favoritos:
+        if favorito.usuario_id in usuarios:
+            registrar_en_shard(sesion_shard, ELIMINAR, shards.globalizar(shard, favorito))
+            sesion_shard.delete(favorito)
+            resultado["descartados"] += 1
+        else:
+            favorito.cancion_id = conservada_id
+            usuarios.add(favorito.usuario_id)
+            registrar_en_shard(sesion_shard, ACTUALIZAR, shards.globalizar(shard, favorito))
+            resultado["reasignados"] += 1
+    sesion_shard.flush()
+    if shards.activo:
+        sesion_shard.commit()
+
+
+def deduplicar_canciones(session: Session) -> dict:
+    """
+    Fusiona las canciones existentes con la misma clave normalizada.
+
+    Conserva la canción más antigua de cada grupo, completa sus campos vacíos
+    con los de las demás, reasigna a ella los favoritos de los duplicados
+    (eliminando los que el usuario ya tenía) y borra los duplicados.
+    Antes calcula la clave de las filas creadas sin ella.
+    """
+    sin_clave = session.exec(select(Cancion).where(Cancion.clave_normalizada.is_(None))).all()
+    for cancion in sin_clave:
+        cancion.clave_normalizada = clave_cancion(cancion.titulo, cancion.artista)
+    session.flush()
+
+    claves = session.exec(
+        select(Cancion.clave_normalizada)
+        .group_by(Cancion.clave_normalizada)
+        .having(func.count(Cancion.id) > 1)
+    ).all()
+
+    resultado = {"grupos": len(claves), "eliminadas": 0, "reasignados": 0, "descartados": 0}
+    for clave in claves:
+        conservada, *duplicadas = session.exec(
+            select(Cancion).where(Cancion.clave_normalizada == clave).order_by(Cancion.id)
+        ).all()
+        ids_duplicadas = [cancion.id for cancion in duplicadas]
+        for shard in range(shards.n):
+            with shards.sesion(session, shard) as sesion_shard:
+                _reasignar_favoritos(sesion_shard, shard, conservada.id, ids_duplicadas, resultado)
+
+        fusiones = [fusionar(conservada, CancionCreate.model_validate(d)) for d in duplicadas]
+        if any(fusiones):
+            registrar_cambio(session, ACTUALIZAR, conservada)
+        for cancion in duplicadas:
+            registrar_cambio(session, ELIMINAR, cancion)
+            session.delete(cancion)
+        resultado["eliminadas"] += len(duplicadas)
+
+    session.commit()
+    if claves:
+        # Cambiaron favoritos de muchos usuarios: se reconstruyen al leerlos
+        vista_favoritos.invalidar_todo(session)
+    logger.info(
+        f"Deduplicación: {resultado['eliminadas']} canciones eliminadas en "
+        f"{resultado['grupos']} grupos, {resultado['reasignados']} favoritos reasignados"
+    )
+    return resultado
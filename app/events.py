@@ -0,0 +1,146 @@
+"""
+Difusión de eventos en tiempo real (Server-Sent Events).
+Reparte los eventos del registro de cambios a los clientes conectados
+sin consultar la base de datos.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections.abc import AsyncIterator
+from typing import Optional
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Comentario SSE que mantiene viva la conexión; se envía siempre el mismo objeto
+HEARTBEAT = b": ping\n\n"
+DESCONECTADO = b"event: desconectado\ndata: {}\n\n"
+
+
+def formatear_evento(cambio: dict) -> bytes:
+    """Codifica un evento de cambio en formato SSE (una sola vez para todos los clientes)"""
+    datos = json.dumps(cambio, ensure_ascii=False, separators=(",", ":"))
+    tipo = f"{cambio['entidad']}.{cambio['operacion']}"
+    return f"id: {cambio['id']}\nevent: {tipo}\ndata: {datos}\n\n".encode()
+
+
+class Suscriptor:
+    """Cliente conectado con su cola acotada de mensajes pendientes"""
+
+    __slots__ = ("cola", "loop", "descartado")
+
+    def __init__(self, tamano_cola: int):
+        self.cola: asyncio.Queue[bytes] = asyncio.Queue(maxsize=tamano_cola)
+        self.loop = asyncio.get_running_loop()
+        self.descartado = False
+
+
+class EventBroker:
+    """
+    Reparte eventos a los suscriptores conectados.
+
+    Cada suscriptor tiene una cola acotada; si se llena porque el cliente
+    no lee a tiempo, el suscriptor se descarta en lugar de acumular memoria.
+    Los eventos se publican desde los hilos de los handlers y se entregan
+    en el event loop de cada suscriptor. Los suscriptores se agrupan por
+    event loop, así cada evento programa una sola llamada por loop (no una
+    por cliente), que lo reparte a todos sus suscriptores.
+    """
+
+    def __init__(self, tamano_cola: int = 100, max_suscriptores: int = 10000):
+        self.tamano_cola = tamano_cola
+        self.max_suscriptores = max_suscriptores
+        self._lock = threading.Lock()
+        self._por_loop: dict[asyncio.AbstractEventLoop, set[Suscriptor]] = {}
+        self._total = 0
+        self.publicados = 0
+        self.descartados = 0
+
+    def suscribir(self) -> Optional[Suscriptor]:
+        """Registra un suscriptor; retorna None si se alcanzó el máximo. Llamar desde el event loop."""
+        with self._lock:
+            if self._total >= self.max_suscriptores:
+                return None
+            suscriptor = Suscriptor(self.tamano_cola)
+            self._por_loop.setdefault(suscriptor.loop, set()).add(suscriptor)
+            self._total += 1
+            return suscriptor
+
+    def cancelar(self, suscriptor: Suscriptor) -> None:
+        """Elimina un suscriptor"""
+        with self._lock:
+            suscriptores = self._por_loop.get(suscriptor.loop)
+            if suscriptores is None or suscriptor not in suscriptores:
+                return
+            suscriptores.remove(suscriptor)
+            self._total -= 1
+            if not suscriptores:
+                del self._por_loop[suscriptor.loop]
+
+    def publicar(self, cambio: dict) -> None:
+        """Envía un evento a todos los suscriptores; se puede llamar desde cualquier hilo"""
+        mensaje = formatear_evento(cambio)
+        with self._lock:
+            grupos = [(loop, list(suscriptores)) for loop, suscriptores in self._por_loop.items()]
+            self.publicados += 1
+        for loop, suscriptores in grupos:
+            try:
+                loop.call_soon_threadsafe(self._repartir, suscriptores, mensaje)
+            except RuntimeError:
+                # El event loop de estos suscriptores ya se cerró
+                for suscriptor in suscriptores:
+                    self.cancelar(suscriptor)
+
+    def _repartir(self, suscriptores: list[Suscriptor], mensaje: bytes) -> None:
+        """Entrega el mensaje a los suscriptores de un event loop (se ejecuta en ese loop)"""
+        for suscriptor in suscriptores:
+            if suscriptor.descartado:
+                continue
+            try:
+                suscriptor.cola.put_nowait(mensaje)
+            except asyncio.QueueFull:
+                suscriptor.descartado = True
+                self.cancelar(suscriptor)
+                self.descartados += 1
+                logger.warning("Suscriptor SSE descartado por no leer a tiempo")
+
+    def metricas(self) -> dict:
+        """Retorna el número de suscriptores y eventos publicados"""
+        with self._lock:
+            return {
+                "suscriptores": self._total,
+                "publicados": self.publicados,
+                "descartados": self.descartados,
+            }
+
+
+async def flujo_eventos(
+    broker: EventBroker, suscriptor: Suscriptor, heartbeat: float
+) -> AsyncIterator[bytes]:
+    """
+    Genera los mensajes SSE de un suscriptor.
+    Si no hay eventos durante `heartbeat` segundos envía un comentario
+    para mantener la conexión abierta.
+    """
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                mensaje = await asyncio.wait_for(suscriptor.cola.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                mensaje = HEARTBEAT
+            if suscriptor.descartado:
+                yield DESCONECTADO
+                return
+            yield mensaje
+    finally:
+        broker.cancelar(suscriptor)
+
+
+settings = get_settings()
+
+# Instancia compartida por el registro de cambios y el router de eventos
+broker = EventBroker(settings.sse_queue_size, settings.sse_max_subscribers)
@@ -0,0 +1,89 @@
+"""
+Selección parcial de campos (?fields=).
+Reduce las columnas del SELECT y los campos serializados en la respuesta.
+"""
+
+from collections.abc import Iterable
+from typing import Optional
+
+from fastapi import HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlmodel import SQLModel
+
+
+def parse_fields(fields: Optional[str], schema: type[SQLModel]) -> Optional[list[str]]:
+    """
+    Convierte un parámetro "id,titulo" en la lista de campos pedidos.
+    Retorna None si no se pidió una selección parcial.
+    """
+    if fields is None:
+        return None
+
+    campos = list(dict.fromkeys(campo.strip() for campo in fields.split(",") if campo.strip()))
+    invalidos = [campo for campo in campos if campo not in schema.model_fields]
+    if not campos or invalidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos no válidos: {', '.join(invalidos) or fields!r}. "
+            f"Campos disponibles: {', '.join(schema.model_fields)}",
+        )
+    return campos
+
+
+def fields_param(schema: type[SQLModel]):
+    """
+    Crea una dependencia que lee y valida el parámetro ?fields= contra
+    los campos del esquema de lectura.
+    """
+
+    def dependency(
+        fields: Optional[str] = Query(
+            None, description="Campos a incluir separados por coma, ej: id,titulo"
+        ),
+    ) -> Optional[list[str]]:
+        return parse_fields(fields, schema)
+
+    return dependency
+
+
+def columnas(model: type[SQLModel], campos: list[str]) -> list:
+    """Retorna las columnas del modelo de tabla correspondientes a los campos"""
+    return [getattr(model, campo) for campo in campos]
+
+
+def respuesta_parcial(
+    campos: list[str], filas: Iterable, headers: Optional[dict] = None
+) -> JSONResponse:
+    """
+    Serializa filas (tuplas de columnas u objetos del modelo) con solo los
+    campos pedidos, sin pasar por el response_model completo.
+    """
+    contenido = []
+    for fila in filas:
+        if isinstance(fila, SQLModel):
+            contenido.append({campo: getattr(fila, campo) for campo in campos})
+        else:
+            contenido.append(dict(zip(campos, fila, strict=True)))
+    return JSONResponse(content=jsonable_encoder(contenido), headers=headers)
+
+
+def respuesta_lista(
+    schema: type[SQLModel],
+    campos: Optional[list[str]],
+    filas: Iterable,
+    headers: Optional[dict] = None,
+) -> JSONResponse:
+    """
+    Serializa una lista con los campos pedidos o, si no se pidieron,
+    con todos los campos del esquema de lectura.
+    """
+    if campos:
+        return respuesta_parcial(campos, filas, headers)
+    contenido = [schema.model_validate(fila).model_dump(mode="json") for fila in filas]
+    return JSONResponse(content=contenido, headers=headers)
+
+
+def objeto_parcial(campos: list[str], fila) -> JSONResponse:
+    """Serializa una sola fila con solo los campos pedidos"""
+    return JSONResponse(content=jsonable_encoder(dict(zip(campos, fila, strict=True))))
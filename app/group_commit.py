@@ -0,0 +1,219 @@
+"""
+Commit agrupado (group commit) para escrituras de alta frecuencia.
+Las operaciones se encolan y un hilo escritor las aplica en una sola
+transacción cada pocos milisegundos o cada N operaciones.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from typing import Any, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+logger = logging.getLogger(__name__)
+
+# Marca para detener el hilo escritor
+_FIN = object()
+
+
+class EscrituraNoConfirmadaError(TimeoutError):
+    """El lote de la operación no se confirmó dentro del tiempo de espera"""
+
+    def __init__(self, mensaje: str, aplicada_posiblemente: bool):
+        super().__init__(mensaje)
+        self.aplicada_posiblemente = aplicada_posiblemente
+
+
+class _Operacion:
+    """Operación encolada y su resultado"""
+
+    def __init__(self, funcion: Callable[[Session], Any]):
+        self.funcion = funcion
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._iniciada = False
+        self._cancelada = False
+
+    def iniciar(self) -> bool:
+        """La marca como iniciada; retorna False si el llamador ya la canceló"""
+        with self._lock:
+            self._iniciada = not self._cancelada
+            return self._iniciada
+
+    def cancelar(self) -> bool:
+        """Cancela la operación si el escritor aún no la tomó; retorna si lo logró"""
+        with self._lock:
+            self._cancelada = not self._iniciada
+            return self._cancelada
+
+
+class GroupCommitWriter:
+    """
+    Escritor en segundo plano que agrupa operaciones en una transacción.
+
+    Cada operación es una función que recibe la sesión del lote, valida y
+    agrega o elimina objetos sin hacer commit. Las validaciones deben ocurrir
+    antes de modificar la sesión: si la función lanza una excepción, esa
+    excepción se entrega solo a su llamador y el resto del lote continúa.
+    El llamador espera hasta que el commit de su lote es durable, como
+    máximo `timeout` segundos; si el escritor se atasca (base de datos
+    bloqueada, pool agotado) recibe EscrituraNoConfirmadaError en vez de
+    esperar indefinidamente.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        max_lote: int = 64,
+        intervalo_ms: float = 5,
+        timeout: Optional[float] = 10,
+    ):
+        self.engine = engine
+        self.max_lote = max_lote
+        self.intervalo = intervalo_ms / 1000
+        self.timeout = timeout
+        self._cola: queue.Queue = queue.Queue()
+        self._hilo: Optional[threading.Thread] = None
+        self.lotes = 0
+        self.operaciones = 0
+        self.agotadas = 0
+
+    @property
+    def activo(self) -> bool:
+        """Indica si el hilo escritor está en ejecución"""
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self) -> None:
+        """Arranca el hilo escritor"""
+        if self.activo:
+            return
+        self._hilo = threading.Thread(target=self._bucle, name="group-commit", daemon=True)
+        self._hilo.start()
+        logger.info(
+            f"Commit agrupado iniciado (max_lote={self.max_lote}, "
+            f"intervalo={self.intervalo * 1000:g} ms)"
+        )
+
+    def detener(self) -> None:
+        """Aplica las operaciones pendientes y detiene el hilo escritor"""
+        if not self.activo:
+            return
+        self._cola.put(_FIN)
+        self._hilo.join()
+        self._hilo = None
+        logger.info(
+            f"Commit agrupado detenido ({self.operaciones} operaciones en {self.lotes} lotes)"
+        )
+
+    def ejecutar(self, funcion: Callable[[Session], Any]) -> Any:
+        """
+        Encola una operación y espera a que su lote se confirme.
+        Retorna lo que retorne la función o relanza su excepción.
+
+        Si el lote no se confirma en `timeout` segundos lanza
+        EscrituraNoConfirmadaError. Si el escritor aún no había tomado la
+        operación, se cancela y no se aplicará; si ya la tomó, su resultado
+        es incierto (`aplicada_posiblemente`).
+        """
+        operacion = _Operacion(funcion)
+        self._cola.put(operacion)
+        if not operacion.evento.wait(self.timeout):
+            self.agotadas += 1
+            cancelada = operacion.cancelar()
+            logger.error(
+                f"Escritura no confirmada tras {self.timeout} s "
+                f"({'cancelada' if cancelada else 'en curso'})"
+            )
+            raise EscrituraNoConfirmadaError(
+                f"La escritura no se confirmó en {self.timeout} s",
+                aplicada_posiblemente=not cancelada,
+            )
+        if operacion.error is not None:
+            raise operacion.error
+        return operacion.resultado
+
+    def metricas(self) -> dict:
+        """Retorna el número de lotes y operaciones aplicadas"""
+        return {
+            "activo": self.activo,
+            "lotes": self.lotes,
+            "operaciones": self.operaciones,
+            "operaciones_por_lote": round(self.operaciones / self.lotes, 2) if self.lotes else 0.0,
+            "pendientes": self._cola.qsize(),
+            "agotadas": self.agotadas,
+        }
+
+    def _bucle(self) -> None:
+        while True:
+            primera = self._cola.get()
+            if primera is _FIN:
+                return
+
+            lote = [primera]
+            limite = time.monotonic() + self.intervalo
+            detener = False
+            while len(lote) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    operacion = self._cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if operacion is _FIN:
+                    detener = True
+                    break
+                lote.append(operacion)
+
+            # Las operaciones canceladas por timeout no se aplican
+            lote = [operacion for operacion in lote if operacion.iniciar()]
+            if lote:
+                self._aplicar(lote)
+            if detener:
+                return
+
+    def _aplicar(self, lote: list[_Operacion]) -> None:
+        """
+        Ejecuta el lote en una transacción. Si el commit falla por la base de
+        datos (bloqueada, sin conexión, E/S) el error se entrega a todas las
+        operaciones del lote; si falla por otra causa se reintenta una a una
+        para aislar la operación culpable.
+        """
+        try:
+            with Session(self.engine, expire_on_commit=False) as session:
+                for operacion in lote:
+                    self._ejecutar_en(session, operacion)
+                session.commit()
+        except OperationalError as exc:
+            logger.exception(f"Falló el commit de un lote de {len(lote)} operaciones")
+            for operacion in lote:
+                operacion.resultado, operacion.error = None, exc
+        except Exception:
+            logger.exception(f"Falló el commit de un lote de {len(lote)} operaciones")
+            for operacion in lote:
+                operacion.resultado = operacion.error = None
+                try:
+                    with Session(self.engine, expire_on_commit=False) as session:
+                        self._ejecutar_en(session, operacion)
+                        session.commit()
+                except Exception as exc:
+                    operacion.error = exc
+        finally:
+            self.lotes += 1
+            self.operaciones += len(lote)
+            for operacion in lote:
+                operacion.evento.set()
+
+    @staticmethod
+    def _ejecutar_en(session: Session, operacion: _Operacion) -> None:
+        try:
+            operacion.resultado = operacion.funcion(session)
+        except Exception as exc:
+            operacion.error = exc
@@ -0,0 +1,348 @@
+"""
+Trabajos de mantenimiento en segundo plano.
+Las tareas pesadas (deduplicación, compactación, VACUUM, exportaciones)
+se encolan y se ejecutan en un pool de hilos o de procesos, fuera de los
+workers que atienden peticiones. El estado de cada trabajo se guarda en
+la tabla `trabajo` para consultarlo mientras avanza.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import or_, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, create_engine, select
+
+from app.backup import crear_respaldo
+from app.cache import CacheManager
+from app.changefeed import compactar_cambios
+from app.config import get_settings
+from app.database import engine
+from app.dedup import deduplicar_canciones
+from app.models import Cancion, Trabajo
+from app.routers.estadisticas import calcular_estadisticas
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE = "pendiente"
+EJECUTANDO = "ejecutando"
+COMPLETADO = "completado"
+FALLIDO = "fallido"
+
+
+@dataclass
+class TipoTrabajo:
+    """
+    Definición de un tipo de trabajo.
+
+    Los trabajos en hilo reciben `(session, **parametros)`; los de proceso
+    reciben `(database_url, trabajo_id, **parametros)` y deben ser funciones
+    de módulo (se serializan con pickle) que abran su propia conexión.
+    """
+
+    funcion: Callable[..., Optional[dict]]
+    proceso: bool = False
+    parametros: set[str] = field(default_factory=set)
+
+
+# Tipos de trabajo disponibles, registrados con registrar_tipo()
+TIPOS: dict[str, TipoTrabajo] = {}
+
+
+def registrar_tipo(nombre: str, proceso: bool = False, parametros: Optional[set[str]] = None):
+    """Decorador que registra una función como tipo de trabajo"""
+
+    def decorator(funcion):
+        TIPOS[nombre] = TipoTrabajo(funcion, proceso, parametros or set())
+        return funcion
+
+    return decorator
+
+
+class JobRunner:
+    """
+    Ejecuta trabajos en segundo plano y persiste su estado.
+
+    Cada trabajo se guarda como `pendiente` al encolarse, pasa a `ejecutando`
+    al empezar y termina en `completado` (con su resultado) o `fallido`
+    (con el error). El pool de procesos se crea en el primer trabajo que lo
+    necesita y usa `spawn` para no heredar los hilos del servidor.
+
+    Cada runner es dueño de los trabajos que encola (host, pid y un sufijo
+    aleatorio) y renueva su `latido` cada tercio de `lease`. Al iniciar solo
+    se dan por fallidos los trabajos cuyo latido venció, no los de otros
+    procesos vivos que comparten la base de datos.
+    """
+
+    def __init__(self, engine: Engine, hilos: int = 2, procesos: int = 1, lease: float = 30):
+        self.engine = engine
+        self.hilos = hilos
+        self.procesos = procesos
+        self.lease = lease
+        self.propietario = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._pool_hilos: Optional[ThreadPoolExecutor] = None
+        self._pool_procesos: Optional[ProcessPoolExecutor] = None
+        self._detenido = threading.Event()
+        self._latidos: Optional[threading.Thread] = None
+
+    @property
+    def activo(self) -> bool:
+        """Indica si el runner acepta trabajos"""
+        return self._pool_hilos is not None
+
+    def iniciar(self) -> None:
+        """Crea el pool de hilos, arranca los latidos y recupera los trabajos abandonados"""
+        if self.activo:
+            return
+        vencido = datetime.now() - timedelta(seconds=self.lease)
+        with Session(self.engine) as session:
+            abandonados = session.exec(
+                update(Trabajo)
+                .where(
+                    Trabajo.estado.in_([PENDIENTE, EJECUTANDO]),
+                    or_(Trabajo.latido.is_(None), Trabajo.latido < vencido),
+                )
+                .values(
+                    estado=FALLIDO,
+                    error="Interrumpido: su proceso dejó de renovar el lease",
+                    fecha_fin=datetime.now(),
+                )
+            ).rowcount
+            session.commit()
+        if abandonados:
+            logger.warning(f"{abandonados} trabajos abandonados marcados como fallidos")
+
+        self._pool_hilos = ThreadPoolExecutor(self.hilos, thread_name_prefix="trabajos")
+        self._detenido.clear()
+        self._latidos = threading.Thread(target=self._latir, name="trabajos-latidos", daemon=True)
+        self._latidos.start()
+        logger.info(f"Trabajos en segundo plano iniciados (hilos={self.hilos})")
+
+    def _latir(self) -> None:
+        """Renueva el lease de los trabajos sin terminar de este runner"""
+        while not self._detenido.wait(self.lease / 3):
+            try:
+                with Session(self.engine) as session:
+                    session.exec(
+                        update(Trabajo)
+                        .where(
+                            Trabajo.propietario == self.propietario,
+                            Trabajo.estado.in_([PENDIENTE, EJECUTANDO]),
+                        )
+                        .values(latido=datetime.now())
+                    )
+                    session.commit()
+            except Exception:
+                logger.exception("No se pudo renovar el lease de los trabajos")
+
+    def detener(self) -> None:
+        """Cierra los pools sin esperar a los trabajos en curso y deja de renovar su lease"""
+        self._detenido.set()
+        if self._latidos is not None:
+            self._latidos.join()
+            self._latidos = None
+        if self._pool_hilos is not None:
+            self._pool_hilos.shutdown(wait=False, cancel_futures=True)
+            self._pool_hilos = None
+        if self._pool_procesos is not None:
+            self._pool_procesos.shutdown(wait=False, cancel_futures=True)
+            self._pool_procesos = None
+        logger.info("Trabajos en segundo plano detenidos")
+
+    def enviar(self, session: Session, tipo: str, parametros: dict) -> Trabajo:
+        """Valida, persiste y encola un trabajo; retorna el registro creado"""
+        definicion = TIPOS.get(tipo)
+        if definicion is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Tipo de trabajo no válido: {tipo}. Disponibles: {', '.join(sorted(TIPOS))}",
+            )
+        desconocidos = set(parametros) - definicion.parametros
+        if desconocidos:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Parámetros no válidos para {tipo}: {', '.join(sorted(desconocidos))}",
+            )
+
+        trabajo = Trabajo(
+            tipo=tipo, parametros=parametros, propietario=self.propietario, latido=datetime.now()
+        )
+        session.add(trabajo)
+        session.commit()
+        session.refresh(trabajo)
+
+        if definicion.proceso:
+            url = self.engine.url.render_as_string(hide_password=False)
+            futuro = self._procesos().submit(
+                _ejecutar_en_proceso, definicion.funcion, url, trabajo.id, **parametros
+            )
+            futuro.add_done_callback(
+                lambda f, trabajo_id=trabajo.id: self._finalizar_proceso(trabajo_id, f)
+            )
+        else:
+            self._pool_hilos.submit(self._ejecutar_en_hilo, trabajo.id, definicion, parametros)
+
+        logger.info(f"Trabajo {trabajo.id} encolado ({tipo})")
+        return trabajo
+
+    def encolar(self, tipo: str, parametros: Optional[dict] = None) -> int:
+        """Encola un trabajo con una sesión propia (para tareas programadas); retorna su ID"""
+        with Session(self.engine) as session:
+            return self.enviar(session, tipo, parametros or {}).id
+
+    def _procesos(self) -> ProcessPoolExecutor:
+        if self._pool_procesos is None:
+            self._pool_procesos = ProcessPoolExecutor(
+                self.procesos, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool_procesos
+
+    def _ejecutar_en_hilo(self, trabajo_id: int, definicion: TipoTrabajo, parametros: dict):
+        self._actualizar(trabajo_id, estado=EJECUTANDO, fecha_inicio=datetime.now())
+        try:
+            with Session(self.engine) as session:
+                resultado = definicion.funcion(session, **parametros)
+        except Exception as exc:
+            logger.exception(f"Falló el trabajo {trabajo_id}")
+            self._finalizar(trabajo_id, error=repr(exc))
+        else:
+            self._finalizar(trabajo_id, resultado=resultado)
+
+    def _finalizar_proceso(self, trabajo_id: int, futuro: Future) -> None:
+        if futuro.cancelled():
+            self._finalizar(trabajo_id, error="Cancelado")
+        elif futuro.exception() is not None:
+            logger.error(f"Falló el trabajo {trabajo_id}: {futuro.exception()!r}")
+            self._finalizar(trabajo_id, error=repr(futuro.exception()))
+        else:
+            self._finalizar(trabajo_id, resultado=futuro.result())
+
+    def _finalizar(
+        self, trabajo_id: int, resultado: Optional[dict] = None, error: Optional[str] = None
+    ) -> None:
+        estado = FALLIDO if error is not None else COMPLETADO
+        self._actualizar(
+            trabajo_id, estado=estado, resultado=resultado, error=error, fecha_fin=datetime.now()
+        )
+        logger.info(f"Trabajo {trabajo_id} finalizado: {estado}")
+
+    def _actualizar(self, trabajo_id: int, **campos: Any) -> None:
+        with Session(self.engine) as session:
+            trabajo = session.get(Trabajo, trabajo_id)
+            for campo, valor in campos.items():
+                setattr(trabajo, campo, valor)
+            session.commit()
+
+
+def _ejecutar_en_proceso(
+    funcion: Callable[..., Optional[dict]], database_url: str, trabajo_id: int, **parametros
+):
+    """
+    Marca el trabajo como `ejecutando` cuando un proceso del pool lo toma
+    (no al encolarlo, porque puede esperar detrás de otros) y lo ejecuta.
+    """
+    engine_proceso = create_engine(database_url)
+    try:
+        with Session(engine_proceso) as session:
+            trabajo = session.get(Trabajo, trabajo_id)
+            trabajo.estado = EJECUTANDO
+            trabajo.fecha_inicio = datetime.now()
+            session.commit()
+    finally:
+        engine_proceso.dispose()
+    return funcion(database_url, trabajo_id, **parametros)
+
+
+# =============================================================================
+# TIPOS DE TRABAJO
+# =============================================================================
+
+
+@registrar_tipo("estadisticas")
+def recalcular_estadisticas(session: Session) -> dict:
+    """Recalcula las estadísticas del catálogo y deja el resultado en caché"""
+    calcular_estadisticas.cache_clear()
+    return calcular_estadisticas(session).totales.model_dump()
+
+
+@registrar_tipo("deduplicar")
+def deduplicar(session: Session) -> dict:
+    """Fusiona las canciones repetidas y reconstruye los índices en memoria"""
+    resultado = deduplicar_canciones(session)
+    CacheManager.clear_all()
+    CacheManager.invalidate_indexes()
+    return resultado
+
+
+@registrar_tipo("compactar_cambios")
+def compactar(session: Session) -> dict:
+    """Compacta el registro de cambios"""
+    return {"eliminados": compactar_cambios(session)}
+
+
+@registrar_tipo("vacuum")
+def vacuum(session: Session) -> dict:
+    """Reescribe el archivo de la base de datos para recuperar espacio"""
+    with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conexion:
+        conexion.exec_driver_sql("VACUUM")
+    return {"ok": True}
+
+
+@registrar_tipo("backup")
+def respaldar(session: Session) -> dict:
+    """Crea un respaldo en línea de la base de datos en `backup_dir`"""
+    return crear_respaldo(session.get_bind())
+
+
+@registrar_tipo("exportar", proceso=True)
+def exportar_catalogo(database_url: str, trabajo_id: int) -> dict:
+    """Exporta todas las canciones a un archivo JSON en `export_dir`"""
+    destino = Path(get_settings().export_dir) / f"catalogo-{trabajo_id}.json"
+    destino.parent.mkdir(parents=True, exist_ok=True)
+
+    engine_proceso = create_engine(database_url)
+    try:
+        with Session(engine_proceso) as session, destino.open("w", encoding="utf-8") as archivo:
+            total = 0
+            archivo.write("[")
+            for cancion in session.exec(select(Cancion).order_by(Cancion.id)):
+                if total:
+                    archivo.write(",")
+                datos = cancion.model_dump(mode="json", exclude={"clave_normalizada"})
+                archivo.write(json.dumps(datos, ensure_ascii=False))
+                total += 1
+            archivo.write("]")
+    finally:
+        engine_proceso.dispose()
+    return {"archivo": str(destino), "canciones": total}
+
+
+settings = get_settings()
+
+
+# Instancia compartida; se inicia y detiene desde el lifespan de main.py
+runner = JobRunner(
+    engine, settings.jobs_thread_workers, settings.jobs_process_workers, settings.jobs_lease_seconds
+)
+
+
+def get_jobs() -> JobRunner:
+    """Dependencia que provee el runner de trabajos"""
+    if not runner.activo:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El sistema de trabajos no está iniciado",
+        )
+    return runner
@@ -0,0 +1,107 @@
+"""
+Cargadores por lotes (estilo DataLoader).
+Resuelven muchos IDs con una sola consulta IN y recuerdan los resultados
+durante la petición para no repetir búsquedas.
+"""
+
+import logging
+from collections.abc import MutableMapping
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from sqlmodel import Session, SQLModel, select
+
+from app.database import get_session
+from app.models import Cancion, Usuario
+
+logger = logging.getLogger(__name__)
+
+# SQLite limita el número de parámetros por sentencia
+TAMANO_LOTE = 500
+
+# Máximo de IDs aceptados en un parámetro ?ids=
+MAX_IDS = 1000
+
+# Encabezado con los IDs pedidos que no existen
+ENCABEZADO_IDS_FALTANTES = "X-Ids-No-Encontrados"
+
+
+class BatchLoader:
+    """
+    Cargador por lotes de un modelo con caché por petición.
+
+    FastAPI resuelve cada dependencia una sola vez por petición, así que
+    todos los handlers y dependencias que piden el mismo cargador comparten
+    la misma instancia y sus resultados ya buscados.
+    """
+
+    def __init__(self, session: Session, model: type[SQLModel]):
+        self.session = session
+        self.model = model
+        self._cache: dict[int, Optional[SQLModel]] = {}
+
+    def load_many(self, ids: list[int]) -> list[Optional[SQLModel]]:
+        """
+        Retorna los objetos en el mismo orden que `ids`, con None para los
+        que no existen. Solo consulta los IDs que aún no están en caché.
+        """
+        pendientes = [i for i in dict.fromkeys(ids) if i not in self._cache]
+        for inicio in range(0, len(pendientes), TAMANO_LOTE):
+            lote = pendientes[inicio : inicio + TAMANO_LOTE]
+            statement = select(self.model).where(self.model.id.in_(lote))
+            encontrados = {obj.id: obj for obj in self.session.exec(statement).all()}
+            for i in lote:
+                self._cache[i] = encontrados.get(i)
+        return [self._cache[i] for i in ids]
+
+    def load(self, id: int) -> Optional[SQLModel]:
+        """Retorna un objeto por ID o None si no existe"""
+        return self.load_many([id])[0]
+
+
+def parse_ids(ids: str) -> list[int]:
+    """
+    Convierte un parámetro "1,2,3" en una lista de enteros sin duplicados,
+    conservando el orden de la petición.
+    """
+    try:
+        valores = [int(valor) for valor in ids.split(",") if valor.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El parámetro ids debe ser una lista de enteros separados por coma",
+        ) from None
+    valores = list(dict.fromkeys(valores))
+    if len(valores) > MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No se pueden pedir más de {MAX_IDS} IDs a la vez",
+        )
+    return valores
+
+
+def cargar_por_ids(
+    loader: BatchLoader, ids: str, encabezados: MutableMapping[str, str]
+) -> list[SQLModel]:
+    """
+    Resuelve un parámetro ?ids= con una sola consulta.
+    Retorna los objetos en el orden pedido y reporta los IDs inexistentes
+    en el encabezado X-Ids-No-Encontrados.
+    """
+    valores = parse_ids(ids)
+    objetos = loader.load_many(valores)
+    faltantes = [i for i, obj in zip(valores, objetos, strict=True) if obj is None]
+    encabezados[ENCABEZADO_IDS_FALTANTES] = ",".join(str(i) for i in faltantes)
+    if faltantes:
+        logger.info(f"IDs de {loader.model.__name__} no encontrados: {faltantes}")
+    return [obj for obj in objetos if obj is not None]
+
+
+def get_cancion_loader(session: Session = Depends(get_session)) -> BatchLoader:
+    """Dependencia que provee el cargador de canciones de la petición"""
+    return BatchLoader(session, Cancion)
+
+
+def get_usuario_loader(session: Session = Depends(get_session)) -> BatchLoader:
+    """Dependencia que provee el cargador de usuarios de la petición"""
+    return BatchLoader(session, Usuario)
@@ -7,6 +7,8 @@ import logging
 import sys
 from pathlib import Path
 
+from app.access_log import RequestIdFilter
+from app.access_log import logger as access_logger
 from app.config import get_settings
 
 settings = get_settings()
@@ -21,30 +23,38 @@ def setup_logging():
     log_dir = Path(settings.log_file).parent
     log_dir.mkdir(exist_ok=True)
 
-    # Configurar formato de logs
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    # Configurar formato de logs; request_id correlaciona las líneas de una petición
+    log_format = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
     date_format = "%Y-%m-%d %H:%M:%S"
 
+    handlers = [
+        # Handler para archivo
+        logging.FileHandler(settings.log_file, encoding="utf-8"),
+        # Handler para consola
+        logging.StreamHandler(sys.stdout),
+    ]
+    for handler in handlers:
+        handler.addFilter(RequestIdFilter())
+
     # Configurar el logger raíz
     logging.basicConfig(
         level=getattr(logging, settings.log_level),
         format=log_format,
         datefmt=date_format,
-        handlers=[
-            # Handler para archivo
-            logging.FileHandler(settings.log_file, encoding="utf-8"),
-            # Handler para consola
-            logging.StreamHandler(sys.stdout),
-        ],
+        handlers=handlers,
     )
 
+    # Registro de acceso: una línea JSON por petición en su propio archivo
+    if settings.access_log and not access_logger.handlers:
+        Path(settings.access_log_file).parent.mkdir(exist_ok=True)
+        access_handler = logging.FileHandler(settings.access_log_file, encoding="utf-8")
+        access_handler.setFormatter(logging.Formatter("%(message)s"))
+        access_logger.addHandler(access_handler)
+        access_logger.setLevel(logging.INFO)
+
     # Logger específico para la aplicación
     logger = logging.getLogger("app")
     logger.info("Sistema de logging inicializado")
     logger.info(f"Logs guardados en: {settings.log_file}")
 
     return logger
-
-
-# Inicializar logging al importar el módulo
-logger = setup_logging()
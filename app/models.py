@@ -6,6 +6,7 @@ Define las tablas de Usuario, Cancion y Favorito usando SQLModel.
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import JSON, Column, Index, LargeBinary
 from sqlmodel import Field, Relationship, SQLModel
 
 # =============================================================================
@@ -81,6 +82,7 @@ class Cancion(CancionBase, table=True):
 
     id: Optional[int] = Field(default=None, primary_key=True)
     fecha_creacion: datetime = Field(default_factory=datetime.now)
+    clave_normalizada: Optional[str] = Field(default=None, index=True, max_length=310)
 
     # Relación con favoritos
     favoritos: list["Favorito"] = Relationship(back_populates="cancion")
@@ -110,6 +112,38 @@ class CancionUpdate(SQLModel):
     genero: Optional[str] = Field(default=None, max_length=50)
 
 
+class CancionSugerencia(SQLModel):
+    """Esquema reducido de canción para el autocompletado"""
+
+    id: int
+    titulo: str
+    artista: str
+
+
+class ResultadoImportacion(SQLModel):
+    """Resumen de una importación de canciones"""
+
+    creadas: list[int]
+    fusionadas: list[int]
+    rechazadas: int
+
+
+class ResultadoDeduplicacion(SQLModel):
+    """Resumen de la deduplicación del catálogo"""
+
+    grupos: int
+    eliminadas: int
+    reasignados: int
+    descartados: int
+
+
+class CancionTendencia(SQLModel):
+    """Canción en tendencia con los favoritos recibidos en la ventana"""
+
+    cancion: CancionRead
+    favoritos: int
+
+
 # =============================================================================
 # MODELO: FAVORITO
 # =============================================================================
@@ -126,7 +160,7 @@ class Favorito(FavoritoBase, table=True):
     """Modelo de tabla Favorito"""
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    fecha_agregado: datetime = Field(default_factory=datetime.now)
+    fecha_agregado: datetime = Field(default_factory=datetime.now, index=True)
 
     # Relaciones
     usuario: Optional[Usuario] = Relationship(back_populates="favoritos")
@@ -154,3 +188,156 @@ class FavoritoConDetalles(SQLModel):
     cancion_id: int
     fecha_agregado: datetime
     cancion: CancionRead
+
+
+class FavoritosMaterializados(SQLModel, table=True):
+    """
+    Modelo de tabla FavoritosMaterializados: la respuesta de los favoritos
+    de un usuario con detalles, ya serializada. Está al día cuando
+    `version_datos` coincide con `version`, que incrementan las escrituras.
+    """
+
+    usuario_id: int = Field(primary_key=True)
+    datos: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    version_datos: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    fecha_actualizacion: datetime = Field(default_factory=datetime.now)
+
+
+class UsuarioSimilar(SQLModel):
+    """Usuario con gustos parecidos según la similitud de Jaccard de sus favoritos"""
+
+    usuario: UsuarioRead
+    similitud: float
+    canciones_comunes: int
+
+
+# =============================================================================
+# MODELO: CAMBIO
+# =============================================================================
+
+
+class Cambio(SQLModel, table=True):
+    """
+    Modelo de tabla Cambio: registro append-only de las escrituras.
+    En los shards guarda los eventos de favoritos hasta trasladarlos a la
+    base principal, donde `origen` y `origen_id` identifican su fila en el shard.
+    AUTOINCREMENT evita que SQLite reutilice los ids del shard tras vaciarlo en
+    un traslado, lo que haría pasar eventos nuevos por ya copiados.
+    """
+
+    __table_args__ = (
+        Index("ix_cambio_origen", "origen", "origen_id", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    entidad: str = Field(max_length=20, description="usuario, cancion o favorito")
+    entidad_id: int
+    operacion: str = Field(max_length=20, description="crear, actualizar o eliminar")
+    datos: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    fecha: datetime = Field(default_factory=datetime.now)
+    origen: Optional[int] = Field(default=None, description="Shard del que se trasladó")
+    origen_id: Optional[int] = None
+
+
+class CambioRead(SQLModel):
+    """Esquema para leer un evento de cambio"""
+
+    id: int
+    entidad: str
+    entidad_id: int
+    operacion: str
+    datos: Optional[dict] = None
+    fecha: datetime
+
+
+class PaginaCambios(SQLModel):
+    """Página de eventos del registro de cambios"""
+
+    cambios: list[CambioRead]
+    cursor: int = Field(description="Valor de `desde` para pedir la siguiente página")
+    hay_mas: bool
+
+
+# =============================================================================
+# MODELO: TRABAJO
+# =============================================================================
+
+
+class Trabajo(SQLModel, table=True):
+    """Modelo de tabla Trabajo: tareas de mantenimiento en segundo plano"""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tipo: str = Field(max_length=50)
+    estado: str = Field(default="pendiente", max_length=20, index=True)
+    parametros: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    resultado: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    fecha_creacion: datetime = Field(default_factory=datetime.now)
+    fecha_inicio: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None
+    propietario: Optional[str] = Field(default=None, max_length=100, description="Runner dueño")
+    latido: Optional[datetime] = Field(default=None, description="Última renovación del lease")
+
+
+class TrabajoCreate(SQLModel):
+    """Esquema para encolar un trabajo"""
+
+    tipo: str = Field(description="Tipo de trabajo, ej: vacuum, deduplicar, exportar")
+    parametros: dict = Field(default_factory=dict)
+
+
+class TrabajoRead(SQLModel):
+    """Esquema para leer el estado de un trabajo"""
+
+    id: int
+    tipo: str
+    estado: str = Field(description="pendiente, ejecutando, completado o fallido")
+    parametros: Optional[dict] = None
+    resultado: Optional[dict] = None
+    error: Optional[str] = None
+    fecha_creacion: datetime
+    fecha_inicio: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None
+
+
+# =============================================================================
+# ESQUEMAS: ESTADÍSTICAS
+# =============================================================================
+
+
+class EstadisticaGrupo(SQLModel):
+    """Agregado de canciones para un valor de agrupación (género, artista o año)"""
+
+    grupo: Optional[str] = None
+    canciones: int
+    duracion_total: int
+    duracion_promedio: float
+
+
+class FavoritosPorUsuario(SQLModel):
+    """Número de favoritos de un usuario"""
+
+    usuario_id: int
+    nombre: str
+    favoritos: int
+
+
+class TotalesCatalogo(SQLModel):
+    """Totales globales del catálogo"""
+
+    usuarios: int
+    canciones: int
+    favoritos: int
+    duracion_total: int
+
+
+class EstadisticasCatalogo(SQLModel):
+    """Esquema para leer las estadísticas del catálogo"""
+
+    totales: TotalesCatalogo
+    por_genero: list[EstadisticaGrupo]
+    por_artista: list[EstadisticaGrupo]
+    por_año: list[EstadisticaGrupo]
+    favoritos_por_usuario: list[FavoritosPorUsuario]
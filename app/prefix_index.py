@@ -0,0 +1,123 @@
+"""
+Índice de prefijos en memoria para el autocompletado de canciones.
+Mantiene arreglos ordenados por título y por artista y busca con bisect.
+"""
+
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from sqlmodel import Session, select
+
+from app.cache import CacheManager
+from app.models import Cancion, CancionSugerencia
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ("titulo", "artista")
+
+
+def normalizar(texto: str) -> str:
+    """Pasa el texto a minúsculas y elimina tildes para comparar prefijos"""
+    descompuesto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).strip()
+
+
+class PrefixIndex:
+    """
+    Índice ordenado de canciones por título y artista.
+
+    Cada campo se guarda como una lista ordenada de tuplas (clave, id);
+    una búsqueda es un bisect hasta el prefijo más un recorrido de N entradas.
+    Se construye desde la base de datos en el primer uso y los handlers de
+    escritura lo actualizan de forma incremental.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._claves: dict[str, list[tuple[str, int]]] = {campo: [] for campo in CAMPOS}
+        self._canciones: dict[int, CancionSugerencia] = {}
+        self._construido = False
+
+    def construir(self, session: Session) -> None:
+        """Carga todas las canciones desde la base de datos"""
+        with self._lock:
+            filas = session.exec(select(Cancion.id, Cancion.titulo, Cancion.artista)).all()
+            self._canciones = {
+                cancion_id: CancionSugerencia(id=cancion_id, titulo=titulo, artista=artista)
+                for cancion_id, titulo, artista in filas
+            }
+            self._claves = {
+                campo: sorted(
+                    (normalizar(getattr(sugerencia, campo)), sugerencia.id)
+                    for sugerencia in self._canciones.values()
+                )
+                for campo in CAMPOS
+            }
+            self._construido = True
+        logger.info(f"Índice de prefijos construido con {len(filas)} canciones")
+
+    def invalidar(self) -> None:
+        """Descarta el índice; se reconstruye en la siguiente búsqueda"""
+        with self._lock:
+            self._construido = False
+            self._canciones = {}
+            self._claves = {campo: [] for campo in CAMPOS}
+
+    def agregar(self, cancion: Cancion) -> None:
+        """Agrega o reemplaza una canción en el índice"""
+        with self._lock:
+            if not self._construido:
+                return
+            self._quitar(cancion.id)
+            sugerencia = CancionSugerencia(
+                id=cancion.id, titulo=cancion.titulo, artista=cancion.artista
+            )
+            self._canciones[cancion.id] = sugerencia
+            for campo in CAMPOS:
+                insort(self._claves[campo], (normalizar(getattr(sugerencia, campo)), cancion.id))
+
+    def eliminar(self, cancion_id: int) -> None:
+        """Quita una canción del índice"""
+        with self._lock:
+            if self._construido:
+                self._quitar(cancion_id)
+
+    def _quitar(self, cancion_id: int) -> None:
+        sugerencia = self._canciones.pop(cancion_id, None)
+        if sugerencia is None:
+            return
+        for campo in CAMPOS:
+            claves = self._claves[campo]
+            entrada = (normalizar(getattr(sugerencia, campo)), cancion_id)
+            posicion = bisect_left(claves, entrada)
+            if posicion < len(claves) and claves[posicion] == entrada:
+                del claves[posicion]
+
+    def buscar(
+        self, session: Session, campo: str, prefijo: str, limite: int = 10
+    ) -> list[CancionSugerencia]:
+        """
+        Retorna hasta `limite` canciones cuyo campo empieza por el prefijo,
+        en orden alfabético.
+        """
+        if not self._construido:
+            self.construir(session)
+
+        clave = normalizar(prefijo)
+        with self._lock:
+            claves = self._claves[campo]
+            resultados = []
+            posicion = bisect_left(claves, (clave,))
+            while posicion < len(claves) and len(resultados) < limite:
+                valor, cancion_id = claves[posicion]
+                if not valor.startswith(clave):
+                    break
+                resultados.append(self._canciones[cancion_id])
+                posicion += 1
+            return resultados
+
+
+# Instancia compartida por el router de canciones
+indice_canciones = CacheManager.register_index(PrefixIndex())
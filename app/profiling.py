@@ -0,0 +1,177 @@
+"""
+Perfilado bajo demanda de peticiones individuales.
+Con `profiling_enabled` activo, una petición con el encabezado X-Profile
+se ejecuta bajo cProfile y su reporte, junto con la duración de cada
+sentencia SQL, se guarda para consultarlo en /api/admin/perfiles.
+Con el perfilado desactivado no se instala nada y no hay sobrecosto.
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+from app.query_log import peticion_actual
+
+logger = logging.getLogger(__name__)
+
+ENCABEZADO = "x-profile"
+ENCABEZADO_ID = "X-Profile-Id"
+
+# Sentencias SQL de la petición perfilada en curso
+_sentencias: ContextVar[Optional[list]] = ContextVar("sentencias_perfil", default=None)
+
+
+class Perfilador:
+    """
+    Envuelve los endpoints síncronos para perfilarlos cuando la petición lo pide.
+
+    Solo se perfilan los endpoints `def`: se ejecutan en un hilo del pool y
+    cProfile mide únicamente ese hilo. Los reportes se guardan en memoria,
+    como máximo `max_reportes`, descartando los más antiguos.
+    """
+
+    def __init__(self, token: str = "", max_reportes: int = 50, lineas: int = 30):
+        self.token = token
+        self.max_reportes = max_reportes
+        self.lineas = lineas
+        self._lock = threading.Lock()
+        self._reportes: OrderedDict[str, dict] = OrderedDict()
+
+    def solicitado(self, scope: Scope) -> bool:
+        """Indica si la petición pide perfilado con un token válido"""
+        for nombre, valor in scope["headers"]:
+            if nombre == ENCABEZADO.encode():
+                # Se comparan bytes: compare_digest no acepta texto que no sea ASCII
+                return bool(valor) and (
+                    not self.token or secrets.compare_digest(valor, self.token.encode())
+                )
+        return False
+
+    def instalar(self, app: FastAPI, engine: Engine) -> int:
+        """Envuelve los endpoints síncronos de la app y mide el SQL del engine"""
+        envueltos = 0
+        for ruta in app.routes:
+            if isinstance(ruta, APIRoute) and not asyncio.iscoroutinefunction(ruta.dependant.call):
+                ruta.dependant.call = self.envolver(ruta.dependant.call)
+                envueltos += 1
+        event.listen(engine, "before_cursor_execute", _antes_sql)
+        event.listen(engine, "after_cursor_execute", _despues_sql)
+        logger.info(f"Perfilado bajo demanda activo en {envueltos} endpoints")
+        return envueltos
+
+    def envolver(self, func: Callable) -> Callable:
+        """Retorna func perfilada cuando la petición en curso lo solicita"""
+
+        @wraps(func)
+        def envoltura(**kwargs):
+            scope = peticion_actual()
+            if scope is None or not self.solicitado(scope):
+                return func(**kwargs)
+
+            sentencias = []
+            token = _sentencias.set(sentencias)
+            perfil = cProfile.Profile()
+            inicio = time.perf_counter()
+            try:
+                return perfil.runcall(func, **kwargs)
+            finally:
+                duracion = (time.perf_counter() - inicio) * 1000
+                _sentencias.reset(token)
+                scope["perfil_id"] = self._guardar(scope, perfil, duracion, sentencias)
+
+        return envoltura
+
+    def _guardar(
+        self, scope: Scope, perfil: cProfile.Profile, duracion_ms: float, sentencias: list
+    ) -> str:
+        salida = io.StringIO()
+        pstats.Stats(perfil, stream=salida).sort_stats("cumulative").print_stats(self.lineas)
+        ruta = scope.get("route")
+        reporte = {
+            "id": uuid.uuid4().hex[:12],
+            "fecha": datetime.now().isoformat(timespec="milliseconds"),
+            "ruta": f"{scope['method']} {getattr(ruta, 'path', scope['path'])}",
+            "duracion_ms": round(duracion_ms, 3),
+            "sql_ms": round(sum(s["duracion_ms"] for s in sentencias), 3),
+            "sql": sentencias,
+            "perfil": salida.getvalue(),
+        }
+        with self._lock:
+            self._reportes[reporte["id"]] = reporte
+            while len(self._reportes) > self.max_reportes:
+                self._reportes.popitem(last=False)
+        logger.info(f"Perfil {reporte['id']} guardado para {reporte['ruta']}")
+        return reporte["id"]
+
+    def obtener(self, perfil_id: str) -> Optional[dict]:
+        """Retorna un reporte completo o None"""
+        with self._lock:
+            return self._reportes.get(perfil_id)
+
+    def listar(self) -> list[dict]:
+        """Retorna el resumen de los reportes guardados, del más reciente al más antiguo"""
+        with self._lock:
+            return [
+                {
+                    clave: reporte[clave]
+                    for clave in ("id", "fecha", "ruta", "duracion_ms", "sql_ms")
+                }
+                for reporte in reversed(self._reportes.values())
+            ]
+
+
+def _antes_sql(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _sentencias.get() is not None:
+        conn.info.setdefault("inicio_perfil", []).append(time.perf_counter())
+
+
+def _despues_sql(conn, cursor, statement, parameters, context, executemany) -> None:
+    sentencias = _sentencias.get()
+    if sentencias is not None:
+        duracion = (time.perf_counter() - conn.info["inicio_perfil"].pop()) * 1000
+        sentencias.append({"sql": statement, "duracion_ms": round(duracion, 3)})
+
+
+class ProfilingMiddleware:
+    """Agrega a la respuesta el encabezado X-Profile-Id de las peticiones perfiladas"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def enviar(mensaje: Message) -> None:
+            if mensaje["type"] == "http.response.start" and "perfil_id" in scope:
+                MutableHeaders(scope=mensaje)[ENCABEZADO_ID] = scope["perfil_id"]
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
+
+
+settings = get_settings()
+
+# Instancia compartida por main.py y el endpoint de administración
+perfilador = Perfilador(settings.profiling_token, settings.profiling_max_reports)
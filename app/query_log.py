@@ -0,0 +1,203 @@
+"""
+Registro de consultas lentas.
+Las sentencias SQL que superan un umbral se guardan con sus parámetros,
+duración, ruta de origen y plan de ejecución (EXPLAIN QUERY PLAN) en un
+archivo dedicado, y se agrupan por huella para ver las peores.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Scope ASGI de la petición en curso; se copia a los hilos de los handlers
+_peticion: ContextVar[Optional[Scope]] = ContextVar("peticion", default=None)
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def peticion_actual() -> Optional[Scope]:
+    """Retorna el scope ASGI de la petición en curso, o None fuera de una petición"""
+    return _peticion.get()
+
+
+def ruta_actual() -> Optional[str]:
+    """Retorna "MÉTODO /plantilla/{id}" de la petición en curso, o None fuera de una petición"""
+    scope = _peticion.get()
+    if scope is None:
+        return None
+    ruta = scope.get("route")
+    return f"{scope['method']} {getattr(ruta, 'path', scope['path'])}"
+
+
+def huella_sql(sql: str) -> str:
+    """Normaliza una sentencia quitando literales y expandiendo listas IN a una sola marca"""
+    normalizada = _LITERALES.sub("?", sql)
+    normalizada = _LISTAS.sub("(...)", normalizada)
+    return _ESPACIOS.sub(" ", normalizada).strip()
+
+
+class QueryContextMiddleware:
+    """Middleware ASGI que expone la petición en curso al registro de consultas"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _peticion.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _peticion.reset(token)
+
+
+class RegistroConsultasLentas:
+    """
+    Escucha los eventos de ejecución de un engine y registra las sentencias
+    que tardan al menos `umbral_ms`. Las estadísticas se agrupan por huella
+    (la sentencia sin literales) y se conservan como máximo `max_huellas`.
+    """
+
+    def __init__(self, umbral_ms: float, archivo: str, max_huellas: int = 500):
+        self.umbral_ms = umbral_ms
+        self.archivo = Path(archivo)
+        self.max_huellas = max_huellas
+        self._lock = threading.Lock()
+        self._huellas: dict[str, dict] = {}
+
+    def instalar(self, engine: Engine) -> None:
+        """Registra los listeners en el engine"""
+        event.listen(engine, "before_cursor_execute", self._antes)
+        event.listen(engine, "after_cursor_execute", self._despues)
+
+    def desinstalar(self, engine: Engine) -> None:
+        """Quita los listeners del engine"""
+        event.remove(engine, "before_cursor_execute", self._antes)
+        event.remove(engine, "after_cursor_execute", self._despues)
+
+    def _antes(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+    def _despues(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        duracion = (time.perf_counter() - conn.info["inicio_consulta"].pop()) * 1000
+        if duracion < self.umbral_ms:
+            return
+
+        plan = None if executemany else self._explicar(conn, statement, parameters)
+        self.registrar(statement, parameters, duracion, ruta_actual(), plan)
+
+    @staticmethod
+    def _explicar(conn, statement: str, parameters) -> Optional[list[str]]:
+        """Obtiene el plan de ejecución en SQLite; None si no aplica"""
+        if conn.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(
+            ("SELECT", "UPDATE", "DELETE", "WITH")
+        ):
+            return None
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                return [fila[-1] for fila in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as exc:
+            logger.debug(f"No se pudo obtener el plan de ejecución: {exc}")
+            return None
+
+    def registrar(
+        self,
+        statement: str,
+        parameters,
+        duracion_ms: float,
+        ruta: Optional[str],
+        plan: Optional[list[str]],
+    ) -> None:
+        """Acumula la consulta en su huella y la escribe en el archivo dedicado"""
+        huella = huella_sql(statement)
+        clave = f"{zlib.crc32(huella.encode()):08x}"
+        duracion_ms = round(duracion_ms, 3)
+
+        with self._lock:
+            estadistica = self._huellas.get(clave)
+            if estadistica is None:
+                if len(self._huellas) >= self.max_huellas:
+                    menor = min(self._huellas, key=lambda k: self._huellas[k]["total_ms"])
+                    del self._huellas[menor]
+                estadistica = self._huellas[clave] = {
+                    "huella": clave,
+                    "sql": huella,
+                    "ejecuciones": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rutas": [],
+                }
+            estadistica["ejecuciones"] += 1
+            estadistica["total_ms"] = round(estadistica["total_ms"] + duracion_ms, 3)
+            estadistica["max_ms"] = max(estadistica["max_ms"], duracion_ms)
+            estadistica["plan"] = plan
+            if ruta and ruta not in estadistica["rutas"]:
+                estadistica["rutas"].append(ruta)
+
+            self._escribir(
+                {
+                    "fecha": datetime.now().isoformat(timespec="milliseconds"),
+                    "huella": clave,
+                    "duracion_ms": duracion_ms,
+                    "ruta": ruta,
+                    "sql": statement,
+                    "parametros": repr(parameters)[:500],
+                    "plan": plan,
+                }
+            )
+        logger.warning(f"Consulta lenta ({duracion_ms} ms) en {ruta or 'sin ruta'}: {clave}")
+
+    def _escribir(self, registro: dict) -> None:
+        try:
+            self.archivo.parent.mkdir(parents=True, exist_ok=True)
+            with self.archivo.open("a", encoding="utf-8") as archivo:
+                archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        except OSError as exc:
+            logger.error(f"No se pudo escribir el registro de consultas lentas: {exc}")
+
+    def peores(self, limite: int = 20) -> list[dict]:
+        """Retorna las huellas con mayor tiempo acumulado"""
+        with self._lock:
+            huellas = sorted(self._huellas.values(), key=lambda e: e["total_ms"], reverse=True)
+            return [
+                {
+                    **estadistica,
+                    "rutas": list(estadistica["rutas"]),
+                    "promedio_ms": round(estadistica["total_ms"] / estadistica["ejecuciones"], 3),
+                }
+                for estadistica in huellas[:limite]
+            ]
+
+    def limpiar(self) -> None:
+        """Descarta las estadísticas acumuladas"""
+        with self._lock:
+            self._huellas.clear()
+
+
+settings = get_settings()
+
+# Instancia compartida por el engine de la aplicación y el endpoint de administración
+registro_lento = RegistroConsultasLentas(settings.slow_query_ms, settings.slow_query_log_file)
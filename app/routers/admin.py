@@ -0,0 +1,169 @@
+"""
+Router de Administración.
+Endpoints internos de métricas y diagnóstico de la API.
+"""
+
+import logging
+import secrets
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from sqlmodel import Session
+
+from app import startup
+from app.admission import MantenimientoOcupadoError, admision, mantenimiento
+from app.backup import (
+    RespaldoInvalidoError,
+    directorio_respaldos,
+    listar_respaldos,
+    restaurar_respaldo,
+)
+from app.coalescing import coalescer
+from app.config import get_settings
+from app.database import get_session
+from app.events import broker
+from app.profiling import perfilador
+from app.query_log import registro_lento
+from app.routers.canciones import cache_canciones
+from app.routers.usuarios import cache_usuarios
+from app.sharding import shards
+from app.vista_favoritos import vista_favoritos
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get("/metricas")
+def obtener_metricas() -> dict:
+    """
+    Retorna métricas internas de la API.
+
+    - **coalescencia**: Consultas de lectura ejecutadas, peticiones que
+      esperaron el resultado de una consulta idéntica en curso y tasa
+      de coalescencia
+    - **commit_agrupado**: Lotes y operaciones del escritor de favoritos de cada shard
+    - **eventos**: Suscriptores SSE conectados, eventos publicados y descartes
+    - **admision**: Peticiones activas, en cola, admitidas y rechazadas por grupo
+    - **arranque**: Duración de cada fase del arranque
+    - **cache_identidad**: Aciertos, aciertos negativos (404) y fallos de la
+      caché por ID de canciones y usuarios
+    - **vista_favoritos**: Listados de favoritos por usuario servidos desde la
+      vista materializada y los que tuvieron que construirla
+    """
+    logger.info("Consultando métricas internas")
+    return {
+        "coalescencia": coalescer.metricas(),
+        "commit_agrupado": [escritor.metricas() for escritor in shards.escritores],
+        "eventos": broker.metricas(),
+        "admision": admision.metricas(),
+        "arranque": startup.metricas(),
+        "cache_identidad": {
+            "canciones": cache_canciones.metricas(),
+            "usuarios": cache_usuarios.metricas(),
+        },
+        "vista_favoritos": vista_favoritos.metricas(),
+    }
+
+
+@router.get("/consultas-lentas")
+def listar_consultas_lentas(limit: int = Query(20, ge=1, le=500)) -> list[dict]:
+    """
+    Lista las consultas lentas agrupadas por huella (sentencia sin literales),
+    ordenadas por tiempo acumulado.
+
+    Cada entrada incluye ejecuciones, tiempo total, máximo y promedio, las
+    rutas que la originaron y el último plan de ejecución (un `SCAN` sobre
+    una tabla grande indica un índice faltante o un filtro `LIKE '%...%'`).
+    """
+    logger.info(f"Consultando consultas lentas (limit={limit})")
+    return registro_lento.peores(limit)
+
+
+@router.get("/perfiles")
+def listar_perfiles() -> list[dict]:
+    """
+    Lista los perfiles de peticiones guardados, del más reciente al más antiguo.
+    Se generan enviando el encabezado `X-Profile` con `profiling_enabled` activo.
+    """
+    logger.info("Listando perfiles de peticiones")
+    return perfilador.listar()
+
+
+@router.get("/perfiles/{perfil_id}")
+def obtener_perfil(perfil_id: str) -> dict:
+    """
+    Obtiene un perfil: reporte de cProfile ordenado por tiempo acumulado y
+    duración de cada sentencia SQL ejecutada durante la petición.
+    """
+    logger.info(f"Obteniendo perfil: {perfil_id}")
+    reporte = perfilador.obtener(perfil_id)
+    if reporte is None:
+        logger.warning(f"Perfil no encontrado: {perfil_id}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil no encontrado")
+    return reporte
+
+
+@router.get("/respaldos")
+def listar_respaldos_disponibles() -> list[dict]:
+    """
+    Lista los respaldos de `backup_dir`, del más reciente al más antiguo.
+    Se crean con el trabajo `backup` (`POST /api/jobs`) o con `python -m app.backup crear`.
+    """
+    logger.info("Listando respaldos")
+    return listar_respaldos()
+
+
+def _verificar_restauracion(token: Optional[str]) -> None:
+    """Rechaza la restauración si está desactivada o el token no coincide"""
+    settings = get_settings()
+    if not settings.backup_restore_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="La restauración está desactivada (BACKUP_RESTORE_ENABLED)",
+        )
+    esperado = settings.backup_restore_token
+    if esperado and not secrets.compare_digest(token or "", esperado):
+        logger.warning("Restauración rechazada: token inválido")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token inválido")
+
+
+@router.post("/respaldos/{nombre}/restaurar")
+def restaurar(
+    nombre: str,
+    session: Session = Depends(get_session),
+    x_restore_token: Optional[str] = Header(None),
+) -> dict:
+    """
+    Restaura un respaldo sobre la base de datos en uso.
+
+    Requiere `BACKUP_RESTORE_ENABLED` y, si se configuró `BACKUP_RESTORE_TOKEN`,
+    el mismo valor en el encabezado `X-Restore-Token`. Solo se ejecuta si no
+    hay otras peticiones en curso (409 si las hay) y, mientras dura, las
+    nuevas reciben 503.
+
+    El respaldo se verifica con `PRAGMA integrity_check` antes de copiarlo y
+    la base de datos restaurada se verifica después; los cachés y los índices
+    en memoria se descartan al terminar. Con shards activos se restaura el
+    conjunto completo, o nada si le falta algún shard o alguno está dañado.
+    """
+    _verificar_restauracion(x_restore_token)
+    origen = directorio_respaldos() / Path(nombre).name
+    if not origen.is_file():
+        logger.warning(f"Respaldo no encontrado: {nombre}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Respaldo no encontrado")
+    try:
+        with mantenimiento.exclusivo():
+            return restaurar_respaldo(origen, session.get_bind())
+    except MantenimientoOcupadoError as exc:
+        logger.warning(f"Restauración rechazada: {exc}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"No se puede restaurar con otras peticiones en curso ({exc})",
+        ) from exc
+    except RespaldoInvalidoError as exc:
+        logger.error(f"Restauración rechazada: {exc}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="El respaldo no pasó la verificación de integridad",
+        ) from exc
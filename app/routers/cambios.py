@@ -0,0 +1,58 @@
+"""
+Router de Cambios.
+Endpoints para leer de forma incremental el registro de cambios.
+"""
+
+import logging
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+
+from app.changefeed import compactar_cambios, listar_cambios
+from app.database import get_session
+from app.models import PaginaCambios
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get("/", response_model=PaginaCambios)
+def obtener_cambios(
+    desde: int = Query(0, ge=0, description="Cursor: ID del último evento ya procesado"),
+    limit: int = Query(100, ge=1, le=1000, description="Número máximo de eventos"),
+    entidad: Optional[Literal["usuario", "cancion", "favorito"]] = Query(
+        None, description="Filtrar por tipo de entidad"
+    ),
+    session: Session = Depends(get_session),
+) -> PaginaCambios:
+    """
+    Lista los eventos de cambio posteriores a un cursor, en orden.
+
+    - **desde**: Cursor retornado por la página anterior (0 para empezar)
+    - **limit**: Número máximo de eventos a retornar
+    - **entidad**: Filtrar por `usuario`, `cancion` o `favorito` (opcional)
+
+    Cada evento incluye el estado de la entidad tras la escritura
+    (`datos` es null en las bajas).
+
+    Orden: los eventos de una misma entidad siempre salen en el orden en que
+    se confirmaron. Con shards activos los eventos de favoritos se trasladan
+    a este registro en lotes, mezclados por fecha entre shards, así que
+    pueden aparecer después de eventos posteriores de usuarios o canciones
+    (hasta `CHANGEFEED_RELAY_INTERVAL_MS`); la baja de un usuario o de una
+    canción siempre sale después de los eventos previos de sus favoritos.
+    """
+    logger.info(f"Listando cambios (desde={desde}, limit={limit}, entidad={entidad})")
+    cambios, hay_mas = listar_cambios(session, desde, limit, entidad)
+    cursor = cambios[-1].id if cambios else desde
+    return PaginaCambios(cambios=cambios, cursor=cursor, hay_mas=hay_mas)
+
+
+@router.post("/compactar")
+def compactar(session: Session = Depends(get_session)) -> dict:
+    """
+    Compacta los eventos antiguos dejando solo el último de cada entidad.
+    """
+    logger.info("Compactando registro de cambios")
+    return {"eliminados": compactar_cambios(session)}
@@ -4,24 +4,58 @@ Endpoints CRUD para gestionar canciones.
 """
 
 import logging
-from typing import Optional
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlmodel import Session, select
 
-from app.cache import CacheManager
+from app.cache import CacheManager, IdentityCache
+from app.changefeed import ACTUALIZAR, CREAR, ELIMINAR, registrar_cambio, trasladar_cambios
+from app.coalescing import responder_coalescido
+from app.config import get_settings
 from app.database import get_session
-from app.models import Cancion, CancionCreate, CancionRead, CancionUpdate
+from app.dedup import buscar_duplicado, clave_cancion, deduplicar_canciones, fusionar
+from app.fieldsets import columnas, fields_param, objeto_parcial, respuesta_lista
+from app.loaders import BatchLoader, cargar_por_ids, get_cancion_loader
+from app.models import (
+    Cancion,
+    CancionCreate,
+    CancionRead,
+    CancionSugerencia,
+    CancionTendencia,
+    CancionUpdate,
+    Favorito,
+    ResultadoDeduplicacion,
+    ResultadoImportacion,
+)
+from app.prefix_index import indice_canciones
+from app.sharding import shards
+from app.similarity import indice_similitud
+from app.trending import indice_tendencias
+from app.vista_favoritos import vista_favoritos
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Canciones máximas por petición de importación
+MAX_IMPORTACION = 1000
+
+# Respuestas de GET /{cancion_id} por ID, invalidadas por los handlers de escritura
+cache_canciones = CacheManager.register_index(IdentityCache(CancionRead))
+
 
 @router.post("/", response_model=CancionRead, status_code=status.HTTP_201_CREATED)
-def crear_cancion(cancion: CancionCreate, session: Session = Depends(get_session)) -> Cancion:
+def crear_cancion(
+    cancion: CancionCreate, response: Response, session: Session = Depends(get_session)
+) -> Cancion:
     """
     Crea una nueva canción.
 
+    Si ya existe una con el mismo título y artista (sin distinguir mayúsculas,
+    tildes ni signos) se aplica `duplicate_policy`: `reject` responde 409,
+    `merge` completa los campos vacíos de la existente y la retorna con 200,
+    `allow` crea la canción igualmente.
+
     - **titulo**: Título de la canción
     - **artista**: Artista o intérprete
     - **album**: Álbum al que pertenece (opcional)
@@ -31,64 +65,261 @@ def crear_cancion(cancion: CancionCreate, session: Session = Depends(get_session
     """
     logger.info(f"Creando canción: {cancion.titulo} - {cancion.artista}")
 
+    politica = get_settings().duplicate_policy
+    if politica != "allow":
+        existente = buscar_duplicado(session, clave_cancion(cancion.titulo, cancion.artista))
+        if existente and politica == "reject":
+            logger.warning(f"Canción duplicada: {cancion.titulo} - {cancion.artista}")
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Ya existe una canción con el mismo título y artista (ID: {existente.id})",
+            )
+        if existente:
+            if fusionar(existente, cancion):
+                session.add(existente)
+                registrar_cambio(session, ACTUALIZAR, existente)
+                session.commit()
+                session.refresh(existente)
+                CacheManager.clear_all()
+                cache_canciones.invalidar_id(existente.id)
+                vista_favoritos.invalidar_canciones(session, [existente.id])
+            logger.info(f"Canción fusionada con la existente: {existente.id}")
+            response.status_code = status.HTTP_200_OK
+            return existente
+
     db_cancion = Cancion.model_validate(cancion)
     session.add(db_cancion)
+    registrar_cambio(session, CREAR, db_cancion)
     session.commit()
     session.refresh(db_cancion)
 
     # Limpiar caché
     CacheManager.clear_all()
+    cache_canciones.invalidar_id(db_cancion.id)
+    indice_canciones.agregar(db_cancion)
 
     logger.info(f"Canción creada exitosamente con ID: {db_cancion.id}")
     return db_cancion
 
 
+@router.post("/importar", response_model=ResultadoImportacion)
+def importar_canciones(
+    canciones: list[CancionCreate], session: Session = Depends(get_session)
+) -> ResultadoImportacion:
+    """
+    Importa un lote de canciones en una sola transacción.
+
+    Los duplicados, tanto contra el catálogo como dentro del lote, se
+    resuelven con `duplicate_policy`: `reject` los omite y los cuenta como
+    rechazados, `merge` completa la canción existente y `allow` los crea.
+    """
+    if len(canciones) > MAX_IMPORTACION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se pueden importar como máximo {MAX_IMPORTACION} canciones por petición",
+        )
+    logger.info(f"Importando {len(canciones)} canciones")
+
+    politica = get_settings().duplicate_policy
+    claves = [clave_cancion(cancion.titulo, cancion.artista) for cancion in canciones]
+
+    # Una sola consulta por índice para todas las claves del lote; gana la más antigua
+    existentes = {}
+    if politica != "allow":
+        statement = select(Cancion).where(Cancion.clave_normalizada.in_(set(claves)))
+        for cancion in session.exec(statement.order_by(Cancion.id.desc())).all():
+            existentes[cancion.clave_normalizada] = cancion
+
+    creadas, ids_creadas, fusionadas, rechazadas = [], set(), {}, 0
+    for cancion, clave in zip(canciones, claves, strict=True):
+        existente = existentes.get(clave)
+        if existente is None:
+            db_cancion = Cancion.model_validate(cancion)
+            session.add(db_cancion)
+            registrar_cambio(session, CREAR, db_cancion)
+            creadas.append(db_cancion)
+            ids_creadas.add(db_cancion.id)
+            if politica != "allow":
+                existentes[clave] = db_cancion
+        elif politica == "reject":
+            rechazadas += 1
+        elif fusionar(existente, cancion) and existente.id not in ids_creadas:
+            fusionadas[existente.id] = existente
+
+    for existente in fusionadas.values():
+        registrar_cambio(session, ACTUALIZAR, existente)
+    session.commit()
+
+    # Limpiar caché
+    CacheManager.clear_all()
+    cache_canciones.invalidar_id(*(cancion.id for cancion in creadas), *fusionadas)
+    for db_cancion in [*creadas, *fusionadas.values()]:
+        indice_canciones.agregar(db_cancion)
+    vista_favoritos.invalidar_canciones(session, fusionadas)
+
+    logger.info(
+        f"Importación completada: {len(creadas)} creadas, {len(fusionadas)} fusionadas, "
+        f"{rechazadas} rechazadas"
+    )
+    return ResultadoImportacion(
+        creadas=[cancion.id for cancion in creadas],
+        fusionadas=list(fusionadas),
+        rechazadas=rechazadas,
+    )
+
+
+@router.post("/deduplicar", response_model=ResultadoDeduplicacion)
+def deduplicar(session: Session = Depends(get_session)) -> dict:
+    """
+    Fusiona las canciones repetidas del catálogo.
+
+    Conserva la más antigua de cada grupo con el mismo título y artista
+    normalizados, le reasigna los favoritos de las demás y elimina el resto.
+    """
+    logger.info("Deduplicando canciones")
+    resultado = deduplicar_canciones(session)
+
+    # Los IDs de canciones cambiaron: limpiar caché e índices en memoria
+    CacheManager.clear_all()
+    CacheManager.invalidate_indexes()
+    return resultado
+
+
+def _consultar_canciones(
+    skip: int,
+    limit: int,
+    artista: Optional[str],
+    genero: Optional[str],
+    ids: Optional[str],
+    campos: Optional[list[str]],
+    session: Session,
+    loader: BatchLoader,
+) -> Response:
+    """Ejecuta la consulta del listado de canciones y serializa el resultado"""
+    if ids is not None:
+        logger.info(f"Obteniendo canciones por IDs: {ids}")
+        encabezados = {}
+        canciones = cargar_por_ids(loader, ids, encabezados)
+        return respuesta_lista(CancionRead, campos, canciones, encabezados)
+
+    logger.info(
+        f"Listando canciones (skip={skip}, limit={limit}, artista={artista}, genero={genero})"
+    )
+
+    # Con ?fields= solo se seleccionan las columnas pedidas
+    statement = select(*columnas(Cancion, campos)) if campos else select(Cancion)
+
+    # Aplicar filtros
+    if artista:
+        statement = statement.where(Cancion.artista.contains(artista))
+    if genero:
+        statement = statement.where(Cancion.genero.contains(genero))
+
+    statement = statement.offset(skip).limit(limit)
+    canciones = session.exec(statement).all()
+
+    logger.info(f"Se encontraron {len(canciones)} canciones")
+    return respuesta_lista(CancionRead, campos, canciones)
+
+
 @router.get("/", response_model=list[CancionRead])
 def listar_canciones(
     skip: int = 0,
     limit: int = 100,
     artista: Optional[str] = Query(None, description="Filtrar por artista"),
     genero: Optional[str] = Query(None, description="Filtrar por género"),
+    ids: Optional[str] = Query(None, description="IDs separados por coma, ej: 1,2,3"),
+    campos: Optional[list[str]] = Depends(fields_param(CancionRead)),
     session: Session = Depends(get_session),
-) -> list[Cancion]:
+    loader: BatchLoader = Depends(get_cancion_loader),
+) -> Response:
     """
     Lista todas las canciones con paginación y filtros opcionales.
+    Las peticiones idénticas concurrentes comparten una sola consulta.
 
     - **skip**: Número de registros a saltar
     - **limit**: Número máximo de registros a retornar
     - **artista**: Filtrar por nombre de artista (opcional)
     - **genero**: Filtrar por género musical (opcional)
+    - **ids**: Obtener varias canciones por ID en una sola consulta (opcional).
+      Se retornan en el orden pedido, se ignoran los demás parámetros y los IDs
+      inexistentes se reportan en el encabezado `X-Ids-No-Encontrados`
+    - **fields**: Campos a incluir en cada canción, ej: `id,titulo` (opcional)
     """
-    logger.info(
-        f"Listando canciones (skip={skip}, limit={limit}, artista={artista}, genero={genero})"
+    clave = ("canciones", skip, limit, artista, genero, ids, tuple(campos or ()))
+    return responder_coalescido(
+        clave,
+        lambda: _consultar_canciones(skip, limit, artista, genero, ids, campos, session, loader),
     )
 
-    statement = select(Cancion)
 
-    # Aplicar filtros
-    if artista:
-        statement = statement.where(Cancion.artista.contains(artista))
-    if genero:
-        statement = statement.where(Cancion.genero.contains(genero))
+@router.get("/autocompletar", response_model=list[CancionSugerencia])
+def autocompletar_canciones(
+    prefijo: str = Query(..., min_length=1, description="Inicio del texto a buscar"),
+    campo: Literal["titulo", "artista"] = Query("titulo", description="Campo donde buscar"),
+    limite: int = Query(10, ge=1, le=50, description="Número máximo de sugerencias"),
+    session: Session = Depends(get_session),
+) -> list[CancionSugerencia]:
+    """
+    Sugiere canciones cuyo título o artista empieza por el prefijo.
+    La búsqueda no distingue mayúsculas ni tildes y se resuelve en memoria.
 
-    statement = statement.offset(skip).limit(limit)
-    canciones = session.exec(statement).all()
+    - **prefijo**: Inicio del título o del artista
+    - **campo**: `titulo` o `artista`
+    - **limite**: Número máximo de sugerencias
+    """
+    logger.info(f"Autocompletando canciones ({campo}={prefijo!r}, limite={limite})")
+    return indice_canciones.buscar(session, campo, prefijo, limite)
 
-    logger.info(f"Se encontraron {len(canciones)} canciones")
-    return canciones
+
+@router.get("/tendencias", response_model=list[CancionTendencia])
+def listar_tendencias(
+    ventana: Literal["1h", "24h", "7d"] = Query("24h", description="Ventana de tiempo"),
+    limite: int = Query(10, ge=1, le=100, description="Número máximo de canciones"),
+    session: Session = Depends(get_session),
+    loader: BatchLoader = Depends(get_cancion_loader),
+) -> list[dict]:
+    """
+    Lista las canciones con más favoritos agregados dentro de la ventana.
+    Los conteos se mantienen en memoria; solo se consultan las canciones del resultado.
+
+    - **ventana**: `1h`, `24h` o `7d`
+    - **limite**: Número máximo de canciones
+    """
+    logger.info(f"Listando tendencias (ventana={ventana}, limite={limite})")
+    ranking = indice_tendencias.ranking(session, ventana, limite)
+    canciones = loader.load_many([cancion_id for cancion_id, _ in ranking])
+    return [
+        {"cancion": cancion, "favoritos": favoritos}
+        for (_, favoritos), cancion in zip(ranking, canciones, strict=True)
+        if cancion is not None
+    ]
 
 
 @router.get("/{cancion_id}", response_model=CancionRead)
-def obtener_cancion(cancion_id: int, session: Session = Depends(get_session)) -> Cancion:
+def obtener_cancion(
+    cancion_id: int,
+    campos: Optional[list[str]] = Depends(fields_param(CancionRead)),
+    session: Session = Depends(get_session),
+) -> Response:
     """
     Obtiene una canción específica por su ID.
+    Sin `fields` la respuesta sale de la caché por ID (también los 404).
+
+    - **fields**: Campos a incluir, ej: `id,titulo` (opcional)
     """
     logger.info(f"Buscando canción con ID: {cancion_id}")
-    cancion = session.get(Cancion, cancion_id)
+    if campos:
+        statement = select(*columnas(Cancion, campos)).where(Cancion.id == cancion_id)
+        cancion = session.exec(statement).first()
+    else:
+        cancion = cache_canciones.obtener(cancion_id, lambda: session.get(Cancion, cancion_id))
     if not cancion:
         logger.warning(f"Canción no encontrada: {cancion_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canción no encontrada")
-    return cancion
+    if campos:
+        return objeto_parcial(campos, cancion)
+    return Response(content=cancion, media_type="application/json")
 
 
 @router.patch("/{cancion_id}", response_model=CancionRead)
@@ -112,11 +343,15 @@ def actualizar_cancion(
         setattr(db_cancion, key, value)
 
     session.add(db_cancion)
+    registrar_cambio(session, ACTUALIZAR, db_cancion)
     session.commit()
     session.refresh(db_cancion)
 
     # Limpiar caché
     CacheManager.clear_all()
+    cache_canciones.invalidar_id(cancion_id)
+    indice_canciones.agregar(db_cancion)
+    vista_favoritos.invalidar_canciones(session, [cancion_id])
 
     logger.info(f"Canción actualizada exitosamente: {cancion_id}")
     return db_cancion
@@ -134,10 +369,24 @@ def eliminar_cancion(cancion_id: int, session: Session = Depends(get_session)) -
         logger.warning(f"Canción no encontrada: {cancion_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canción no encontrada")
 
+    # Usuarios cuya vista de favoritos incluye la canción
+    usuarios = vista_favoritos.usuarios_con_cancion(session, cancion_id)
+
+    # Los eventos de favoritos de la canción que siguen en los shards van antes que su baja
+    trasladar_cambios(session)
+    registrar_cambio(session, ELIMINAR, cancion)
     session.delete(cancion)
     session.commit()
 
+    # Con shards activos los favoritos de la canción están en otros archivos
+    if shards.eliminar_donde(session, Favorito.cancion_id == cancion_id):
+        indice_similitud.invalidar()
+        indice_tendencias.invalidar()
+
     # Limpiar caché
     CacheManager.clear_all()
+    cache_canciones.invalidar_id(cancion_id)
+    indice_canciones.eliminar(cancion_id)
+    vista_favoritos.invalidar_usuarios(session, usuarios)
 
     logger.info(f"Canción eliminada exitosamente: {cancion_id}")
@@ -0,0 +1,105 @@
+"""
+Router de Estadísticas.
+Endpoints de agregados del catálogo calculados en SQL y cacheados.
+"""
+
+import logging
+from collections import Counter
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.cache import cached_session_query
+from app.database import get_session
+from app.models import (
+    Cancion,
+    EstadisticaGrupo,
+    EstadisticasCatalogo,
+    Favorito,
+    FavoritosPorUsuario,
+    TotalesCatalogo,
+    Usuario,
+)
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+def _agrupar_canciones(session: Session, columna) -> list[EstadisticaGrupo]:
+    """Cuenta canciones y suma/promedia su duración agrupando por una columna"""
+    statement = (
+        select(
+            columna,
+            func.count(Cancion.id),
+            func.coalesce(func.sum(Cancion.duracion), 0),
+            func.coalesce(func.avg(Cancion.duracion), 0),
+        )
+        .group_by(columna)
+        .order_by(func.count(Cancion.id).desc(), columna)
+    )
+    return [
+        EstadisticaGrupo(
+            grupo=None if valor is None else str(valor),
+            canciones=canciones,
+            duracion_total=total,
+            duracion_promedio=round(promedio, 2),
+        )
+        for valor, canciones, total, promedio in session.exec(statement).all()
+    ]
+
+
+@cached_session_query(maxsize=1)
+def calcular_estadisticas(session: Session) -> EstadisticasCatalogo:
+    """
+    Calcula todos los agregados del catálogo con consultas GROUP BY.
+    El resultado queda en caché hasta la siguiente escritura.
+    """
+    logger.info("Calculando estadísticas del catálogo")
+
+    total_canciones, duracion_total = session.exec(
+        select(func.count(Cancion.id), func.coalesce(func.sum(Cancion.duracion), 0))
+    ).one()
+
+    # Los favoritos pueden estar repartidos en shards: se cuentan por usuario
+    # en cada uno y se combinan con los usuarios de la base principal
+    conteos = Counter()
+    for usuario_id, favoritos in shards.consultar(
+        session,
+        select(Favorito.usuario_id, func.count(Favorito.id)).group_by(Favorito.usuario_id),
+    ):
+        conteos[usuario_id] += favoritos
+    usuarios = session.exec(select(Usuario.id, Usuario.nombre)).all()
+
+    totales = TotalesCatalogo(
+        usuarios=len(usuarios),
+        canciones=total_canciones,
+        favoritos=sum(conteos.values()),
+        duracion_total=duracion_total,
+    )
+    favoritos_por_usuario = [
+        FavoritosPorUsuario(usuario_id=usuario_id, nombre=nombre, favoritos=conteos[usuario_id])
+        for usuario_id, nombre in sorted(usuarios, key=lambda u: (-conteos[u[0]], u[0]))
+    ]
+
+    return EstadisticasCatalogo(
+        totales=totales,
+        por_genero=_agrupar_canciones(session, Cancion.genero),
+        por_artista=_agrupar_canciones(session, Cancion.artista),
+        por_año=_agrupar_canciones(session, Cancion.año),
+        favoritos_por_usuario=favoritos_por_usuario,
+    )
+
+
+@router.get("/", response_model=EstadisticasCatalogo)
+def obtener_estadisticas(session: Session = Depends(get_session)) -> EstadisticasCatalogo:
+    """
+    Obtiene las estadísticas del catálogo.
+
+    - **totales**: Número de usuarios, canciones, favoritos y duración total
+    - **por_genero**, **por_artista**, **por_año**: Canciones y duración por grupo
+    - **favoritos_por_usuario**: Número de favoritos de cada usuario
+    """
+    logger.info("Obteniendo estadísticas del catálogo")
+    return calcular_estadisticas(session)
@@ -0,0 +1,42 @@
+"""
+Router de Eventos.
+Stream SSE con las altas, modificaciones y bajas de usuarios, canciones y favoritos.
+"""
+
+import logging
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from app.config import get_settings
+from app.events import broker, flujo_eventos
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get("/")
+async def suscribir_eventos() -> StreamingResponse:
+    """
+    Abre un stream de Server-Sent Events con los cambios del catálogo.
+
+    Cada evento tiene como `id` el cursor del registro de cambios y como
+    tipo `<entidad>.<operacion>` (ej: `cancion.actualizar`). Un cliente que
+    se reconecta puede recuperar lo perdido con `GET /api/cambios/?desde=<id>`.
+    Los clientes que no leen a tiempo reciben `desconectado` y se cierran.
+    """
+    suscriptor = broker.suscribir()
+    if suscriptor is None:
+        logger.warning("Límite de suscriptores SSE alcanzado")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiados clientes conectados, intente más tarde",
+        )
+
+    logger.info("Nuevo suscriptor SSE")
+    return StreamingResponse(
+        flujo_eventos(broker, suscriptor, settings.sse_heartbeat_seconds),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
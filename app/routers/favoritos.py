@@ -4,12 +4,20 @@ Endpoints para gestionar las canciones favoritas de los usuarios.
 """
 
 import logging
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlmodel import Session, SQLModel, select
 
 from app.cache import CacheManager
+from app.changefeed import CREAR, ELIMINAR, registrar_en_shard
+from app.coalescing import responder_coalescido
+from app.config import get_settings
 from app.database import get_session
+from app.fieldsets import respuesta_lista
+from app.group_commit import EscrituraNoConfirmadaError
 from app.models import (
     Cancion,
     CancionRead,
@@ -19,21 +27,56 @@ from app.models import (
     FavoritoRead,
     Usuario,
 )
+from app.sharding import shards
+from app.similarity import indice_similitud
+from app.trending import indice_tendencias
+from app.vista_favoritos import vista_favoritos
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.post("/", response_model=FavoritoRead, status_code=status.HTTP_201_CREATED)
-def agregar_favorito(favorito: FavoritoCreate, session: Session = Depends(get_session)) -> Favorito:
+def _escribir(session: Session, shard: int, operacion: Callable[[Session], Any]) -> Any:
     """
-    Agrega una canción a los favoritos de un usuario.
-
-    - **usuario_id**: ID del usuario
-    - **cancion_id**: ID de la canción
+    Aplica una operación de escritura sobre los favoritos de un shard.
+    Con el commit agrupado activo se encola en el escritor del shard y espera
+    a que su lote sea durable; si no, se ejecuta en la sesión del shard (la
+    de la petición cuando hay un solo shard).
     """
-    logger.info(f"Agregando favorito: Usuario {favorito.usuario_id}, Canción {favorito.cancion_id}")
+    escritor = shards.escritores[shard]
+    if escritor.activo:
+        try:
+            return escritor.ejecutar(operacion)
+        except EscrituraNoConfirmadaError as exc:
+            logger.error(f"Escritura de favoritos sin confirmar en el shard {shard}: {exc}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="La escritura no se pudo confirmar a tiempo, intente más tarde",
+                headers={"Retry-After": str(get_settings().admission_retry_after_seconds)},
+            ) from exc
+
+    with shards.sesion(session, shard) as sesion_shard:
+        resultado = operacion(sesion_shard)
+        sesion_shard.commit()
+        if isinstance(resultado, SQLModel):
+            sesion_shard.refresh(resultado)
+    return resultado
+
+
+def _registrar(session: Session, operacion: str, favorito: Favorito) -> None:
+    """
+    Registra el evento, con el ID global del favorito, en la transacción de
+    la escritura. Con shards activos queda en la tabla de cambios del shard
+    y se traslada después a la base principal.
+    """
+    if favorito.id is None:
+        session.flush()
+    shard = shards.shard_de(favorito.usuario_id)
+    registrar_en_shard(session, operacion, shards.globalizar(shard, favorito))
 
+
+def _verificar_referencias(session: Session, favorito: FavoritoCreate) -> CancionRead:
+    """Verifica en la base principal que el usuario y la canción existen; retorna la canción"""
     # Verificar que el usuario existe
     usuario = session.get(Usuario, favorito.usuario_id)
     if not usuario:
@@ -45,7 +88,17 @@ def agregar_favorito(favorito: FavoritoCreate, session: Session = Depends(get_se
     if not cancion:
         logger.warning(f"Canción no encontrada: {favorito.cancion_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canción no encontrada")
+    return CancionRead.model_validate(cancion)
+
 
+def _agregar_favorito(
+    session: Session, favorito: FavoritoCreate, cancion: Optional[CancionRead] = None
+) -> Favorito:
+    """
+    Valida que no exista y agrega el favorito a la sesión sin confirmar la
+    transacción. Con la canción se agrega también a la vista del usuario; sin
+    ella la vista solo se marca como desactualizada.
+    """
     # Verificar que no existe ya este favorito
     statement = select(Favorito).where(
         Favorito.usuario_id == favorito.usuario_id, Favorito.cancion_id == favorito.cancion_id
@@ -63,70 +116,92 @@ def agregar_favorito(favorito: FavoritoCreate, session: Session = Depends(get_se
     # Crear favorito
     db_favorito = Favorito.model_validate(favorito)
     session.add(db_favorito)
-    session.commit()
-    session.refresh(db_favorito)
+    _registrar(session, CREAR, db_favorito)
+    if cancion is None:
+        vista_favoritos.invalidar(session, favorito.usuario_id)
+    else:
+        shard = shards.shard_de(favorito.usuario_id)
+        agregado = (shards.globalizar(shard, db_favorito), cancion)
+        vista_favoritos.aplicar(session, favorito.usuario_id, agregado=agregado)
+    return db_favorito
+
+
+@router.post("/", response_model=FavoritoRead, status_code=status.HTTP_201_CREATED)
+def agregar_favorito(favorito: FavoritoCreate, session: Session = Depends(get_session)) -> Favorito:
+    """
+    Agrega una canción a los favoritos de un usuario.
+
+    - **usuario_id**: ID del usuario
+    - **cancion_id**: ID de la canción
+    """
+    logger.info(f"Agregando favorito: Usuario {favorito.usuario_id}, Canción {favorito.cancion_id}")
+
+    cancion = _verificar_referencias(session, favorito)
+    # Devolver la conexión de la petición al pool antes de esperar al escritor
+    session.rollback()
+    shard = shards.shard_de(favorito.usuario_id)
+    db_favorito = _escribir(session, shard, lambda s: _agregar_favorito(s, favorito, cancion))
+    db_favorito = shards.globalizar(shard, db_favorito)
+
+    # Si la canción cambió entre la verificación y la escritura, la vista
+    # guardó la versión anterior y la invalidación de ese cambio no la alcanzó
+    actual = session.get(Cancion, favorito.cancion_id)
+    if actual is None or CancionRead.model_validate(actual) != cancion:
+        vista_favoritos.invalidar_usuarios(session, [favorito.usuario_id])
 
     # Limpiar caché
     CacheManager.clear_all()
+    indice_tendencias.registrar(
+        db_favorito.usuario_id, db_favorito.cancion_id, db_favorito.fecha_agregado, 1
+    )
+    indice_similitud.agregar(db_favorito.usuario_id, db_favorito.cancion_id)
 
     logger.info(f"Favorito agregado exitosamente con ID: {db_favorito.id}")
     return db_favorito
 
 
 @router.get("/usuario/{usuario_id}", response_model=list[FavoritoConDetalles])
-def listar_favoritos_usuario(
-    usuario_id: int, session: Session = Depends(get_session)
-) -> list[dict]:
+def listar_favoritos_usuario(usuario_id: int, session: Session = Depends(get_session)) -> Response:
     """
     Lista todos los favoritos de un usuario con detalles de las canciones.
+    La respuesta sale ya serializada de la vista materializada del usuario,
+    que los handlers de escritura mantienen al día.
     """
     logger.info(f"Listando favoritos del usuario: {usuario_id}")
 
-    # Verificar que el usuario existe
-    usuario = session.get(Usuario, usuario_id)
-    if not usuario:
+    datos = vista_favoritos.obtener(session, usuario_id)
+    if datos is None:
         logger.warning(f"Usuario no encontrado: {usuario_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
+    return Response(content=datos, media_type="application/json")
 
-    # Obtener favoritos con detalles de canciones
-    statement = select(Favorito, Cancion).where(
-        Favorito.usuario_id == usuario_id, Favorito.cancion_id == Cancion.id
-    )
-    results = session.exec(statement).all()
-
-    # Construir respuesta con detalles
-    favoritos_detallados = []
-    for favorito, cancion in results:
-        favorito_detalle = {
-            "id": favorito.id,
-            "usuario_id": favorito.usuario_id,
-            "cancion_id": favorito.cancion_id,
-            "fecha_agregado": favorito.fecha_agregado,
-            "cancion": CancionRead.model_validate(cancion),
-        }
-        favoritos_detallados.append(favorito_detalle)
-
-    logger.info(
-        f"Se encontraron {len(favoritos_detallados)} favoritos para el usuario {usuario_id}"
-    )
-    return favoritos_detallados
+
+def _consultar_favoritos(skip: int, limit: int, session: Session) -> Response:
+    """Ejecuta la consulta del listado de favoritos y serializa el resultado"""
+    logger.info(f"Listando todos los favoritos (skip={skip}, limit={limit})")
+    if shards.activo:
+        favoritos = shards.listar(session, skip, limit)
+    else:
+        statement = select(Favorito).offset(skip).limit(limit)
+        favoritos = session.exec(statement).all()
+    logger.info(f"Se encontraron {len(favoritos)} favoritos")
+    return respuesta_lista(FavoritoRead, None, favoritos)
 
 
 @router.get("/", response_model=list[FavoritoRead])
 def listar_todos_favoritos(
     skip: int = 0, limit: int = 100, session: Session = Depends(get_session)
-) -> list[Favorito]:
+) -> Response:
     """
     Lista todos los favoritos con paginación.
+    Las peticiones idénticas concurrentes comparten una sola consulta.
+    Con shards activos se consulta cada shard y se mezclan por ID.
 
     - **skip**: Número de registros a saltar
     - **limit**: Número máximo de registros a retornar
     """
-    logger.info(f"Listando todos los favoritos (skip={skip}, limit={limit})")
-    statement = select(Favorito).offset(skip).limit(limit)
-    favoritos = session.exec(statement).all()
-    logger.info(f"Se encontraron {len(favoritos)} favoritos")
-    return favoritos
+    clave = ("favoritos", skip, limit)
+    return responder_coalescido(clave, lambda: _consultar_favoritos(skip, limit, session))
 
 
 @router.delete("/{favorito_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -135,17 +210,26 @@ def eliminar_favorito(favorito_id: int, session: Session = Depends(get_session))
     Elimina un favorito específico.
     """
     logger.info(f"Eliminando favorito: {favorito_id}")
-
-    favorito = session.get(Favorito, favorito_id)
-    if not favorito:
-        logger.warning(f"Favorito no encontrado: {favorito_id}")
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Favorito no encontrado")
-
-    session.delete(favorito)
-    session.commit()
+    shard, id_local = shards.ubicar(favorito_id)
+
+    def eliminar(session: Session) -> tuple:
+        favorito = session.get(Favorito, id_local)
+        if not favorito:
+            logger.warning(f"Favorito no encontrado: {favorito_id}")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Favorito no encontrado"
+            )
+        _registrar(session, ELIMINAR, favorito)
+        session.delete(favorito)
+        vista_favoritos.aplicar(session, favorito.usuario_id, quitado=favorito_id)
+        return favorito.usuario_id, favorito.cancion_id, favorito.fecha_agregado
+
+    usuario_id, cancion_id, fecha_agregado = _escribir(session, shard, eliminar)
 
     # Limpiar caché
     CacheManager.clear_all()
+    indice_tendencias.registrar(usuario_id, cancion_id, fecha_agregado, -1)
+    indice_similitud.eliminar(usuario_id, cancion_id)
 
     logger.info(f"Favorito eliminado exitosamente: {favorito_id}")
 
@@ -158,20 +242,29 @@ def eliminar_favorito_por_usuario_cancion(
     Elimina un favorito específico por usuario y canción.
     """
     logger.info(f"Eliminando favorito: Usuario {usuario_id}, Canción {cancion_id}")
+    shard = shards.shard_de(usuario_id)
 
-    statement = select(Favorito).where(
-        Favorito.usuario_id == usuario_id, Favorito.cancion_id == cancion_id
-    )
-    favorito = session.exec(statement).first()
+    def eliminar(session: Session) -> datetime:
+        statement = select(Favorito).where(
+            Favorito.usuario_id == usuario_id, Favorito.cancion_id == cancion_id
+        )
+        favorito = session.exec(statement).first()
 
-    if not favorito:
-        logger.warning(f"Favorito no encontrado: Usuario {usuario_id}, Canción {cancion_id}")
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Favorito no encontrado")
+        if not favorito:
+            logger.warning(f"Favorito no encontrado: Usuario {usuario_id}, Canción {cancion_id}")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Favorito no encontrado"
+            )
+        _registrar(session, ELIMINAR, favorito)
+        session.delete(favorito)
+        vista_favoritos.aplicar(session, usuario_id, quitado=shards.id_global(shard, favorito.id))
+        return favorito.fecha_agregado
 
-    session.delete(favorito)
-    session.commit()
+    fecha_agregado = _escribir(session, shard, eliminar)
 
     # Limpiar caché
     CacheManager.clear_all()
+    indice_tendencias.registrar(usuario_id, cancion_id, fecha_agregado, -1)
+    indice_similitud.eliminar(usuario_id, cancion_id)
 
     logger.info(f"Favorito eliminado exitosamente: Usuario {usuario_id}, Canción {cancion_id}")
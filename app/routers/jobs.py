@@ -0,0 +1,62 @@
+"""
+Router de Trabajos.
+Endpoints para encolar tareas de mantenimiento y consultar su avance.
+"""
+
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlmodel import Session, select
+
+from app.database import get_session
+from app.jobs import TIPOS, JobRunner, get_jobs
+from app.models import Trabajo, TrabajoCreate, TrabajoRead
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.post("/", response_model=TrabajoRead, status_code=status.HTTP_202_ACCEPTED)
+def crear_trabajo(
+    trabajo: TrabajoCreate,
+    session: Session = Depends(get_session),
+    jobs: JobRunner = Depends(get_jobs),
+) -> Trabajo:
+    """
+    Encola un trabajo de mantenimiento y retorna de inmediato.
+    Consultar `GET /api/jobs/{id}` hasta que el estado sea `completado` o `fallido`.
+
+    - **tipo**: `estadisticas`, `deduplicar`, `compactar_cambios`, `vacuum`, `backup`
+      o `exportar`
+    - **parametros**: Parámetros del trabajo (opcional)
+    """
+    logger.info(f"Encolando trabajo: {trabajo.tipo}")
+    return jobs.enviar(session, trabajo.tipo, trabajo.parametros)
+
+
+@router.get("/", response_model=list[TrabajoRead])
+def listar_trabajos(
+    limit: int = Query(20, ge=1, le=100), session: Session = Depends(get_session)
+) -> list[Trabajo]:
+    """Lista los trabajos más recientes"""
+    logger.info(f"Listando trabajos (limit={limit})")
+    return session.exec(select(Trabajo).order_by(Trabajo.id.desc()).limit(limit)).all()
+
+
+@router.get("/tipos")
+def listar_tipos() -> dict:
+    """Lista los tipos de trabajo disponibles y sus parámetros"""
+    return {
+        nombre: {"proceso": tipo.proceso, "parametros": sorted(tipo.parametros)}
+        for nombre, tipo in sorted(TIPOS.items())
+    }
+
+
+@router.get("/{trabajo_id}", response_model=TrabajoRead)
+def obtener_trabajo(trabajo_id: int, session: Session = Depends(get_session)) -> Trabajo:
+    """Obtiene el estado, resultado o error de un trabajo"""
+    trabajo = session.get(Trabajo, trabajo_id)
+    if not trabajo:
+        logger.warning(f"Trabajo no encontrado: {trabajo_id}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo no encontrado")
+    return trabajo
@@ -4,17 +4,37 @@ Endpoints CRUD para gestionar usuarios.
 """
 
 import logging
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlmodel import Session, select
 
-from app.cache import CacheManager
+from app.cache import CacheManager, IdentityCache
+from app.changefeed import ACTUALIZAR, CREAR, ELIMINAR, registrar_cambio, trasladar_cambios
+from app.coalescing import responder_coalescido
 from app.database import get_session
-from app.models import Usuario, UsuarioCreate, UsuarioRead, UsuarioUpdate
+from app.fieldsets import columnas, fields_param, objeto_parcial, respuesta_lista
+from app.loaders import BatchLoader, cargar_por_ids, get_cancion_loader, get_usuario_loader
+from app.models import (
+    CancionRead,
+    Favorito,
+    Usuario,
+    UsuarioCreate,
+    UsuarioRead,
+    UsuarioSimilar,
+    UsuarioUpdate,
+)
+from app.sharding import shards
+from app.similarity import indice_similitud
+from app.trending import indice_tendencias
+from app.vista_favoritos import vista_favoritos
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Respuestas de GET /{usuario_id} por ID, invalidadas por los handlers de escritura
+cache_usuarios = CacheManager.register_index(IdentityCache(UsuarioRead))
+
 
 @router.post("/", response_model=UsuarioRead, status_code=status.HTTP_201_CREATED)
 def crear_usuario(usuario: UsuarioCreate, session: Session = Depends(get_session)) -> Usuario:
@@ -39,44 +59,171 @@ def crear_usuario(usuario: UsuarioCreate, session: Session = Depends(get_session
     # Crear usuario
     db_usuario = Usuario.model_validate(usuario)
     session.add(db_usuario)
+    registrar_cambio(session, CREAR, db_usuario)
     session.commit()
     session.refresh(db_usuario)
 
     # Limpiar caché
     CacheManager.clear_all()
+    cache_usuarios.invalidar_id(db_usuario.id)
 
     logger.info(f"Usuario creado exitosamente con ID: {db_usuario.id}")
     return db_usuario
 
 
+def _consultar_usuarios(
+    skip: int,
+    limit: int,
+    ids: Optional[str],
+    campos: Optional[list[str]],
+    session: Session,
+    loader: BatchLoader,
+) -> Response:
+    """Ejecuta la consulta del listado de usuarios y serializa el resultado"""
+    if ids is not None:
+        logger.info(f"Obteniendo usuarios por IDs: {ids}")
+        encabezados = {}
+        usuarios = cargar_por_ids(loader, ids, encabezados)
+        return respuesta_lista(UsuarioRead, campos, usuarios, encabezados)
+
+    logger.info(f"Listando usuarios (skip={skip}, limit={limit})")
+    statement = select(*columnas(Usuario, campos)) if campos else select(Usuario)
+    statement = statement.offset(skip).limit(limit)
+    usuarios = session.exec(statement).all()
+    logger.info(f"Se encontraron {len(usuarios)} usuarios")
+    return respuesta_lista(UsuarioRead, campos, usuarios)
+
+
 @router.get("/", response_model=list[UsuarioRead])
 def listar_usuarios(
-    skip: int = 0, limit: int = 100, session: Session = Depends(get_session)
-) -> list[Usuario]:
+    skip: int = 0,
+    limit: int = 100,
+    ids: Optional[str] = Query(None, description="IDs separados por coma, ej: 1,2,3"),
+    campos: Optional[list[str]] = Depends(fields_param(UsuarioRead)),
+    session: Session = Depends(get_session),
+    loader: BatchLoader = Depends(get_usuario_loader),
+) -> Response:
     """
     Lista todos los usuarios con paginación.
+    Las peticiones idénticas concurrentes comparten una sola consulta.
 
     - **skip**: Número de registros a saltar
     - **limit**: Número máximo de registros a retornar
+    - **ids**: Obtener varios usuarios por ID en una sola consulta (opcional).
+      Se retornan en el orden pedido, se ignora la paginación y los IDs
+      inexistentes se reportan en el encabezado `X-Ids-No-Encontrados`
+    - **fields**: Campos a incluir en cada usuario, ej: `id,nombre` (opcional)
     """
-    logger.info(f"Listando usuarios (skip={skip}, limit={limit})")
-    statement = select(Usuario).offset(skip).limit(limit)
-    usuarios = session.exec(statement).all()
-    logger.info(f"Se encontraron {len(usuarios)} usuarios")
-    return usuarios
+    clave = ("usuarios", skip, limit, ids, tuple(campos or ()))
+    return responder_coalescido(
+        clave, lambda: _consultar_usuarios(skip, limit, ids, campos, session, loader)
+    )
+
+
+@router.get("/autocompletar", response_model=list[UsuarioRead])
+def autocompletar_usuarios(
+    prefijo: str = Query(..., min_length=1, description="Inicio del nombre o del correo"),
+    limite: int = Query(10, ge=1, le=50, description="Número máximo de sugerencias"),
+    session: Session = Depends(get_session),
+) -> list[Usuario]:
+    """
+    Sugiere usuarios cuyo nombre o correo empieza por el prefijo, sin
+    distinguir mayúsculas. Lo usan los selectores de usuario del frontend.
+
+    - **prefijo**: Inicio del nombre o del correo
+    - **limite**: Número máximo de sugerencias
+    """
+    logger.info(f"Autocompletando usuarios (prefijo={prefijo!r}, limite={limite})")
+    statement = (
+        select(Usuario)
+        .where(
+            Usuario.nombre.istartswith(prefijo, autoescape=True)
+            | Usuario.correo.istartswith(prefijo, autoescape=True)
+        )
+        .order_by(Usuario.nombre, Usuario.id)
+        .limit(limite)
+    )
+    return session.exec(statement).all()
 
 
 @router.get("/{usuario_id}", response_model=UsuarioRead)
-def obtener_usuario(usuario_id: int, session: Session = Depends(get_session)) -> Usuario:
+def obtener_usuario(
+    usuario_id: int,
+    campos: Optional[list[str]] = Depends(fields_param(UsuarioRead)),
+    session: Session = Depends(get_session),
+) -> Response:
     """
     Obtiene un usuario específico por su ID.
+    Sin `fields` la respuesta sale de la caché por ID (también los 404).
+
+    - **fields**: Campos a incluir, ej: `id,nombre` (opcional)
     """
     logger.info(f"Buscando usuario con ID: {usuario_id}")
-    usuario = session.get(Usuario, usuario_id)
+    if campos:
+        statement = select(*columnas(Usuario, campos)).where(Usuario.id == usuario_id)
+        usuario = session.exec(statement).first()
+    else:
+        usuario = cache_usuarios.obtener(usuario_id, lambda: session.get(Usuario, usuario_id))
     if not usuario:
         logger.warning(f"Usuario no encontrado: {usuario_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
-    return usuario
+    if campos:
+        return objeto_parcial(campos, usuario)
+    return Response(content=usuario, media_type="application/json")
+
+
+def _verificar_usuarios(session: Session, *usuario_ids: int) -> None:
+    """Lanza 404 si alguno de los usuarios no existe"""
+    for usuario_id in usuario_ids:
+        if not session.get(Usuario, usuario_id):
+            logger.warning(f"Usuario no encontrado: {usuario_id}")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado"
+            )
+
+
+@router.get("/{usuario_id}/comunes/{otro_id}", response_model=list[CancionRead])
+def listar_favoritos_comunes(
+    usuario_id: int,
+    otro_id: int,
+    session: Session = Depends(get_session),
+    loader: BatchLoader = Depends(get_cancion_loader),
+) -> list:
+    """
+    Lista las canciones favoritas que comparten dos usuarios.
+    La intersección se calcula en memoria; solo se consultan las canciones resultantes.
+    """
+    logger.info(f"Buscando favoritos comunes: Usuario {usuario_id}, Usuario {otro_id}")
+    _verificar_usuarios(session, usuario_id, otro_id)
+
+    canciones = loader.load_many(indice_similitud.comunes(session, usuario_id, otro_id))
+    logger.info(f"Se encontraron {len(canciones)} favoritos comunes")
+    return [cancion for cancion in canciones if cancion is not None]
+
+
+@router.get("/{usuario_id}/similares", response_model=list[UsuarioSimilar])
+def listar_usuarios_similares(
+    usuario_id: int,
+    limite: int = Query(10, ge=1, le=100, description="Número máximo de usuarios"),
+    session: Session = Depends(get_session),
+    loader: BatchLoader = Depends(get_usuario_loader),
+) -> list[dict]:
+    """
+    Lista los usuarios con gustos más parecidos, ordenados por la similitud
+    de Jaccard de sus favoritos (canciones comunes / canciones de ambos).
+
+    - **limite**: Número máximo de usuarios
+    """
+    logger.info(f"Buscando usuarios similares a: {usuario_id}")
+    _verificar_usuarios(session, usuario_id)
+
+    similares = indice_similitud.similares(session, usuario_id, limite)
+    usuarios = loader.load_many([otro_id for otro_id, _, _ in similares])
+    return [
+        {"usuario": usuario, "similitud": similitud, "canciones_comunes": comunes}
+        for (_, similitud, comunes), usuario in zip(similares, usuarios, strict=True)
+        if usuario is not None
+    ]
 
 
 @router.patch("/{usuario_id}", response_model=UsuarioRead)
@@ -114,11 +261,13 @@ def actualizar_usuario(
         setattr(db_usuario, key, value)
 
     session.add(db_usuario)
+    registrar_cambio(session, ACTUALIZAR, db_usuario)
     session.commit()
     session.refresh(db_usuario)
 
     # Limpiar caché
     CacheManager.clear_all()
+    cache_usuarios.invalidar_id(usuario_id)
 
     logger.info(f"Usuario actualizado exitosamente: {usuario_id}")
     return db_usuario
@@ -136,10 +285,20 @@ def eliminar_usuario(usuario_id: int, session: Session = Depends(get_session)) -
         logger.warning(f"Usuario no encontrado: {usuario_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
 
+    # Los eventos de favoritos del usuario que siguen en los shards van antes que su baja
+    trasladar_cambios(session)
+    registrar_cambio(session, ELIMINAR, usuario)
     session.delete(usuario)
     session.commit()
 
+    # Con shards activos los favoritos del usuario están en otro archivo
+    if shards.eliminar_donde(session, Favorito.usuario_id == usuario_id):
+        indice_similitud.invalidar()
+        indice_tendencias.invalidar()
+
     # Limpiar caché
     CacheManager.clear_all()
+    cache_usuarios.invalidar_id(usuario_id)
+    vista_favoritos.invalidar_usuarios(session, [usuario_id])
 
     logger.info(f"Usuario eliminado exitosamente: {usuario_id}")
@@ -0,0 +1,193 @@
+"""
+Particionado (sharding) de la tabla de favoritos.
+Con `favoritos_shards` mayor que 1 los favoritos se reparten por usuario_id
+entre varios archivos SQLite, cada uno con su propio bloqueo de escritura,
+de modo que las escrituras de usuarios en shards distintos no se esperan
+entre sí. Con un solo shard los favoritos siguen en la base de datos
+principal y todo funciona como antes.
+"""
+
+import heapq
+import logging
+from collections.abc import Iterator
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any
+
+from sqlalchemy import delete
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.config import get_settings
+from app.database import engine
+from app.group_commit import GroupCommitWriter
+from app.models import Cambio, Favorito, FavoritosMaterializados
+from app.query_log import registro_lento
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ShardRouter:
+    """
+    Enruta las operaciones de favoritos al shard de cada usuario.
+
+    El shard de un usuario es `usuario_id % n`. Los IDs de favorito que ve
+    la API son globales: `id_local * n + shard`, así que de un ID se obtiene
+    su shard sin consultar nada. Con un shard el ID global es el local.
+
+    Cada shard tiene su propio escritor con commit agrupado. Los eventos
+    del registro de cambios se guardan en el shard junto con la escritura y
+    se trasladan después a la base de datos principal (ver changefeed).
+    """
+
+    def __init__(self, engines: list[Engine]):
+        self.configurar(engines)
+
+    def configurar(self, engines: list[Engine]) -> None:
+        """Asigna los engines de los shards (el primero es la base principal si hay uno)"""
+        self.engines = list(engines)
+        self.escritores = [
+            GroupCommitWriter(
+                engine_shard,
+                max_lote=settings.group_commit_max_batch,
+                intervalo_ms=settings.group_commit_interval_ms,
+                timeout=settings.group_commit_timeout_s,
+            )
+            for engine_shard in self.engines
+        ]
+
+    @property
+    def n(self) -> int:
+        """Número de shards"""
+        return len(self.engines)
+
+    @property
+    def activo(self) -> bool:
+        """Indica si los favoritos están repartidos fuera de la base principal"""
+        return self.n > 1
+
+    def shard_de(self, usuario_id: int) -> int:
+        """Shard que guarda los favoritos del usuario"""
+        return usuario_id % self.n
+
+    def id_global(self, shard: int, id_local: int) -> int:
+        """ID de favorito expuesto por la API"""
+        return id_local * self.n + shard
+
+    def ubicar(self, favorito_id: int) -> tuple[int, int]:
+        """Retorna (shard, id_local) de un ID global"""
+        return favorito_id % self.n, favorito_id // self.n
+
+    def globalizar(self, shard: int, favorito: Favorito) -> Favorito:
+        """Copia del favorito con su ID global (el mismo objeto con un solo shard)"""
+        if not self.activo:
+            return favorito
+        return Favorito(
+            id=self.id_global(shard, favorito.id),
+            usuario_id=favorito.usuario_id,
+            cancion_id=favorito.cancion_id,
+            fecha_agregado=favorito.fecha_agregado,
+        )
+
+    @contextmanager
+    def sesion(self, session: Session, shard: int) -> Iterator[Session]:
+        """
+        Sesión del shard. Con un solo shard es la sesión principal recibida;
+        si no, una sesión nueva que se cierra al salir (sin commit automático).
+        """
+        if not self.activo:
+            yield session
+            return
+        with Session(self.engines[shard], expire_on_commit=False) as sesion_shard:
+            yield sesion_shard
+
+    def consultar(self, session: Session, statement) -> list[Any]:
+        """Ejecuta la consulta en todos los shards y concatena las filas"""
+        filas = []
+        for shard in range(self.n):
+            with self.sesion(session, shard) as sesion_shard:
+                filas.extend(sesion_shard.exec(statement).all())
+        return filas
+
+    def listar(self, session: Session, skip: int, limit: int) -> list[Favorito]:
+        """
+        Página de favoritos ordenada por ID global (scatter-gather).
+        Cada shard aporta como máximo skip + limit filas en orden de ID local,
+        que dentro de un shard es también el orden global; se mezclan con
+        heapq.merge y se toma la página.
+        """
+        statement = select(Favorito).order_by(Favorito.id).limit(skip + limit)
+        por_shard = []
+        for shard in range(self.n):
+            with self.sesion(session, shard) as sesion_shard:
+                filas = sesion_shard.exec(statement).all()
+            por_shard.append([self.globalizar(shard, favorito) for favorito in filas])
+        mezcla = heapq.merge(*por_shard, key=lambda favorito: favorito.id)
+        return list(islice(mezcla, skip, skip + limit))
+
+    def eliminar_donde(self, session: Session, *condiciones) -> int:
+        """
+        Elimina de los shards los favoritos que cumplen las condiciones
+        (al borrar un usuario o una canción), registrando en la misma
+        transacción el evento de baja de cada uno. Solo aplica con shards
+        activos: con uno solo la base principal gestiona sus favoritos.
+        """
+        if not self.activo:
+            return 0
+        # Import diferido: app.changefeed depende de este módulo
+        from app.changefeed import ELIMINAR, registrar_en_shard
+
+        eliminados = 0
+        for shard in range(self.n):
+            with self.sesion(session, shard) as sesion_shard:
+                favoritos = sesion_shard.exec(select(Favorito).where(*condiciones)).all()
+                if not favoritos:
+                    continue
+                for favorito in favoritos:
+                    registrar_en_shard(sesion_shard, ELIMINAR, self.globalizar(shard, favorito))
+                sesion_shard.exec(
+                    delete(Favorito).where(Favorito.id.in_([f.id for f in favoritos]))
+                )
+                sesion_shard.commit()
+                eliminados += len(favoritos)
+        return eliminados
+
+    def crear_tablas(self) -> None:
+        """Crea las tablas de favoritos, de su vista y de sus eventos en los shards"""
+        if not self.activo:
+            return
+        tablas = [Favorito.__table__, FavoritosMaterializados.__table__, Cambio.__table__]
+        for engine_shard in self.engines:
+            SQLModel.metadata.create_all(engine_shard, tables=tablas)
+        logger.info(f"Favoritos repartidos en {self.n} shards")
+
+    def iniciar_escritores(self) -> None:
+        """Arranca el escritor con commit agrupado de cada shard"""
+        for escritor in self.escritores:
+            escritor.iniciar()
+
+    def detener_escritores(self) -> None:
+        """Detiene los escritores aplicando las operaciones pendientes"""
+        for escritor in self.escritores:
+            escritor.detener()
+
+
+def _crear_engines() -> list[Engine]:
+    """Engine de cada shard según la configuración"""
+    if settings.favoritos_shards <= 1:
+        return [engine]
+    engines = []
+    for shard in range(settings.favoritos_shards):
+        engine_shard = create_engine(
+            settings.favoritos_shard_url.format(shard=shard),
+            connect_args={"check_same_thread": False},
+        )
+        if settings.slow_query_log:
+            registro_lento.instalar(engine_shard)
+        engines.append(engine_shard)
+    return engines
+
+
+# Instancia compartida por los routers y los índices que leen favoritos
+shards = ShardRouter(_crear_engines())
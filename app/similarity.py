@@ -0,0 +1,228 @@
+"""
+Favoritos comunes y usuarios similares.
+Guarda los favoritos de cada usuario como un arreglo ordenado de IDs de
+canciones y un índice invertido de usuarios por canción, para intersectar y
+medir la similitud de Jaccard en memoria en lugar de hacer joins sobre la
+tabla de favoritos. El costo depende de cuántos favoritos hay, no del mayor ID.
+
+Los arreglos son `array("q")`: 8 bytes por ID, frente a las decenas de bytes
+por elemento (tabla hash más el objeto int) de un `set`, y cada favorito se
+guarda dos veces (por usuario y por canción). A cambio, agregar o quitar un
+favorito desplaza el arreglo (lineal en los favoritos del usuario o los fans
+de la canción) en lugar de ser constante.
+"""
+
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlmodel import Session, select
+
+from app.cache import CacheManager
+from app.models import Favorito
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+# Arreglo vacío para usuarios y canciones sin favoritos (no se modifica)
+_VACIO = array("q")
+
+
+def _insertar(arreglo: array, valor: int) -> None:
+    """Inserta el valor en el arreglo ordenado si no estaba"""
+    posicion = bisect_left(arreglo, valor)
+    if posicion == len(arreglo) or arreglo[posicion] != valor:
+        arreglo.insert(posicion, valor)
+
+
+def _retirar(arreglo: array, valor: int) -> None:
+    """Quita el valor del arreglo ordenado si estaba"""
+    posicion = bisect_left(arreglo, valor)
+    if posicion < len(arreglo) and arreglo[posicion] == valor:
+        del arreglo[posicion]
+
+
+def _interseccion(a: array, b: array) -> list[int]:
+    """Valores comunes de dos arreglos ordenados, por mezcla"""
+    comunes = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            i += 1
+        elif a[i] > b[j]:
+            j += 1
+        else:
+            comunes.append(a[i])
+            i += 1
+            j += 1
+    return comunes
+
+
+class SimilarityIndex:
+    """
+    Favoritos por usuario e índice invertido de usuarios por canción, como
+    arreglos ordenados.
+
+    La intersección de dos usuarios mezcla sus arreglos ordenados. Para
+    buscar similares se recorren los fans de cada canción del usuario, lo
+    que da de una vez los candidatos y cuántas canciones comparten con él;
+    los usuarios sin canciones en común no se evalúan.
+
+    La lectura de la base de datos se hace sin el lock; los favoritos que se
+    agregan o eliminan mientras tanto se guardan y se aplican en orden al
+    terminar. Agregar o quitar un par es idempotente, así que repetir un
+    cambio que ya venía en la lectura no altera el resultado.
+
+    Si una construcción se descarta (por `invalidar` o por otra que empezó
+    después), las consultas que la esperaban vuelven a intentarlo.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Avisa a las consultas en espera que terminó una construcción
+        self._listo = threading.Condition(self._lock)
+        self._favoritos: dict[int, array] = {}
+        self._fans: dict[int, array] = {}
+        self._construido = False
+        # Cambios recibidos durante una construcción en curso (None si no hay)
+        self._pendientes: Optional[list[tuple[int, int, bool]]] = None
+
+    def construir(self, session: Session) -> None:
+        """Carga todos los favoritos desde la base de datos (de todos los shards)"""
+        pendientes = []
+        with self._lock:
+            self._pendientes = pendientes
+        self._construir(session, pendientes)
+
+    def _construir(self, session: Session, pendientes: list[tuple[int, int, bool]]) -> None:
+        try:
+            filas = shards.consultar(session, select(Favorito.usuario_id, Favorito.cancion_id))
+        except Exception:
+            with self._lock:
+                if self._pendientes is pendientes:
+                    self._pendientes = None
+                self._listo.notify_all()
+            raise
+        with self._lock:
+            self._listo.notify_all()
+            if self._pendientes is not pendientes:
+                # Se invalidó o empezó otra construcción mientras se leía
+                return
+            favoritos = defaultdict(set)
+            fans = defaultdict(set)
+            for usuario_id, cancion_id in filas:
+                favoritos[usuario_id].add(cancion_id)
+                fans[cancion_id].add(usuario_id)
+            self._favoritos = {u: array("q", sorted(c)) for u, c in favoritos.items()}
+            self._fans = {c: array("q", sorted(u)) for c, u in fans.items()}
+            for usuario_id, cancion_id, presente in pendientes:
+                if presente:
+                    self._poner(usuario_id, cancion_id)
+                else:
+                    self._quitar(usuario_id, cancion_id)
+            self._pendientes = None
+            self._construido = True
+        logger.info(
+            f"Índice de similitud construido con {len(filas)} favoritos "
+            f"y {len(pendientes)} cambios concurrentes"
+        )
+
+    def invalidar(self) -> None:
+        """Descarta el índice; se reconstruye en la siguiente consulta"""
+        with self._lock:
+            self._construido = False
+            self._pendientes = None
+            self._favoritos = {}
+            self._fans = {}
+            self._listo.notify_all()
+
+    def agregar(self, usuario_id: int, cancion_id: int) -> None:
+        """Registra un favorito nuevo"""
+        self._registrar(usuario_id, cancion_id, True)
+
+    def eliminar(self, usuario_id: int, cancion_id: int) -> None:
+        """Quita un favorito"""
+        self._registrar(usuario_id, cancion_id, False)
+
+    def _registrar(self, usuario_id: int, cancion_id: int, presente: bool) -> None:
+        with self._lock:
+            if self._construido:
+                if presente:
+                    self._poner(usuario_id, cancion_id)
+                else:
+                    self._quitar(usuario_id, cancion_id)
+            elif self._pendientes is not None:
+                self._pendientes.append((usuario_id, cancion_id, presente))
+
+    def _poner(self, usuario_id: int, cancion_id: int) -> None:
+        _insertar(self._favoritos.setdefault(usuario_id, array("q")), cancion_id)
+        _insertar(self._fans.setdefault(cancion_id, array("q")), usuario_id)
+
+    def _quitar(self, usuario_id: int, cancion_id: int) -> None:
+        favoritos = self._favoritos.get(usuario_id)
+        if favoritos is not None:
+            _retirar(favoritos, cancion_id)
+            if not favoritos:
+                del self._favoritos[usuario_id]
+        fans = self._fans.get(cancion_id)
+        if fans is not None:
+            _retirar(fans, usuario_id)
+            if not fans:
+                del self._fans[cancion_id]
+
+    @contextmanager
+    def _construido_bloqueado(self, session: Session) -> Iterator[None]:
+        """
+        Entra al lock con el índice construido. Si otra consulta lo está
+        construyendo espera a que termine, y si no hay ninguna en curso (o la
+        que había se descartó) lo construye.
+        """
+        while True:
+            with self._lock:
+                if self._construido:
+                    yield
+                    return
+                if self._pendientes is not None:
+                    self._listo.wait()
+                    continue
+                # Se marca la construcción en curso antes de soltar el lock
+                pendientes = self._pendientes = []
+            self._construir(session, pendientes)
+
+    def comunes(self, session: Session, usuario_a: int, usuario_b: int) -> list[int]:
+        """Retorna los IDs de las canciones favoritas de ambos usuarios"""
+        with self._construido_bloqueado(session):
+            return _interseccion(
+                self._favoritos.get(usuario_a, _VACIO), self._favoritos.get(usuario_b, _VACIO)
+            )
+
+    def similares(
+        self, session: Session, usuario_id: int, limite: int = 10
+    ) -> list[tuple[int, float, int]]:
+        """
+        Retorna hasta `limite` tuplas (usuario_id, jaccard, canciones_comunes)
+        ordenadas por similitud descendente.
+        """
+        with self._construido_bloqueado(session):
+            propio = self._favoritos.get(usuario_id, _VACIO)
+            en_comun = Counter()
+            for cancion_id in propio:
+                en_comun.update(self._fans.get(cancion_id, ()))
+            en_comun.pop(usuario_id, None)
+
+            resultados = []
+            for otro, comunes in en_comun.items():
+                union = len(propio) + len(self._favoritos[otro]) - comunes
+                resultados.append((otro, round(comunes / union, 4), comunes))
+
+        resultados.sort(key=lambda r: (-r[1], -r[2], r[0]))
+        return resultados[:limite]
+
+
+# Instancia compartida por los routers de usuarios y favoritos
+indice_similitud = CacheManager.register_index(SimilarityIndex())
@@ -0,0 +1,33 @@
+"""
+Medición del arranque de la aplicación.
+Registra la duración de cada fase para detectar arranques lentos.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Duración en ms de cada fase del arranque, en orden de ejecución
+tiempos: dict[str, float] = {}
+
+
+def registrar(fase: str, inicio: float) -> None:
+    """Registra la duración de una fase iniciada en `inicio` (time.perf_counter())"""
+    tiempos[fase] = round((time.perf_counter() - inicio) * 1000, 3)
+
+
+@contextmanager
+def medir(fase: str):
+    """Mide la duración del bloque como una fase del arranque"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(fase, inicio)
+
+
+def metricas() -> dict:
+    """Retorna la duración de cada fase y el total"""
+    return {"fases_ms": dict(tiempos), "total_ms": round(sum(tiempos.values()), 3)}
@@ -0,0 +1,213 @@
+"""
+Canciones en tendencia por ventana de tiempo.
+Cuenta los favoritos agregados en la última hora, día y semana con
+contadores en memoria divididos en intervalos (buffer circular), sin
+recorrer la tabla de favoritos en cada consulta.
+"""
+
+import logging
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlmodel import Session, select
+
+from app.cache import CacheManager
+from app.models import Favorito
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+# Duración de cada ventana en segundos
+VENTANAS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+
+# Intervalos por ventana: la ventana avanza de a 1/60 de su duración
+INTERVALOS = 60
+
+
+class VentanaDeslizante:
+    """
+    Contador de favoritos por canción en una ventana de `duracion` segundos.
+
+    La ventana se divide en `intervalos` cubetas de igual ancho guardadas en
+    un buffer circular. Cada cubeta recuerda a qué intervalo pertenece; al
+    reutilizarse para un intervalo nuevo se vacía. La ventana efectiva es la
+    de los últimos `intervalos` intervalos completos más el actual.
+    """
+
+    def __init__(self, duracion: int, intervalos: int = INTERVALOS):
+        self.ancho = duracion / intervalos
+        self.intervalos = intervalos
+        self._cubetas: list[Counter] = [Counter() for _ in range(intervalos)]
+        self._numeros: list[int] = [-1] * intervalos
+
+    def sumar(self, cancion_id: int, momento: float, delta: int, ahora: float) -> None:
+        """Suma delta a la canción en el intervalo de `momento` si sigue dentro de la ventana"""
+        numero = int(momento // self.ancho)
+        if numero <= int(ahora // self.ancho) - self.intervalos:
+            return
+
+        posicion = numero % self.intervalos
+        if self._numeros[posicion] != numero:
+            if self._numeros[posicion] > numero:
+                # La cubeta ya se reutilizó para un intervalo más reciente
+                return
+            self._cubetas[posicion] = Counter()
+            self._numeros[posicion] = numero
+
+        cubeta = self._cubetas[posicion]
+        cubeta[cancion_id] += delta
+        if cubeta[cancion_id] <= 0:
+            del cubeta[cancion_id]
+
+    def contar(self, ahora: float) -> Counter:
+        """Suma las cubetas que siguen dentro de la ventana"""
+        minimo = int(ahora // self.ancho) - self.intervalos
+        total = Counter()
+        for numero, cubeta in zip(self._numeros, self._cubetas, strict=True):
+            if numero > minimo:
+                total.update(cubeta)
+        return total
+
+
+class TrendingIndex:
+    """
+    Contadores de tendencias para todas las ventanas.
+
+    Se construye desde la base de datos (favoritos de la ventana más larga,
+    filtrados por el índice de `fecha_agregado`) en el arranque o en el primer
+    uso, y los handlers de favoritos lo actualizan al agregar y eliminar.
+
+    La lectura de la base de datos se hace sin el lock; los cambios que se
+    registran mientras tanto se guardan y se aplican al terminar. Como un
+    cambio confirmado antes de la lectura ya viene en ella, cada cambio se
+    identifica por (usuario_id, cancion_id) y solo se aplica si cambia la
+    presencia de ese par respecto a la lectura.
+
+    Si una construcción se descarta (por `invalidar` o por otra que empezó
+    después), las consultas que la esperaban vuelven a intentarlo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Avisa a las consultas en espera que terminó una construcción
+        self._listo = threading.Condition(self._lock)
+        self._ventanas: dict[str, VentanaDeslizante] = {}
+        self._construido = False
+        # Cambios recibidos durante una construcción en curso (None si no hay)
+        self._pendientes: Optional[list[tuple]] = None
+
+    def construir(self, session: Session) -> None:
+        """Carga los favoritos de la ventana más larga desde la base de datos"""
+        pendientes = []
+        with self._lock:
+            self._pendientes = pendientes
+        self._construir(session, pendientes)
+
+    def _construir(self, session: Session, pendientes: list[tuple]) -> None:
+        ahora = datetime.now()
+        desde = ahora - timedelta(seconds=max(VENTANAS.values()))
+        try:
+            filas = shards.consultar(
+                session,
+                select(Favorito.usuario_id, Favorito.cancion_id, Favorito.fecha_agregado).where(
+                    Favorito.fecha_agregado >= desde
+                ),
+            )
+        except Exception:
+            with self._lock:
+                if self._pendientes is pendientes:
+                    self._pendientes = None
+                self._listo.notify_all()
+            raise
+
+        ventanas = {nombre: VentanaDeslizante(duracion) for nombre, duracion in VENTANAS.items()}
+        presentes = set()
+        for usuario_id, cancion_id, fecha in filas:
+            self._sumar(ventanas, cancion_id, fecha, 1, ahora)
+            presentes.add((usuario_id, cancion_id))
+
+        with self._lock:
+            self._listo.notify_all()
+            if self._pendientes is not pendientes:
+                # Se invalidó o empezó otra construcción mientras se leía
+                return
+            ahora = datetime.now()
+            for usuario_id, cancion_id, fecha, delta in pendientes:
+                par = (usuario_id, cancion_id)
+                if (delta > 0) == (par in presentes):
+                    continue
+                if delta > 0:
+                    presentes.add(par)
+                else:
+                    presentes.discard(par)
+                self._sumar(ventanas, cancion_id, fecha, delta, ahora)
+            self._ventanas = ventanas
+            self._pendientes = None
+            self._construido = True
+        logger.info(
+            f"Tendencias construidas con {len(filas)} favoritos recientes "
+            f"y {len(pendientes)} cambios concurrentes"
+        )
+
+    def invalidar(self) -> None:
+        """Descarta los contadores; se reconstruyen en la siguiente consulta"""
+        with self._lock:
+            self._construido = False
+            self._pendientes = None
+            self._ventanas = {}
+            self._listo.notify_all()
+
+    def registrar(self, usuario_id: int, cancion_id: int, fecha: datetime, delta: int) -> None:
+        """Suma (+1) o resta (-1) el favorito del usuario agregado en `fecha`"""
+        with self._lock:
+            if self._construido:
+                self._sumar(self._ventanas, cancion_id, fecha, delta, datetime.now())
+            elif self._pendientes is not None:
+                self._pendientes.append((usuario_id, cancion_id, fecha, delta))
+
+    @staticmethod
+    def _sumar(
+        ventanas: dict[str, VentanaDeslizante],
+        cancion_id: int,
+        fecha: datetime,
+        delta: int,
+        ahora: datetime,
+    ) -> None:
+        for ventana in ventanas.values():
+            ventana.sumar(cancion_id, fecha.timestamp(), delta, ahora.timestamp())
+
+    @contextmanager
+    def _construidos(self, session: Session) -> Iterator[None]:
+        """
+        Entra al lock con los contadores construidos. Si otra consulta los
+        está construyendo espera a que termine, y si no hay ninguna en curso
+        (o la que había se descartó) los construye.
+        """
+        while True:
+            with self._lock:
+                if self._construido:
+                    yield
+                    return
+                if self._pendientes is not None:
+                    self._listo.wait()
+                    continue
+                # Se marca la construcción en curso antes de soltar el lock
+                pendientes = self._pendientes = []
+            self._construir(session, pendientes)
+
+    def ranking(
+        self, session: Session, ventana: str, limite: int = 10, ahora: Optional[datetime] = None
+    ) -> list[tuple[int, int]]:
+        """Retorna hasta `limite` pares (cancion_id, favoritos) de mayor a menor"""
+        momento = (ahora or datetime.now()).timestamp()
+        with self._construidos(session):
+            conteo = self._ventanas[ventana].contar(momento)
+        return sorted(conteo.items(), key=lambda par: (-par[1], par[0]))[:limite]
+
+
+# Instancia compartida por los routers de canciones y favoritos
+indice_tendencias = CacheManager.register_index(TrendingIndex())
@@ -0,0 +1,240 @@
+"""
+Vista materializada de los favoritos de cada usuario.
+Guarda en la tabla `favoritosmaterializados` la respuesta de
+GET /api/favoritos/usuario/{id} ya serializada, de modo que la lectura es
+una consulta por clave primaria sin recorrer favoritos ni canciones. Las
+altas y bajas de favoritos aplican su cambio a la fila dentro de su propia
+transacción; los cambios de canciones o usuarios solo la marcan como
+desactualizada y se reconstruye al leerla.
+"""
+
+import json
+import logging
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Optional, Union
+
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+
+from app.access_log import contar_acierto_cache
+from app.models import (
+    Cancion,
+    CancionRead,
+    Favorito,
+    FavoritoConDetalles,
+    FavoritosMaterializados,
+    Usuario,
+)
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+
+def _serializar(elementos: list[dict]) -> bytes:
+    """Serializa la lista igual que JSONResponse"""
+    return json.dumps(elementos, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _elemento(favorito: Favorito, cancion: Union[Cancion, CancionRead]) -> dict:
+    """Elemento de la respuesta para un favorito (con su ID global)"""
+    return FavoritoConDetalles(
+        id=favorito.id,
+        usuario_id=favorito.usuario_id,
+        cancion_id=favorito.cancion_id,
+        fecha_agregado=favorito.fecha_agregado,
+        cancion=CancionRead.model_validate(cancion),
+    ).model_dump(mode="json")
+
+
+class VistaFavoritos:
+    """
+    Mantiene una fila por usuario con sus favoritos detallados en JSON.
+
+    La fila está en la misma base de datos que los favoritos del usuario (su
+    shard) y lleva dos contadores: `version`, que incrementa cada escritura
+    que cambia la lista dentro de su propia transacción (sin commits aparte,
+    se agrupa con el resto del lote), y `version_datos`, la versión con la
+    que se construyó `datos`. Si difieren la fila está desactualizada y la
+    siguiente lectura la reconstruye.
+
+    Agregar o quitar un favorito aplica el cambio a `datos` en la misma
+    transacción (`aplicar`), así que las lecturas siguientes no reconstruyen
+    ni escriben; solo reconstruye la primera lectura de un usuario y la que
+    sigue a un cambio de sus canciones.
+
+    La reconstrucción lee la versión antes de consultar los favoritos y
+    guarda el resultado solo si la versión no cambió, así una escritura
+    concurrente nunca queda tapada por datos anteriores a ella. Las lecturas
+    que encuentran la fila al día no toman locks ni hacen commit.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, session: Session, usuario_id: int) -> Optional[bytes]:
+        """Retorna el JSON de los favoritos del usuario, o None si el usuario no existe"""
+        shard = shards.shard_de(usuario_id)
+        with shards.sesion(session, shard) as sesion_shard:
+            fila = sesion_shard.get(FavoritosMaterializados, usuario_id, populate_existing=True)
+            if fila is not None and fila.version_datos == fila.version:
+                self.hits += 1
+                contar_acierto_cache()
+                return fila.datos
+
+            self.misses += 1
+            if fila is None:
+                if session.get(Usuario, usuario_id) is None:
+                    return None
+                # Fila vacía para que las escrituras concurrentes tengan qué versionar;
+                # si otra lectura la creó antes no se obtiene versión y no se guarda
+                version = sesion_shard.exec(
+                    insert(FavoritosMaterializados)
+                    .values(usuario_id=usuario_id, datos=b"", version=1, version_datos=0)
+                    .on_conflict_do_nothing()
+                    .returning(FavoritosMaterializados.version)
+                ).scalar()
+                sesion_shard.commit()
+            else:
+                version = fila.version
+                if session.get(Usuario, usuario_id) is None:
+                    return None
+
+            datos = _serializar(self._construir(session, sesion_shard, shard, usuario_id))
+            guardada = sesion_shard.exec(
+                update(FavoritosMaterializados)
+                .where(
+                    FavoritosMaterializados.usuario_id == usuario_id,
+                    FavoritosMaterializados.version == version,
+                )
+                .values(datos=datos, version_datos=version, fecha_actualizacion=datetime.now())
+            ).rowcount
+            sesion_shard.commit()
+        if guardada:
+            logger.info(f"Vista de favoritos construida para el usuario {usuario_id}")
+        return datos
+
+    def _construir(
+        self, session: Session, sesion_shard: Session, shard: int, usuario_id: int
+    ) -> list[dict]:
+        """Consulta los favoritos del usuario con sus canciones, ordenados por ID"""
+        if shards.activo:
+            # Los favoritos y las canciones están en archivos distintos: dos consultas
+            favoritos = sesion_shard.exec(
+                select(Favorito).where(Favorito.usuario_id == usuario_id).order_by(Favorito.id)
+            ).all()
+            ids = {favorito.cancion_id for favorito in favoritos}
+            canciones = {c.id: c for c in session.exec(select(Cancion).where(Cancion.id.in_(ids)))}
+            return [
+                _elemento(shards.globalizar(shard, favorito), canciones[favorito.cancion_id])
+                for favorito in favoritos
+                if favorito.cancion_id in canciones
+            ]
+
+        statement = (
+            select(Favorito, Cancion)
+            .where(Favorito.usuario_id == usuario_id, Favorito.cancion_id == Cancion.id)
+            .order_by(Favorito.id)
+        )
+        return [_elemento(favorito, cancion) for favorito, cancion in session.exec(statement)]
+
+    @staticmethod
+    def _desactualizar(*condiciones):
+        """Sentencia que incrementa la versión de las filas que cumplen las condiciones"""
+        return (
+            update(FavoritosMaterializados)
+            .where(*condiciones)
+            .values(version=FavoritosMaterializados.version + 1)
+        )
+
+    def aplicar(
+        self,
+        sesion_shard: Session,
+        usuario_id: int,
+        agregado: Optional[tuple[Favorito, CancionRead]] = None,
+        quitado: Optional[int] = None,
+    ) -> None:
+        """
+        Aplica el alta (`agregado`: favorito con su ID global y su canción) o
+        la baja (`quitado`: ID global) de un favorito a la fila del usuario, en la
+        transacción de la escritura (sesión de su shard, sin commit). Si la
+        fila no existe o ya estaba desactualizada solo sube la versión.
+        """
+        fila = sesion_shard.get(FavoritosMaterializados, usuario_id, populate_existing=True)
+        if fila is None or fila.version_datos != fila.version:
+            self.invalidar(sesion_shard, usuario_id)
+            return
+        elementos = [elemento for elemento in json.loads(fila.datos) if elemento["id"] != quitado]
+        if agregado is not None:
+            elementos.append(_elemento(*agregado))
+            elementos.sort(key=lambda elemento: elemento["id"])
+        version = fila.version + 1
+        sesion_shard.exec(
+            update(FavoritosMaterializados)
+            .where(FavoritosMaterializados.usuario_id == usuario_id)
+            .values(
+                datos=_serializar(elementos),
+                version=version,
+                version_datos=version,
+                fecha_actualizacion=datetime.now(),
+            )
+        )
+
+    def invalidar(self, sesion_shard: Session, usuario_id: int) -> None:
+        """
+        Marca desactualizada la fila del usuario en la transacción de la
+        escritura de sus favoritos (sesión de su shard, sin commit).
+        """
+        sesion_shard.exec(self._desactualizar(FavoritosMaterializados.usuario_id == usuario_id))
+
+    def _invalidar_en_shards(self, session: Session, por_shard: dict[int, list]) -> None:
+        """Aplica las condiciones de cada shard y confirma (tras el commit de la principal)"""
+        for shard, condiciones in por_shard.items():
+            with shards.sesion(session, shard) as sesion_shard:
+                sesion_shard.exec(self._desactualizar(*condiciones))
+                sesion_shard.commit()
+
+    def usuarios_con_cancion(self, session: Session, cancion_id: int) -> set[int]:
+        """Usuarios que tienen la canción en favoritos (en todos los shards)"""
+        statement = select(Favorito.usuario_id).where(Favorito.cancion_id == cancion_id)
+        return set(shards.consultar(session, statement))
+
+    def invalidar_canciones(self, session: Session, cancion_ids: Iterable[int]) -> None:
+        """Marca desactualizadas las filas de los usuarios que tienen las canciones modificadas"""
+        cancion_ids = set(cancion_ids)
+        if not cancion_ids:
+            return
+        usuarios = select(Favorito.usuario_id).where(Favorito.cancion_id.in_(cancion_ids))
+        self._invalidar_en_shards(
+            session,
+            {s: [FavoritosMaterializados.usuario_id.in_(usuarios)] for s in range(shards.n)},
+        )
+
+    def invalidar_usuarios(self, session: Session, usuario_ids: Iterable[int]) -> None:
+        """Marca desactualizadas las filas de esos usuarios; se reconstruyen al leerlas"""
+        por_shard: dict[int, list[int]] = {}
+        for usuario_id in usuario_ids:
+            por_shard.setdefault(shards.shard_de(usuario_id), []).append(usuario_id)
+        self._invalidar_en_shards(
+            session,
+            {s: [FavoritosMaterializados.usuario_id.in_(ids)] for s, ids in por_shard.items()},
+        )
+
+    def invalidar_todo(self, session: Session) -> None:
+        """Marca desactualizadas todas las filas, tras cambios masivos como la deduplicación"""
+        self._invalidar_en_shards(session, {shard: [] for shard in range(shards.n)})
+
+    def metricas(self) -> dict:
+        """Retorna lecturas servidas desde la vista (hits) y las que la construyeron (misses)"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tasa_aciertos": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Instancia compartida por los routers de favoritos, canciones y usuarios
+vista_favoritos = VistaFavoritos()
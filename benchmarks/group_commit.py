@@ -0,0 +1,98 @@
+"""
+Benchmark del commit agrupado de favoritos.
+Compara una transacción por escritura frente al escritor con commit agrupado
+sobre una base de datos SQLite temporal en disco.
+
+Uso: python -m benchmarks.group_commit [--hilos 16] [--operaciones 2000]
+Autor: Jhon Salcedo (@jasl89)
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.group_commit import GroupCommitWriter
+from app.models import Cancion, FavoritoCreate, Usuario
+from app.routers.favoritos import _agregar_favorito
+
+
+def preparar_base_de_datos(ruta: Path, usuarios: int, canciones: int):
+    """Crea la base de datos temporal con usuarios y canciones"""
+    engine = create_engine(f"sqlite:///{ruta}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            Usuario(nombre=f"Usuario {i}", correo=f"usuario{i}@example.com")
+            for i in range(usuarios)
+        )
+        session.add_all(
+            Cancion(titulo=f"Canción {i}", artista="Artista", duracion=200)
+            for i in range(canciones)
+        )
+        session.commit()
+    return engine
+
+
+def ejecutar_concurrente(hilos: int, operaciones: int, escribir) -> float:
+    """Reparte las operaciones entre los hilos y retorna operaciones por segundo"""
+    por_hilo = operaciones // hilos
+
+    def trabajo(indice: int):
+        for i in range(por_hilo):
+            # Cada hilo es un usuario distinto, así no hay favoritos duplicados
+            escribir(FavoritoCreate(usuario_id=indice + 1, cancion_id=i + 1))
+
+    inicio = time.perf_counter()
+    workers = [threading.Thread(target=trabajo, args=(i,)) for i in range(hilos)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return por_hilo * hilos / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--operaciones", type=int, default=2000)
+    parser.add_argument("--max-lote", type=int, default=64)
+    parser.add_argument("--intervalo-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    canciones = args.operaciones // args.hilos + 1
+
+    with tempfile.TemporaryDirectory() as directorio:
+        engine = preparar_base_de_datos(Path(directorio) / "individual.db", args.hilos, canciones)
+
+        def escribir_individual(favorito):
+            with Session(engine) as session:
+                _agregar_favorito(session, favorito)
+                session.commit()
+
+        individual = ejecutar_concurrente(args.hilos, args.operaciones, escribir_individual)
+        engine.dispose()
+
+        engine = preparar_base_de_datos(Path(directorio) / "agrupado.db", args.hilos, canciones)
+        escritor = GroupCommitWriter(engine, args.max_lote, args.intervalo_ms)
+        escritor.iniciar()
+        agrupado = ejecutar_concurrente(
+            args.hilos,
+            args.operaciones,
+            lambda favorito: escritor.ejecutar(lambda s: _agregar_favorito(s, favorito)),
+        )
+        escritor.detener()
+        engine.dispose()
+
+    print(f"Hilos: {args.hilos}, operaciones: {args.operaciones}")
+    print(f"Un commit por escritura: {individual:10.1f} ops/s")
+    print(f"Commit agrupado:         {agrupado:10.1f} ops/s")
+    print(f"Lotes: {escritor.lotes} ({escritor.metricas()['operaciones_por_lote']} ops/lote)")
+    print(f"Mejora: x{agrupado / individual:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Reproducción de tráfico real a partir de los logs de acceso.
+Extrae las peticiones de `logs/app.log` (líneas de acceso de uvicorn o de
+httpx) o de un log de acceso en JSON (una petición por línea), las
+reproduce contra una instancia local y reporta percentiles de latencia y
+tasa de errores por ruta.
+
+Modos:
+    original  respeta los intervalos del log, acelerados x --velocidad
+    abierto   llegadas a --rps constantes sin esperar respuestas (open loop)
+    cerrado   --concurrencia clientes que envían la siguiente petición al
+              recibir la respuesta anterior (closed loop)
+
+En los modos original y abierto la latencia se mide desde el instante en
+que la petición debía salir, así que la espera por falta de concurrencia
+disponible cuenta como latencia (sin omisión coordinada).
+
+Solo se reproducen GET y HEAD: los logs de acceso no guardan el cuerpo de
+las escrituras. Con --escrituras se incluyen las de los logs JSON que sí
+traen el campo `body`.
+
+Uso: python -m benchmarks.replay logs/app.log [--url http://127.0.0.1:8000]
+         [--modo original --velocidad 2] [--modo abierto --rps 200]
+         [--concurrencia 32] [--limite 10000] [--json resultado.json]
+Autor: Jhon Salcedo (@jasl89)
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+METODOS_SEGUROS = ("GET", "HEAD")
+
+# 127.0.0.1:5000 - "GET /api/canciones/?limit=10 HTTP/1.1" 200 OK  (uvicorn)
+ACCESO_UVICORN = re.compile(r'"(?P<metodo>[A-Z]+) (?P<ruta>/\S*) HTTP/[\d.]+" (?P<estado>\d{3})')
+
+# HTTP Request: GET http://testserver/api/usuarios/ "HTTP/1.1 200 OK"  (httpx)
+ACCESO_HTTPX = re.compile(
+    r'HTTP Request: (?P<metodo>[A-Z]+) (?P<url>\S+) "HTTP/[\d.]+ (?P<estado>\d{3})'
+)
+
+# Fecha al inicio de las líneas de app.log (formato de app/logger.py)
+FECHA_LOG = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:[.,]\d+)?)")
+
+# Segmentos numéricos de la ruta que se agrupan como parámetros
+SEGMENTO_ID = re.compile(r"/\d+(?=/|$)")
+
+
+@dataclass
+class Peticion:
+    """Petición extraída del log"""
+
+    metodo: str
+    ruta: str
+    momento: Optional[float] = None  # Segundos desde la época, si el log los trae
+    cuerpo: Any = None
+
+
+@dataclass
+class Resultado:
+    """Resultado de reproducir una petición"""
+
+    plantilla: str
+    estado: Optional[int]  # None si la conexión falló
+    latencia_ms: float
+
+
+def _fecha(valor: Any) -> Optional[float]:
+    """Convierte una fecha ISO, de app.log o epoch a segundos desde la época"""
+    if valor is None:
+        return None
+    if isinstance(valor, int | float):
+        return float(valor)
+    try:
+        return datetime.fromisoformat(str(valor).replace(",", ".")).timestamp()
+    except ValueError:
+        return None
+
+
+def parsear_linea(linea: str) -> Optional[Peticion]:
+    """Extrae la petición de una línea de log; retorna None si no es de acceso"""
+    linea = linea.strip()
+    if linea.startswith("{"):
+        try:
+            datos = json.loads(linea)
+        except json.JSONDecodeError:
+            return None
+        metodo = datos.get("metodo") or datos.get("method")
+        ruta = datos.get("ruta") or datos.get("path")
+        if not metodo or not ruta:
+            return None
+        if datos.get("query"):
+            ruta = f"{ruta}?{datos['query']}"
+        momento = _fecha(datos.get("fecha") or datos.get("timestamp") or datos.get("ts"))
+        return Peticion(metodo.upper(), ruta, momento, datos.get("body"))
+
+    coincidencia = ACCESO_UVICORN.search(linea)
+    if coincidencia:
+        ruta = coincidencia["ruta"]
+    else:
+        coincidencia = ACCESO_HTTPX.search(linea)
+        if not coincidencia:
+            return None
+        url = urlsplit(coincidencia["url"])
+        ruta = url.path + (f"?{url.query}" if url.query else "")
+
+    fecha = FECHA_LOG.match(linea)
+    momento = _fecha(fecha.group(1)) if fecha else None
+    return Peticion(coincidencia["metodo"], ruta, momento)
+
+
+def cargar_workload(archivos: list[Path], escrituras: bool = False) -> list[Peticion]:
+    """Lee los archivos de log y retorna las peticiones reproducibles en orden"""
+    peticiones = []
+    for archivo in archivos:
+        with archivo.open(encoding="utf-8", errors="replace") as lineas:
+            for linea in lineas:
+                peticion = parsear_linea(linea)
+                if peticion is None:
+                    continue
+                if peticion.metodo in METODOS_SEGUROS or (escrituras and peticion.cuerpo):
+                    peticiones.append(peticion)
+    if all(peticion.momento is not None for peticion in peticiones):
+        peticiones.sort(key=lambda peticion: peticion.momento)
+    return peticiones
+
+
+def plantilla_ruta(ruta: str) -> str:
+    """Agrupa rutas por plantilla: sin query string y con los IDs como {id}"""
+    return SEGMENTO_ID.sub("/{id}", urlsplit(ruta).path)
+
+
+def percentil(valores: list[float], p: float) -> float:
+    """Percentil p (0-100) por el método del rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    rango = math.ceil(p / 100 * len(ordenados))
+    return ordenados[min(max(rango, 1), len(ordenados)) - 1]
+
+
+def programar(
+    peticiones: list[Peticion], modo: str, velocidad: float = 1, rps: float = 0
+) -> list[Optional[float]]:
+    """
+    Segundos desde el inicio en que debe salir cada petición, o None para
+    enviarla en cuanto haya un cliente libre (modo cerrado).
+    """
+    if modo == "cerrado":
+        return [None] * len(peticiones)
+    if modo == "abierto":
+        if rps <= 0:
+            raise ValueError("El modo abierto requiere --rps mayor que 0")
+        return [i / rps for i in range(len(peticiones))]
+    if any(peticion.momento is None for peticion in peticiones):
+        raise ValueError("El modo original requiere un log con fecha en cada petición")
+    inicio = peticiones[0].momento if peticiones else 0
+    return [(peticion.momento - inicio) / velocidad for peticion in peticiones]
+
+
+async def reproducir(
+    peticiones: list[Peticion],
+    cliente: httpx.AsyncClient,
+    modo: str = "cerrado",
+    velocidad: float = 1,
+    rps: float = 0,
+    concurrencia: int = 32,
+) -> list[Resultado]:
+    """Envía las peticiones según el modo y retorna el resultado de cada una"""
+    horario = programar(peticiones, modo, velocidad, rps)
+    limite = asyncio.Semaphore(concurrencia)
+    reloj = asyncio.get_running_loop().time
+    inicio = reloj()
+
+    async def enviar(peticion: Peticion, salida: Optional[float]) -> Resultado:
+        if salida is not None:
+            await asyncio.sleep(max(0.0, inicio + salida - reloj()))
+        async with limite:
+            desde = reloj() if salida is None else inicio + salida
+            try:
+                respuesta = await cliente.request(
+                    peticion.metodo, peticion.ruta, json=peticion.cuerpo
+                )
+                estado = respuesta.status_code
+            except httpx.HTTPError:
+                estado = None
+            return Resultado(plantilla_ruta(peticion.ruta), estado, (reloj() - desde) * 1000)
+
+    return await asyncio.gather(
+        *(enviar(peticion, salida) for peticion, salida in zip(peticiones, horario, strict=True))
+    )
+
+
+def resumir(resultados: list[Resultado], segundos: float) -> dict[str, dict]:
+    """Agrega los resultados por plantilla de ruta"""
+    por_ruta: dict[str, list[Resultado]] = defaultdict(list)
+    for resultado in resultados:
+        por_ruta[resultado.plantilla].append(resultado)
+        por_ruta["TOTAL"].append(resultado)
+
+    resumen = {}
+    for plantilla, grupo in sorted(por_ruta.items(), key=lambda par: -len(par[1])):
+        latencias = [resultado.latencia_ms for resultado in grupo]
+        errores = sum(1 for r in grupo if r.estado is None or r.estado >= 500)
+        resumen[plantilla] = {
+            "peticiones": len(grupo),
+            "rps": round(len(grupo) / segundos, 1) if segundos else 0.0,
+            "p50_ms": round(percentil(latencias, 50), 2),
+            "p90_ms": round(percentil(latencias, 90), 2),
+            "p99_ms": round(percentil(latencias, 99), 2),
+            "max_ms": round(max(latencias), 2),
+            "4xx": sum(1 for r in grupo if r.estado is not None and 400 <= r.estado < 500),
+            "errores": errores,
+            "tasa_errores": round(errores / len(grupo), 4),
+        }
+    return resumen
+
+
+def imprimir(resumen: dict[str, dict]) -> None:
+    """Imprime el resumen como tabla"""
+    print(
+        f"{'Ruta':<45} {'Peticiones':>10} {'RPS':>8} {'p50 ms':>8} {'p90 ms':>8} "
+        f"{'p99 ms':>8} {'max ms':>8} {'4xx':>6} {'Errores':>8}"
+    )
+    for plantilla, datos in resumen.items():
+        print(
+            f"{plantilla:<45} {datos['peticiones']:>10} {datos['rps']:>8} "
+            f"{datos['p50_ms']:>8} {datos['p90_ms']:>8} {datos['p99_ms']:>8} "
+            f"{datos['max_ms']:>8} {datos['4xx']:>6} {datos['tasa_errores']:>8.2%}"
+        )
+
+
+async def ejecutar(args: argparse.Namespace, peticiones: list[Peticion]) -> dict[str, dict]:
+    """Reproduce el workload contra args.url y retorna el resumen"""
+    limites = httpx.Limits(max_connections=args.concurrencia)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout, limits=limites
+    ) as cliente:
+        inicio = time.perf_counter()
+        resultados = await reproducir(
+            peticiones, cliente, args.modo, args.velocidad, args.rps, args.concurrencia
+        )
+        segundos = time.perf_counter() - inicio
+    print(f"{len(resultados)} peticiones en {segundos:.2f} s (modo {args.modo})")
+    return resumir(resultados, segundos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("logs", type=Path, nargs="+", help="Archivos de log a reproducir")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--modo", choices=["original", "abierto", "cerrado"], default="original")
+    parser.add_argument(
+        "--velocidad", type=float, default=1, help="Multiplicador del modo original"
+    )
+    parser.add_argument("--rps", type=float, default=0, help="Peticiones por segundo (abierto)")
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--limite", type=int, default=0, help="Máximo de peticiones (0 = todas)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--escrituras", action="store_true", help="Incluir escrituras con cuerpo")
+    parser.add_argument("--json", type=Path, help="Guardar el resumen en un archivo JSON")
+    args = parser.parse_args()
+
+    peticiones = cargar_workload(args.logs, args.escrituras)
+    if args.limite:
+        peticiones = peticiones[: args.limite]
+    if not peticiones:
+        parser.error("No se encontraron peticiones reproducibles en los logs")
+
+    try:
+        resumen = asyncio.run(ejecutar(args, peticiones))
+    except ValueError as exc:
+        parser.error(str(exc))
+    imprimir(resumen)
+    if args.json:
+        args.json.write_text(json.dumps(resumen, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,35 @@
 
 const API_BASE_URL = 'http://localhost:8081/api';
 
+// Número de registros que se piden por página al hacer scroll
+const TAMANO_PAGINA = 50;
+
+// Sugerencias por búsqueda y espera tras la última tecla antes de pedirlas
+const LIMITE_SUGERENCIAS = 20;
+const ESPERA_BUSQUEDA_MS = 250;
+
+// Caché del cliente: entidades ya cargadas y estado de paginación por recurso.
+// Las altas y bajas actualizan este estado y solo las filas afectadas del DOM,
+// sin volver a pedir las listas completas. `generacion` cambia al recargar,
+// para descartar las páginas que se pidieron antes, y `observer` es el único
+// IntersectionObserver de la lista.
+const estado = {
+    usuarios: { items: new Map(), skip: 0, agotado: false, cargando: false, generacion: 0, observer: null },
+    canciones: { items: new Map(), skip: 0, agotado: false, cargando: false, generacion: 0, observer: null },
+    favoritosPorUsuario: new Map(),
+    // IDs encontrados por la búsqueda del catálogo, o null sin búsqueda activa
+    filtroCanciones: null,
+    totales: { usuarios: 0, canciones: 0, favoritos: 0 },
+};
+
 // =============================================================================
 // FUNCIONES DE UTILIDAD
 // =============================================================================
 
 /**
- * Realiza una petición HTTP a la API
+ * Realiza una petición HTTP a la API y retorna el estado y el cuerpo
  */
-async function apiRequest(endpoint, method = 'GET', data = null) {
+async function peticionApi(endpoint, method = 'GET', data = null) {
     const options = {
         method: method,
         headers: {
@@ -35,10 +56,10 @@ async function apiRequest(endpoint, method = 'GET', data = null) {
 
         // Si es DELETE, no hay contenido que parsear
         if (method === 'DELETE') {
-            return { success: true };
+            return { estado: response.status, datos: { success: true } };
         }
 
-        return await response.json();
+        return { estado: response.status, datos: await response.json() };
     } catch (error) {
         console.error('Error en la petición:', error);
         mostrarAlerta(error.message, 'danger');
@@ -46,6 +67,13 @@ async function apiRequest(endpoint, method = 'GET', data = null) {
     }
 }
 
+/**
+ * Realiza una petición HTTP a la API y retorna solo el cuerpo
+ */
+async function apiRequest(endpoint, method = 'GET', data = null) {
+    return (await peticionApi(endpoint, method, data)).datos;
+}
+
 /**
  * Muestra un mensaje de alerta temporal
  */
@@ -75,45 +103,278 @@ function formatearDuracion(segundos) {
 }
 
 // =============================================================================
-// GESTIÓN DE USUARIOS
+// RENDERIZADO INCREMENTAL
 // =============================================================================
 
-async function cargarUsuarios() {
-    try {
-        const usuarios = await apiRequest('/usuarios/');
+/**
+ * Crea un elemento del DOM a partir de un fragmento HTML
+ */
+function crearElemento(html) {
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    return template.content.firstElementChild;
+}
 
-        // Actualizar estadística
-        document.getElementById('total-usuarios').textContent = usuarios.length;
+/**
+ * Inserta o actualiza la fila con el id dado.
+ * Si la fila ya existe y no cambió, el DOM no se toca.
+ */
+function sincronizarFila(lista, id, html, alInicio = false) {
+    const nueva = crearElemento(html);
+    const existente = lista.querySelector(`:scope > [data-id="${id}"]`);
+
+    if (existente) {
+        if (!existente.isEqualNode(nueva)) {
+            existente.replaceWith(nueva);
+        }
+        return;
+    }
+
+    lista.querySelector(':scope > .fila-vacia')?.remove();
+    if (alInicio) {
+        lista.prepend(nueva);
+    } else {
+        lista.insertBefore(nueva, lista.querySelector(':scope > .centinela'));
+    }
+}
+
+/**
+ * Elimina la fila con el id dado y muestra el mensaje de lista vacía si corresponde
+ */
+function eliminarFila(lista, id, mensajeVacio) {
+    lista.querySelector(`:scope > [data-id="${id}"]`)?.remove();
+    if (!lista.querySelector(':scope > [data-id]')) {
+        mostrarListaVacia(lista, mensajeVacio);
+    }
+}
+
+function mostrarListaVacia(lista, mensaje) {
+    if (!lista.querySelector(':scope > .fila-vacia')) {
+        lista.prepend(crearElemento(
+            `<li class="list-group-item text-center text-muted fila-vacia">${mensaje}</li>`
+        ));
+    }
+}
+
+/**
+ * Inserta o actualiza una opción de un <select> sin reconstruirlo
+ */
+function sincronizarOpcion(select, id, texto) {
+    const existente = select.querySelector(`option[value="${id}"]`);
+    if (existente) {
+        existente.textContent = texto;
+        return;
+    }
+    const opcion = document.createElement('option');
+    opcion.value = id;
+    opcion.textContent = texto;
+    select.appendChild(opcion);
+}
+
+function eliminarOpcion(select, id) {
+    select.querySelector(`option[value="${id}"]`)?.remove();
+}
+
+/**
+ * Reemplaza las opciones de un <select> por los resultados de una búsqueda,
+ * conservando el marcador inicial y la opción seleccionada
+ */
+function reemplazarOpciones(select, resultados) {
+    select.querySelectorAll('option').forEach(opcion => {
+        if (opcion.value && opcion.value !== select.value) {
+            opcion.remove();
+        }
+    });
+    resultados.forEach(({ id, texto }) => sincronizarOpcion(select, id, texto));
+}
+
+/**
+ * Llama a `accion(texto)` cuando el usuario deja de escribir en el campo.
+ * Las respuestas de búsquedas anteriores a la última se descartan.
+ */
+function escucharBusqueda(input, accion) {
+    let temporizador = null;
+    let ultima = 0;
+    input.addEventListener('input', () => {
+        clearTimeout(temporizador);
+        temporizador = setTimeout(async () => {
+            const numero = ++ultima;
+            const texto = input.value.trim();
+            try {
+                await accion(texto, () => numero === ultima);
+            } catch (error) {
+                console.error('Error en la búsqueda:', error);
+            }
+        }, ESPERA_BUSQUEDA_MS);
+    });
+}
+
+/**
+ * Llena un selector con los resultados de `buscar` según lo escrito en el
+ * campo de búsqueda, para poder elegir cualquier registro y no solo los
+ * de las páginas ya cargadas en las listas
+ */
+function configurarSelectorConBusqueda(input, select, buscar) {
+    escucharBusqueda(input, async (texto, vigente) => {
+        const resultados = texto ? await buscar(texto) : [];
+        if (vigente()) {
+            reemplazarOpciones(select, resultados);
+        }
+    });
+}
+
+async function buscarUsuarios(texto) {
+    const prefijo = encodeURIComponent(texto);
+    const usuarios = await apiRequest(
+        `/usuarios/autocompletar?prefijo=${prefijo}&limite=${LIMITE_SUGERENCIAS}`
+    );
+    return usuarios.map(usuario => ({ id: usuario.id, texto: `${usuario.nombre} (${usuario.correo})` }));
+}
+
+/**
+ * Busca canciones por inicio del título o del artista (índice de
+ * autocompletado del servidor) y une ambos resultados sin repetir
+ */
+async function buscarSugerenciasCanciones(texto) {
+    const prefijo = encodeURIComponent(texto);
+    const porCampo = await Promise.all(['titulo', 'artista'].map(campo =>
+        apiRequest(`/canciones/autocompletar?campo=${campo}&prefijo=${prefijo}&limite=${LIMITE_SUGERENCIAS}`)
+    ));
+    const sugerencias = new Map();
+    porCampo.flat().forEach(cancion => sugerencias.set(cancion.id, cancion));
+    return [...sugerencias.values()];
+}
+
+async function buscarCanciones(texto) {
+    const canciones = await buscarSugerenciasCanciones(texto);
+    return canciones.map(cancion => ({ id: cancion.id, texto: `${cancion.titulo} - ${cancion.artista}` }));
+}
 
-        // Actualizar lista de usuarios
-        const listaUsuarios = document.getElementById('lista-usuarios');
-        if (usuarios.length === 0) {
-            listaUsuarios.innerHTML = '<li class="list-group-item text-center text-muted">No hay usuarios registrados</li>';
+/**
+ * Prepara una lista para carga paginada: vacía la lista y su paginación,
+ * deja un centinela al final y pide la siguiente página cuando el centinela
+ * entra en la zona visible. El observer anterior de la lista se desconecta.
+ */
+function configurarScrollInfinito(lista, pagina, cargarSiguientePagina) {
+    pagina.observer?.disconnect();
+    pagina.items.clear();
+    pagina.skip = 0;
+    pagina.agotado = false;
+    pagina.cargando = false;
+    pagina.generacion += 1;
+
+    lista.innerHTML = '<li class="centinela" style="list-style: none; height: 1px;"></li>';
+    const centinela = lista.querySelector('.centinela');
+
+    const observer = new IntersectionObserver(async (entradas) => {
+        if (!entradas.some(entrada => entrada.isIntersecting)) {
             return;
         }
+        await cargarSiguientePagina();
 
-        listaUsuarios.innerHTML = usuarios.map(usuario => `
-            <li class="list-group-item d-flex justify-content-between align-items-center">
-                <div>
-                    <strong>${usuario.nombre}</strong><br>
-                    <small class="text-muted">
-                        <i class="fas fa-envelope"></i> ${usuario.correo}
-                    </small><br>
-                    <small class="text-muted">
-                        <i class="fas fa-calendar"></i> ${new Date(usuario.fecha_registro).toLocaleDateString('es-ES')}
-                    </small>
-                </div>
-                <button class="btn btn-sm btn-outline-danger" onclick="eliminarUsuario(${usuario.id})">
-                    <i class="fas fa-trash"></i>
-                </button>
-            </li>
-        `).join('');
+        // Volver a observar para pedir otra página si el centinela sigue visible
+        if (!pagina.agotado) {
+            observer.unobserve(centinela);
+            observer.observe(centinela);
+        }
+    }, { root: lista.parentElement, rootMargin: '200px' });
+
+    pagina.observer = observer;
+    observer.observe(centinela);
+}
+
+// =============================================================================
+// TOTALES
+// =============================================================================
+
+/**
+ * Obtiene los totales del catálogo del endpoint de estadísticas
+ * (una sola consulta agregada y cacheada en el servidor)
+ */
+async function cargarTotales() {
+    try {
+        const estadisticas = await apiRequest('/estadisticas/');
+        estado.totales = {
+            usuarios: estadisticas.totales.usuarios,
+            canciones: estadisticas.totales.canciones,
+            favoritos: estadisticas.totales.favoritos,
+        };
+        mostrarTotales();
+    } catch (error) {
+        console.error('Error al cargar totales:', error);
+    }
+}
+
+function ajustarTotal(recurso, delta) {
+    estado.totales[recurso] += delta;
+    mostrarTotales();
+}
+
+function mostrarTotales() {
+    document.getElementById('total-usuarios').textContent = estado.totales.usuarios;
+    document.getElementById('total-canciones').textContent = estado.totales.canciones;
+    document.getElementById('total-favoritos').textContent = estado.totales.favoritos;
+}
+
+// =============================================================================
+// GESTIÓN DE USUARIOS
+// =============================================================================
+
+function renderUsuario(usuario) {
+    return `
+        <li class="list-group-item d-flex justify-content-between align-items-center fila-virtual" data-id="${usuario.id}">
+            <div>
+                <strong>${usuario.nombre}</strong><br>
+                <small class="text-muted">
+                    <i class="fas fa-envelope"></i> ${usuario.correo}
+                </small><br>
+                <small class="text-muted">
+                    <i class="fas fa-calendar"></i> ${new Date(usuario.fecha_registro).toLocaleDateString('es-ES')}
+                </small>
+            </div>
+            <button class="btn btn-sm btn-outline-danger" onclick="eliminarUsuario(${usuario.id})">
+                <i class="fas fa-trash"></i>
+            </button>
+        </li>
+    `;
+}
+
+/**
+ * Muestra un usuario en la lista
+ */
+function mostrarUsuario(usuario, alInicio = false) {
+    estado.usuarios.items.set(usuario.id, usuario);
+    sincronizarFila(document.getElementById('lista-usuarios'), usuario.id, renderUsuario(usuario), alInicio);
+}
+
+async function cargarUsuarios() {
+    const pagina = estado.usuarios;
+    if (pagina.cargando || pagina.agotado) {
+        return;
+    }
+
+    const generacion = pagina.generacion;
+    pagina.cargando = true;
+    try {
+        const usuarios = await apiRequest(`/usuarios/?skip=${pagina.skip}&limit=${TAMANO_PAGINA}`);
+        if (generacion !== pagina.generacion) {
+            // La lista se recargó mientras llegaba esta página
+            return;
+        }
+        pagina.skip += usuarios.length;
+        pagina.agotado = usuarios.length < TAMANO_PAGINA;
 
-        // Actualizar selectores de favoritos
-        actualizarSelectoresUsuarios(usuarios);
+        usuarios.forEach(usuario => mostrarUsuario(usuario));
 
+        if (pagina.agotado && estado.usuarios.items.size === 0) {
+            mostrarListaVacia(document.getElementById('lista-usuarios'), 'No hay usuarios registrados');
+        }
     } catch (error) {
         console.error('Error al cargar usuarios:', error);
+    } finally {
+        if (generacion === pagina.generacion) {
+            pagina.cargando = false;
+        }
     }
 }
 
@@ -124,14 +385,15 @@ async function crearUsuario(event) {
     const correo = document.getElementById('usuario-correo').value;
 
     try {
-        await apiRequest('/usuarios/', 'POST', { nombre, correo });
+        const usuario = await apiRequest('/usuarios/', 'POST', { nombre, correo });
         mostrarAlerta('Usuario registrado exitosamente', 'success');
 
         // Limpiar formulario
         document.getElementById('form-usuario').reset();
 
-        // Recargar lista
-        await cargarUsuarios();
+        // Mostrar solo el usuario nuevo
+        mostrarUsuario(usuario, true);
+        ajustarTotal('usuarios', 1);
     } catch (error) {
         console.error('Error al crear usuario:', error);
     }
@@ -145,69 +407,94 @@ async function eliminarUsuario(id) {
     try {
         await apiRequest(`/usuarios/${id}`, 'DELETE');
         mostrarAlerta('Usuario eliminado exitosamente', 'info');
-        await cargarUsuarios();
+
+        if (estado.usuarios.items.delete(id)) {
+            estado.usuarios.skip -= 1;
+        }
+        estado.favoritosPorUsuario.delete(id);
+        eliminarFila(document.getElementById('lista-usuarios'), id, 'No hay usuarios registrados');
+        eliminarOpcion(document.getElementById('favorito-usuario'), id);
+
+        const selectVerFavoritos = document.getElementById('ver-favoritos-usuario');
+        const estabaSeleccionado = selectVerFavoritos.value == id;
+        eliminarOpcion(selectVerFavoritos, id);
+        if (estabaSeleccionado) {
+            await cargarFavoritosUsuario();
+        }
+
+        // Sus favoritos también se eliminaron: refrescar los totales agregados
+        await cargarTotales();
     } catch (error) {
         console.error('Error al eliminar usuario:', error);
     }
 }
 
-function actualizarSelectoresUsuarios(usuarios) {
-    const selectFavorito = document.getElementById('favorito-usuario');
-    const selectVerFavoritos = document.getElementById('ver-favoritos-usuario');
-
-    const opciones = usuarios.map(u =>
-        `<option value="${u.id}">${u.nombre} (${u.correo})</option>`
-    ).join('');
-
-    selectFavorito.innerHTML = '<option value="">Seleccione un usuario...</option>' + opciones;
-    selectVerFavoritos.innerHTML = '<option value="">Seleccione un usuario...</option>' + opciones;
-}
-
 // =============================================================================
 // GESTIÓN DE CANCIONES
 // =============================================================================
 
-async function cargarCanciones() {
-    try {
-        const canciones = await apiRequest('/canciones/');
+function renderCancion(cancion) {
+    return `
+        <li class="list-group-item cancion-item fila-virtual" data-id="${cancion.id}" data-titulo="${cancion.titulo}" data-artista="${cancion.artista}">
+            <div class="d-flex justify-content-between align-items-start">
+                <div class="flex-grow-1">
+                    <h6 class="mb-1"><i class="fas fa-music"></i> ${cancion.titulo}</h6>
+                    <p class="mb-1"><strong>Artista:</strong> ${cancion.artista}</p>
+                    ${cancion.album ? `<p class="mb-1"><small><strong>Álbum:</strong> ${cancion.album}</small></p>` : ''}
+                    <div class="d-flex gap-2 flex-wrap">
+                        <span class="badge badge-custom">
+                            <i class="fas fa-clock"></i> ${formatearDuracion(cancion.duracion)}
+                        </span>
+                        ${cancion.año ? `<span class="badge badge-custom"><i class="fas fa-calendar"></i> ${cancion.año}</span>` : ''}
+                        ${cancion.genero ? `<span class="badge badge-custom"><i class="fas fa-guitar"></i> ${cancion.genero}</span>` : ''}
+                    </div>
+                </div>
+                <button class="btn btn-sm btn-outline-danger" onclick="eliminarCancion(${cancion.id})">
+                    <i class="fas fa-trash"></i>
+                </button>
+            </div>
+        </li>
+    `;
+}
 
-        // Actualizar estadística
-        document.getElementById('total-canciones').textContent = canciones.length;
+/**
+ * Muestra una canción en el catálogo
+ */
+function mostrarCancion(cancion, alInicio = false) {
+    estado.canciones.items.set(cancion.id, cancion);
+    const lista = document.getElementById('lista-canciones');
+    sincronizarFila(lista, cancion.id, renderCancion(cancion), alInicio);
+    aplicarFiltroCanciones(lista.querySelector(`:scope > [data-id="${cancion.id}"]`));
+}
+
+async function cargarCanciones() {
+    const pagina = estado.canciones;
+    if (pagina.cargando || pagina.agotado) {
+        return;
+    }
 
-        // Actualizar lista de canciones
-        const listaCanciones = document.getElementById('lista-canciones');
-        if (canciones.length === 0) {
-            listaCanciones.innerHTML = '<li class="list-group-item text-center text-muted">No hay canciones en el catálogo</li>';
+    const generacion = pagina.generacion;
+    pagina.cargando = true;
+    try {
+        const canciones = await apiRequest(`/canciones/?skip=${pagina.skip}&limit=${TAMANO_PAGINA}`);
+        if (generacion !== pagina.generacion) {
+            // La lista se recargó mientras llegaba esta página
             return;
         }
+        pagina.skip += canciones.length;
+        pagina.agotado = canciones.length < TAMANO_PAGINA;
 
-        listaCanciones.innerHTML = canciones.map(cancion => `
-            <li class="list-group-item cancion-item" data-titulo="${cancion.titulo}" data-artista="${cancion.artista}">
-                <div class="d-flex justify-content-between align-items-start">
-                    <div class="flex-grow-1">
-                        <h6 class="mb-1"><i class="fas fa-music"></i> ${cancion.titulo}</h6>
-                        <p class="mb-1"><strong>Artista:</strong> ${cancion.artista}</p>
-                        ${cancion.album ? `<p class="mb-1"><small><strong>Álbum:</strong> ${cancion.album}</small></p>` : ''}
-                        <div class="d-flex gap-2 flex-wrap">
-                            <span class="badge badge-custom">
-                                <i class="fas fa-clock"></i> ${formatearDuracion(cancion.duracion)}
-                            </span>
-                            ${cancion.año ? `<span class="badge badge-custom"><i class="fas fa-calendar"></i> ${cancion.año}</span>` : ''}
-                            ${cancion.genero ? `<span class="badge badge-custom"><i class="fas fa-guitar"></i> ${cancion.genero}</span>` : ''}
-                        </div>
-                    </div>
-                    <button class="btn btn-sm btn-outline-danger" onclick="eliminarCancion(${cancion.id})">
-                        <i class="fas fa-trash"></i>
-                    </button>
-                </div>
-            </li>
-        `).join('');
-
-        // Actualizar selector de favoritos
-        actualizarSelectorCanciones(canciones);
+        canciones.forEach(cancion => mostrarCancion(cancion));
 
+        if (pagina.agotado && estado.canciones.items.size === 0) {
+            mostrarListaVacia(document.getElementById('lista-canciones'), 'No hay canciones en el catálogo');
+        }
     } catch (error) {
         console.error('Error al cargar canciones:', error);
+    } finally {
+        if (generacion === pagina.generacion) {
+            pagina.cargando = false;
+        }
     }
 }
 
@@ -222,16 +509,24 @@ async function crearCancion(event) {
     const genero = document.getElementById('cancion-genero').value || null;
 
     try {
-        await apiRequest('/canciones/', 'POST', {
+        const { estado: codigo, datos: cancion } = await peticionApi('/canciones/', 'POST', {
             titulo, artista, album, duracion, año, genero
         });
-        mostrarAlerta('Canción agregada exitosamente', 'success');
 
         // Limpiar formulario
         document.getElementById('form-cancion').reset();
 
-        // Recargar lista
-        await cargarCanciones();
+        // Con la política `merge` un duplicado responde 200 con la canción existente
+        if (codigo === 201) {
+            mostrarAlerta('Canción agregada exitosamente', 'success');
+            mostrarCancion(cancion, true);
+            ajustarTotal('canciones', 1);
+        } else {
+            mostrarAlerta('La canción ya existía: se completaron sus datos', 'info');
+            if (estado.canciones.items.has(cancion.id)) {
+                mostrarCancion(cancion);
+            }
+        }
     } catch (error) {
         console.error('Error al crear canción:', error);
     }
@@ -245,57 +540,101 @@ async function eliminarCancion(id) {
     try {
         await apiRequest(`/canciones/${id}`, 'DELETE');
         mostrarAlerta('Canción eliminada exitosamente', 'info');
-        await cargarCanciones();
+
+        if (estado.canciones.items.delete(id)) {
+            estado.canciones.skip -= 1;
+        }
+        eliminarFila(document.getElementById('lista-canciones'), id, 'No hay canciones en el catálogo');
+        eliminarOpcion(document.getElementById('favorito-cancion'), id);
+
+        // La canción pudo estar en los favoritos de cualquier usuario
+        estado.favoritosPorUsuario.clear();
+        await cargarFavoritosUsuario();
+        await cargarTotales();
     } catch (error) {
         console.error('Error al eliminar canción:', error);
     }
 }
 
-function actualizarSelectorCanciones(canciones) {
-    const selectCancion = document.getElementById('favorito-cancion');
-
-    const opciones = canciones.map(c =>
-        `<option value="${c.id}">${c.titulo} - ${c.artista}</option>`
-    ).join('');
-
-    selectCancion.innerHTML = '<option value="">Seleccione una canción...</option>' + opciones;
+/**
+ * Oculta la fila si hay una búsqueda activa y la canción no está en sus resultados
+ */
+function aplicarFiltroCanciones(cancion) {
+    if (!cancion) {
+        return;
+    }
+    const visible = !estado.filtroCanciones || estado.filtroCanciones.has(Number(cancion.dataset.id));
+    cancion.style.display = visible ? '' : 'none';
 }
 
-// Filtro de búsqueda para canciones
-document.getElementById('filtro-canciones')?.addEventListener('input', (e) => {
-    const filtro = e.target.value.toLowerCase();
-    const canciones = document.querySelectorAll('.cancion-item');
-
-    canciones.forEach(cancion => {
-        const titulo = cancion.dataset.titulo.toLowerCase();
-        const artista = cancion.dataset.artista.toLowerCase();
-
-        if (titulo.includes(filtro) || artista.includes(filtro)) {
-            cancion.style.display = '';
-        } else {
-            cancion.style.display = 'none';
+/**
+ * Filtra el catálogo con la búsqueda del servidor, no solo entre las filas
+ * ya cargadas: las canciones encontradas que aún no estaban en la lista se
+ * piden por ID y se agregan (el scroll infinito las actualiza al llegar a ellas)
+ */
+async function filtrarCanciones(texto, vigente) {
+    let encontradas = null;
+    if (texto) {
+        const sugerencias = await buscarSugerenciasCanciones(texto);
+        encontradas = new Set(sugerencias.map(cancion => cancion.id));
+        const lista = document.getElementById('lista-canciones');
+        const faltantes = [...encontradas].filter(id => !lista.querySelector(`:scope > [data-id="${id}"]`));
+        if (faltantes.length > 0) {
+            // Solo se agregan al DOM: no cuentan en la paginación del scroll infinito
+            const canciones = await apiRequest(`/canciones/?ids=${faltantes.join(',')}`);
+            if (!vigente()) {
+                return;
+            }
+            canciones.forEach(cancion => sincronizarFila(lista, cancion.id, renderCancion(cancion)));
         }
-    });
-});
+    }
+    if (vigente()) {
+        estado.filtroCanciones = encontradas;
+        document.querySelectorAll('.cancion-item').forEach(aplicarFiltroCanciones);
+    }
+}
 
 // =============================================================================
 // GESTIÓN DE FAVORITOS
 // =============================================================================
 
-async function cargarFavoritos() {
-    try {
-        const favoritos = await apiRequest('/favoritos/');
-
-        // Actualizar estadística
-        document.getElementById('total-favoritos').textContent = favoritos.length;
+function renderFavorito(fav) {
+    return `
+        <li class="list-group-item fila-virtual" data-id="${fav.id}">
+            <div class="d-flex justify-content-between align-items-start">
+                <div class="flex-grow-1">
+                    <h6 class="mb-1">
+                        <i class="fas fa-heart text-danger"></i> ${fav.cancion.titulo}
+                    </h6>
+                    <p class="mb-1"><strong>Artista:</strong> ${fav.cancion.artista}</p>
+                    <div class="d-flex gap-2 flex-wrap">
+                        <span class="badge badge-custom">
+                            <i class="fas fa-clock"></i> ${formatearDuracion(fav.cancion.duracion)}
+                        </span>
+                        ${fav.cancion.genero ? `<span class="badge badge-custom"><i class="fas fa-guitar"></i> ${fav.cancion.genero}</span>` : ''}
+                    </div>
+                    <small class="text-muted">
+                        <i class="fas fa-calendar-plus"></i> Agregado: ${new Date(fav.fecha_agregado).toLocaleDateString('es-ES')}
+                    </small>
+                </div>
+                <button class="btn btn-sm btn-outline-danger" onclick="eliminarFavorito(${fav.id}, ${fav.usuario_id})">
+                    <i class="fas fa-heart-broken"></i>
+                </button>
+            </div>
+        </li>
+    `;
+}
 
-    } catch (error) {
-        console.error('Error al cargar favoritos:', error);
-    }
+function mostrarSinFavoritos(container) {
+    container.innerHTML = `
+        <div class="alert alert-custom">
+            <i class="fas fa-heart-broken"></i> Este usuario no tiene canciones favoritas aún
+        </div>
+    `;
 }
 
 async function cargarFavoritosUsuario() {
-    const usuarioId = document.getElementById('ver-favoritos-usuario').value;
+    const usuarioId = parseInt(document.getElementById('ver-favoritos-usuario').value);
     const container = document.getElementById('lista-favoritos-container');
 
     if (!usuarioId) {
@@ -308,45 +647,31 @@ async function cargarFavoritosUsuario() {
     }
 
     try {
-        const favoritos = await apiRequest(`/favoritos/usuario/${usuarioId}`);
+        // Reutilizar los favoritos ya cargados de este usuario
+        let favoritos = estado.favoritosPorUsuario.get(usuarioId);
+        if (!favoritos) {
+            favoritos = await apiRequest(`/favoritos/usuario/${usuarioId}`);
+            estado.favoritosPorUsuario.set(usuarioId, favoritos);
+        }
 
         if (favoritos.length === 0) {
-            container.innerHTML = `
-                <div class="alert alert-custom">
-                    <i class="fas fa-heart-broken"></i> Este usuario no tiene canciones favoritas aún
-                </div>
-            `;
+            mostrarSinFavoritos(container);
             return;
         }
 
-        container.innerHTML = `
-            <ul class="list-group">
-                ${favoritos.map(fav => `
-                    <li class="list-group-item">
-                        <div class="d-flex justify-content-between align-items-start">
-                            <div class="flex-grow-1">
-                                <h6 class="mb-1">
-                                    <i class="fas fa-heart text-danger"></i> ${fav.cancion.titulo}
-                                </h6>
-                                <p class="mb-1"><strong>Artista:</strong> ${fav.cancion.artista}</p>
-                                <div class="d-flex gap-2 flex-wrap">
-                                    <span class="badge badge-custom">
-                                        <i class="fas fa-clock"></i> ${formatearDuracion(fav.cancion.duracion)}
-                                    </span>
-                                    ${fav.cancion.genero ? `<span class="badge badge-custom"><i class="fas fa-guitar"></i> ${fav.cancion.genero}</span>` : ''}
-                                </div>
-                                <small class="text-muted">
-                                    <i class="fas fa-calendar-plus"></i> Agregado: ${new Date(fav.fecha_agregado).toLocaleDateString('es-ES')}
-                                </small>
-                            </div>
-                            <button class="btn btn-sm btn-outline-danger" onclick="eliminarFavorito(${fav.id})">
-                                <i class="fas fa-heart-broken"></i>
-                            </button>
-                        </div>
-                    </li>
-                `).join('')}
-            </ul>
-        `;
+        // Actualizar solo las filas que cambiaron, por ID de favorito
+        let lista = document.getElementById('lista-favoritos');
+        if (!lista) {
+            lista = crearElemento('<ul class="list-group lista-scroll" id="lista-favoritos"></ul>');
+            container.replaceChildren(lista);
+        }
+        const ids = new Set(favoritos.map(fav => String(fav.id)));
+        lista.querySelectorAll(':scope > [data-id]').forEach(fila => {
+            if (!ids.has(fila.dataset.id)) {
+                fila.remove();
+            }
+        });
+        favoritos.forEach(fav => sincronizarFila(lista, fav.id, renderFavorito(fav)));
 
     } catch (error) {
         console.error('Error al cargar favoritos del usuario:', error);
@@ -371,8 +696,11 @@ async function agregarFavorito(event) {
         // Limpiar formulario
         document.getElementById('form-favorito').reset();
 
-        // Recargar estadística
-        await cargarFavoritos();
+        // Actualizar estadística
+        ajustarTotal('favoritos', 1);
+
+        // Los favoritos cacheados de este usuario ya no están completos
+        estado.favoritosPorUsuario.delete(usuario_id);
 
         // Si hay un usuario seleccionado en ver favoritos, recargar su lista
         const verUsuarioId = document.getElementById('ver-favoritos-usuario').value;
@@ -385,7 +713,7 @@ async function agregarFavorito(event) {
     }
 }
 
-async function eliminarFavorito(id) {
+async function eliminarFavorito(id, usuarioId) {
     if (!confirm('¿Está seguro de eliminar este favorito?')) {
         return;
     }
@@ -393,8 +721,16 @@ async function eliminarFavorito(id) {
     try {
         await apiRequest(`/favoritos/${id}`, 'DELETE');
         mostrarAlerta('Favorito eliminado exitosamente', 'info');
-        await cargarFavoritos();
-        await cargarFavoritosUsuario();
+        ajustarTotal('favoritos', -1);
+
+        const favoritos = (estado.favoritosPorUsuario.get(usuarioId) || []).filter(fav => fav.id !== id);
+        estado.favoritosPorUsuario.set(usuarioId, favoritos);
+
+        const lista = document.getElementById('lista-favoritos');
+        lista?.querySelector(`:scope > [data-id="${id}"]`)?.remove();
+        if (favoritos.length === 0) {
+            mostrarSinFavoritos(document.getElementById('lista-favoritos-container'));
+        }
     } catch (error) {
         console.error('Error al eliminar favorito:', error);
     }
@@ -405,11 +741,27 @@ async function eliminarFavorito(id) {
 // =============================================================================
 
 function cargarDatos() {
-    cargarUsuarios();
-    cargarCanciones();
-    cargarFavoritos();
+    configurarScrollInfinito(document.getElementById('lista-usuarios'), estado.usuarios, cargarUsuarios);
+    configurarScrollInfinito(document.getElementById('lista-canciones'), estado.canciones, cargarCanciones);
+    estado.favoritosPorUsuario.clear();
+    cargarFavoritosUsuario();
+    cargarTotales();
 }
 
+// Búsquedas del servidor para el catálogo y los selectores de favoritos
+escucharBusqueda(document.getElementById('filtro-canciones'), filtrarCanciones);
+configurarSelectorConBusqueda(
+    document.getElementById('buscar-favorito-usuario'), document.getElementById('favorito-usuario'), buscarUsuarios
+);
+configurarSelectorConBusqueda(
+    document.getElementById('buscar-favorito-cancion'), document.getElementById('favorito-cancion'), buscarCanciones
+);
+configurarSelectorConBusqueda(
+    document.getElementById('buscar-ver-favoritos-usuario'),
+    document.getElementById('ver-favoritos-usuario'),
+    buscarUsuarios
+);
+
 // Event listeners para formularios
 document.getElementById('form-usuario').addEventListener('submit', crearUsuario);
 document.getElementById('form-cancion').addEventListener('submit', crearCancion);
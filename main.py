@@ -5,16 +5,46 @@ Aplicación principal FastAPI para gestionar usuarios, canciones y favoritos.
 Autor: Jhon Salcedo (@jasl89)
 """
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session
+
+from app import startup
+from app.access_log import AccessLogMiddleware
+from app.admission import (
+    AdmissionMiddleware,
+    MantenimientoMiddleware,
+    admision,
+    mantenimiento,
+)
+from app.cache import CacheManager
 from app.config import get_settings
-from app.database import create_db_and_tables
-from app.routers import canciones, favoritos, usuarios
+from app.database import (
+    create_db_and_tables,
+    engine,
+    estadisticas_pool,
+    get_session,
+    medir_latencia,
+)
+from app.query_log import QueryContextMiddleware
+from app.routers import (
+    admin,
+    cambios,
+    canciones,
+    estadisticas,
+    eventos,
+    favoritos,
+    usuarios,
+)
+from app.routers import jobs as jobs_router
+from app.sharding import shards
 
 # Configuración
 settings = get_settings()
@@ -25,18 +55,48 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """
     Gestor de ciclo de vida de la aplicación.
-    Se ejecuta al iniciar y al cerrar la aplicación.
+    Se ejecuta al iniciar y al cerrar la aplicación. Los módulos que solo
+    se usan aquí se importan aquí, no al importar main.
     """
+    from app.backup import respaldos_periodicos
+    from app.changefeed import traslados_periodicos
+    from app.jobs import runner as jobs
+    from app.trending import indice_tendencias
+
     # Startup: Inicializar logging y base de datos
+    with startup.medir("logging"):
+        from app.logger import setup_logging
+
+        setup_logging()
     logger.info("=== Iniciando API de Música ===")
     logger.info(f"Versión: {settings.app_version}")
-    create_db_and_tables()
-    logger.info("Aplicación lista para recibir peticiones")
+    with startup.medir("esquema"):
+        create_db_and_tables()
+        shards.crear_tablas()
+    with startup.medir("tendencias"), Session(engine) as session:
+        indice_tendencias.construir(session)
+    if settings.favoritos_group_commit:
+        with startup.medir("commit_agrupado"):
+            shards.iniciar_escritores()
+    with startup.medir("trabajos"):
+        jobs.iniciar()
+    respaldos = traslados = None
+    if settings.backup_interval_hours > 0:
+        respaldos = asyncio.create_task(respaldos_periodicos(lambda: jobs.encolar("backup")))
+    if shards.activo:
+        traslados = asyncio.create_task(traslados_periodicos(engine))
+    fases = ", ".join(f"{fase}={ms} ms" for fase, ms in startup.tiempos.items())
+    logger.info(f"Aplicación lista para recibir peticiones ({fases})")
 
     yield
 
     # Shutdown: Limpiar recursos
     logger.info("Cerrando aplicación...")
+    for tarea in (respaldos, traslados):
+        if tarea is not None:
+            tarea.cancel()
+    shards.detener_escritores()
+    jobs.detener()
 
 
 # Crear la instancia de FastAPI con metadatos apropiados
@@ -65,6 +125,28 @@ app.add_middleware(
 )
 
 
+# Contar las peticiones en curso para que la restauración de un respaldo se ejecute sola
+app.add_middleware(
+    MantenimientoMiddleware,
+    mantenimiento=mantenimiento,
+    retry_after=settings.admission_retry_after_seconds,
+)
+
+
+# Limitar peticiones simultáneas y rechazar con 503 cuando hay sobrecarga
+if settings.admission_control:
+    app.add_middleware(AdmissionMiddleware, controlador=admision)
+
+
+# Asociar las consultas SQL a la ruta que las originó
+app.add_middleware(QueryContextMiddleware)
+
+
+# Registro de acceso en JSON con ID de petición (incluye la espera de admisión)
+if settings.access_log:
+    app.add_middleware(AccessLogMiddleware)
+
+
 # Montar archivos estáticos para el frontend
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
 
@@ -73,6 +155,18 @@ app.mount("/static", StaticFiles(directory="frontend"), name="static")
 app.include_router(usuarios.router, prefix="/api/usuarios", tags=["Usuarios"])
 app.include_router(canciones.router, prefix="/api/canciones", tags=["Canciones"])
 app.include_router(favoritos.router, prefix="/api/favoritos", tags=["Favoritos"])
+app.include_router(estadisticas.router, prefix="/api/estadisticas", tags=["Estadísticas"])
+app.include_router(cambios.router, prefix="/api/cambios", tags=["Cambios"])
+app.include_router(eventos.router, prefix="/api/eventos", tags=["Eventos"])
+app.include_router(jobs_router.router, prefix="/api/jobs", tags=["Trabajos"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Administración"])
+
+# Perfilado bajo demanda: se instala solo si está habilitado en la configuración
+if settings.profiling_enabled:
+    from app.profiling import ProfilingMiddleware, perfilador
+
+    perfilador.instalar(app, engine)
+    app.add_middleware(ProfilingMiddleware)
 
 
 @app.get("/", tags=["Root"])
@@ -100,7 +194,43 @@ async def health_check():
     Útil para sistemas de monitoreo y orquestación.
     """
     logger.info("Health check realizado")
-    return {"status": "healthy", "version": settings.app_version, "database": "sqlite:///musica.db"}
+    return {"status": "healthy", "version": settings.app_version, "database": settings.database_url}
+
+
+@app.get("/health/live", tags=["Health"])
+async def liveness():
+    """
+    Liveness probe: indica que el proceso responde.
+    No consulta la base de datos para que un bloqueo no provoque reinicios.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", tags=["Health"])
+def readiness(session: Session = Depends(get_session)):
+    """
+    Readiness probe: indica si la instancia puede recibir tráfico.
+
+    Ejecuta una consulta trivial cronometrada y reporta el estado del pool
+    de conexiones y la tasa de aciertos del caché. Retorna 503 si la base de
+    datos falla o responde más lento que `health_max_db_latency_ms`.
+    """
+    detalle = {"pool": estadisticas_pool(), "cache": CacheManager.stats()}
+    try:
+        latencia = medir_latencia(session)
+    except SQLAlchemyError as exc:
+        logger.error(f"Readiness: la base de datos no responde: {exc}")
+        detalle["database"] = {"status": "error", "error": str(exc.__cause__ or exc)}
+        listo = False
+    else:
+        listo = latencia <= settings.health_max_db_latency_ms
+        detalle["database"] = {"status": "ok" if listo else "lenta", "latencia_ms": latencia}
+        if not listo:
+            logger.warning(f"Readiness: latencia de base de datos alta ({latencia} ms)")
+
+    contenido = {"status": "ready" if listo else "degraded", **detalle}
+    codigo = status.HTTP_200_OK if listo else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(content=contenido, status_code=codigo)
 
 
 if __name__ == "__main__":
@@ -5,14 +5,60 @@ Pruebas unitarias y de integración usando pytest.
 Autor: Jhon Salcedo (@jasl89)
 """
 
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
 import pytest
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
-from app.database import get_session
-from app.models import Cancion, Usuario
+from app import changefeed
+from app.access_log import RequestIdFilter
+from app.access_log import logger as registro_acceso
+from app.admission import GrupoAdmision, admision, mantenimiento
+from app.backup import _copiar, archivo_shard, crear_respaldo, listar_respaldos, verificar
+from app.cache import CacheManager, IdentityCache, cached_session_query
+from app.changefeed import compactar_cambios, trasladar_cambios
+from app.coalescing import SingleFlight, coalescer, responder_coalescido
+from app.config import get_settings
+from app.database import get_session, huella_esquema, inicializar_esquema
+from app.dedup import clave_cancion
+from app.events import DESCONECTADO, EventBroker, flujo_eventos
+from app.group_commit import EscrituraNoConfirmadaError, GroupCommitWriter
+from app.jobs import JobRunner, _ejecutar_en_proceso, exportar_catalogo, get_jobs
+from app.models import (
+    Cambio,
+    Cancion,
+    CancionRead,
+    Favorito,
+    FavoritoCreate,
+    FavoritosMaterializados,
+    Trabajo,
+    Usuario,
+)
+from app.profiling import Perfilador, ProfilingMiddleware
+from app.query_log import QueryContextMiddleware, RegistroConsultasLentas, huella_sql
+from app.routers.favoritos import _agregar_favorito
+from app.sharding import shards
+from app.similarity import SimilarityIndex
+from app.trending import TrendingIndex, VentanaDeslizante
+from app.vista_favoritos import vista_favoritos
+from benchmarks import replay
 from main import app
+from utils import generar_slug
 
 # =============================================================================
 # CONFIGURACIÓN DE FIXTURES
@@ -50,11 +96,15 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    CacheManager.clear_all()
+    CacheManager.invalidate_indexes()
 
     client = TestClient(app)
     yield client
 
     app.dependency_overrides.clear()
+    CacheManager.clear_all()
+    CacheManager.invalidate_indexes()
 
 
 @pytest.fixture(name="usuario_test")
@@ -88,6 +138,44 @@ def cancion_test_fixture(session: Session):
     return cancion
 
 
+class ContadorConsultas:
+    """Sentencias SQL ejecutadas dentro de un bloque `with contar_consultas()`"""
+
+    def __init__(self):
+        self.sentencias: list[str] = []
+
+    @property
+    def total(self) -> int:
+        return len(self.sentencias)
+
+    def registrar(self, conn, cursor, statement, parameters, context, executemany):
+        self.sentencias.append(statement)
+
+
+@pytest.fixture(name="contar_consultas")
+def contar_consultas_fixture(session: Session):
+    """
+    Retorna un context manager que cuenta las sentencias SQL que ejecuta
+    el engine de pruebas dentro del bloque.
+
+        with contar_consultas() as consultas:
+            client.get(...)
+        assert consultas.total <= 2
+    """
+    engine = session.get_bind()
+
+    @contextmanager
+    def contar():
+        contador = ContadorConsultas()
+        event.listen(engine, "before_cursor_execute", contador.registrar)
+        try:
+            yield contador
+        finally:
+            event.remove(engine, "before_cursor_execute", contador.registrar)
+
+    return contar
+
+
 # =============================================================================
 # TESTS DE USUARIOS
 # =============================================================================
@@ -135,6 +223,28 @@ class TestUsuarios:
         assert response.status_code == 404
         assert "no encontrado" in response.json()["detail"].lower()
 
+    def test_obtener_usuarios_por_ids(self, client: TestClient, usuario_test: Usuario):
+        """Verifica la obtención de varios usuarios por ID en el orden pedido"""
+        otro = client.post(
+            "/api/usuarios/", json={"nombre": "Otro", "correo": "otro@example.com"}
+        ).json()
+
+        response = client.get(f"/api/usuarios/?ids={otro['id']},99999,{usuario_test.id}")
+        assert response.status_code == 200
+        assert [u["id"] for u in response.json()] == [otro["id"], usuario_test.id]
+        assert response.headers["X-Ids-No-Encontrados"] == "99999"
+
+    def test_obtener_usuarios_por_ids_invalidos(self, client: TestClient):
+        """Verifica el error con una lista de IDs mal formada"""
+        response = client.get("/api/usuarios/?ids=1,abc")
+        assert response.status_code == 400
+
+    def test_obtener_usuario_campos_parciales(self, client: TestClient, usuario_test: Usuario):
+        """Verifica que ?fields= limita los campos del usuario"""
+        response = client.get(f"/api/usuarios/{usuario_test.id}?fields=id,nombre")
+        assert response.status_code == 200
+        assert response.json() == {"id": usuario_test.id, "nombre": usuario_test.nombre}
+
     def test_actualizar_usuario(self, client: TestClient, usuario_test: Usuario):
         """Verifica la actualización de un usuario"""
         update_data = {"nombre": "Nombre Actualizado"}
@@ -153,6 +263,19 @@ class TestUsuarios:
         response = client.get(f"/api/usuarios/{usuario_test.id}")
         assert response.status_code == 404
 
+    def test_autocompletar_usuarios(self, client: TestClient, usuario_test: Usuario):
+        """Verifica el autocompletado por prefijo del nombre o del correo"""
+        client.post("/api/usuarios/", json={"nombre": "Ana", "correo": "zeta@example.com"})
+        client.post("/api/usuarios/", json={"nombre": "Zoe", "correo": "ana_b@example.com"})
+
+        response = client.get("/api/usuarios/autocompletar?prefijo=AN")
+        assert response.status_code == 200
+        assert [u["nombre"] for u in response.json()] == ["Ana", "Zoe"]
+
+        # Los comodines de LIKE se buscan literalmente
+        assert client.get("/api/usuarios/autocompletar?prefijo=ana_").json()[0]["nombre"] == "Zoe"
+        assert client.get("/api/usuarios/autocompletar?prefijo=%25").json() == []
+
 
 # =============================================================================
 # TESTS DE CANCIONES
@@ -196,6 +319,32 @@ class TestCanciones:
         assert data["titulo"] == cancion_test.titulo
         assert data["artista"] == cancion_test.artista
 
+    def test_obtener_canciones_por_ids(self, client: TestClient, cancion_test: Cancion):
+        """Verifica la obtención de varias canciones por ID con una sola consulta"""
+        otra = client.post(
+            "/api/canciones/", json={"titulo": "Otra", "artista": "Otro", "duracion": 60}
+        ).json()
+
+        response = client.get(f"/api/canciones/?ids={otra['id']},{cancion_test.id},{otra['id']}")
+        assert response.status_code == 200
+        assert [c["id"] for c in response.json()] == [otra["id"], cancion_test.id]
+        assert response.headers["X-Ids-No-Encontrados"] == ""
+
+    def test_listar_canciones_campos_parciales(self, client: TestClient, cancion_test: Cancion):
+        """Verifica que ?fields= limita los campos de cada canción"""
+        response = client.get("/api/canciones/?fields=id,titulo&genero=Rock")
+        assert response.status_code == 200
+        assert response.json() == [{"id": cancion_test.id, "titulo": cancion_test.titulo}]
+
+        response = client.get(f"/api/canciones/?ids={cancion_test.id}&fields=año")
+        assert response.json() == [{"año": cancion_test.año}]
+
+    def test_campos_parciales_invalidos(self, client: TestClient, cancion_test: Cancion):
+        """Verifica el error al pedir un campo inexistente"""
+        response = client.get(f"/api/canciones/{cancion_test.id}?fields=id,clave")
+        assert response.status_code == 400
+        assert "clave" in response.json()["detail"]
+
     def test_actualizar_cancion(self, client: TestClient, cancion_test: Cancion):
         """Verifica la actualización de una canción"""
         update_data = {"titulo": "Título Actualizado", "año": 2024}
@@ -223,6 +372,35 @@ class TestCanciones:
         assert len(data) > 0
         assert all(cancion_test.artista in c["artista"] for c in data)
 
+    def test_autocompletar_por_titulo(self, client: TestClient, cancion_test: Cancion):
+        """Verifica el autocompletado por prefijo del título sin distinguir tildes"""
+        client.post(
+            "/api/canciones/", json={"titulo": "Canon", "artista": "Pachelbel", "duracion": 300}
+        )
+        client.post(
+            "/api/canciones/", json={"titulo": "Otra", "artista": "Artista Test", "duracion": 90}
+        )
+
+        response = client.get("/api/canciones/autocompletar?prefijo=can")
+        assert response.status_code == 200
+        titulos = [c["titulo"] for c in response.json()]
+        assert titulos == ["Canción Test", "Canon"]
+
+        response = client.get("/api/canciones/autocompletar?prefijo=CANCION&limite=1")
+        assert [c["id"] for c in response.json()] == [cancion_test.id]
+
+    def test_autocompletar_refleja_escrituras(self, client: TestClient, cancion_test: Cancion):
+        """Verifica que el índice se actualiza al modificar y eliminar canciones"""
+        url = "/api/canciones/autocompletar?campo=artista&prefijo="
+        assert len(client.get(url + "artista").json()) == 1
+
+        client.patch(f"/api/canciones/{cancion_test.id}", json={"artista": "Nuevo Artista"})
+        assert client.get(url + "artista").json() == []
+        assert client.get(url + "nuevo").json()[0]["artista"] == "Nuevo Artista"
+
+        client.delete(f"/api/canciones/{cancion_test.id}")
+        assert client.get(url + "nuevo").json() == []
+
     def test_filtrar_canciones_por_genero(self, client: TestClient, cancion_test: Cancion):
         """Verifica el filtro de canciones por género"""
         response = client.get(f"/api/canciones/?genero={cancion_test.genero}")
@@ -325,6 +503,1749 @@ class TestFavoritos:
         assert len(data) == 0
 
 
+# =============================================================================
+# TESTS DE ESTADÍSTICAS
+# =============================================================================
+
+
+class TestEstadisticas:
+    """Tests para el endpoint de estadísticas del catálogo."""
+
+    def test_estadisticas_vacias(self, client: TestClient):
+        """Verifica las estadísticas con el catálogo vacío"""
+        response = client.get("/api/estadisticas/")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["totales"] == {
+            "usuarios": 0,
+            "canciones": 0,
+            "favoritos": 0,
+            "duracion_total": 0,
+        }
+        assert data["por_genero"] == []
+        assert data["favoritos_por_usuario"] == []
+
+    def test_estadisticas_agregados(
+        self, client: TestClient, usuario_test: Usuario, cancion_test: Cancion
+    ):
+        """Verifica los agregados por género, artista, año y usuario"""
+        client.post(
+            "/api/canciones/",
+            json={"titulo": "Otra", "artista": "Artista Test", "duracion": 120, "genero": "Rock"},
+        )
+        client.post(
+            "/api/favoritos/", json={"usuario_id": usuario_test.id, "cancion_id": cancion_test.id}
+        )
+
+        data = client.get("/api/estadisticas/").json()
+        assert data["totales"]["canciones"] == 2
+        assert data["totales"]["duracion_total"] == 300
+        rock = next(g for g in data["por_genero"] if g["grupo"] == "Rock")
+        assert rock["canciones"] == 2
+        assert rock["duracion_promedio"] == 150
+        assert data["por_artista"][0]["grupo"] == "Artista Test"
+        assert {g["grupo"] for g in data["por_año"]} == {"2020", None}
+        assert data["favoritos_por_usuario"] == [
+            {"usuario_id": usuario_test.id, "nombre": usuario_test.nombre, "favoritos": 1}
+        ]
+
+    def test_estadisticas_invalidadas_al_escribir(self, client: TestClient):
+        """Verifica que el caché de estadísticas se limpia tras una escritura"""
+        assert client.get("/api/estadisticas/").json()["totales"]["usuarios"] == 0
+        client.post("/api/usuarios/", json={"nombre": "Nuevo", "correo": "nuevo@example.com"})
+        assert client.get("/api/estadisticas/").json()["totales"]["usuarios"] == 1
+
+    def test_resultado_calculado_antes_de_limpiar_no_se_guarda(self):
+        """Verifica que un cálculo que cruza una limpieza del caché no queda guardado"""
+        llamadas = []
+
+        @cached_session_query(maxsize=4)
+        def consulta(session, clave):
+            llamadas.append(clave)
+            if len(llamadas) == 1:
+                # Una escritura limpia el caché mientras se calcula
+                consulta.cache_clear()
+            return len(llamadas)
+
+        assert consulta(None, "a") == 1
+        assert consulta(None, "a") == 2
+        assert consulta(None, "a") == 2
+        assert consulta.cache_info().currsize == 1
+
+
+# =============================================================================
+# TESTS DEL REGISTRO DE CAMBIOS
+# =============================================================================
+
+
+class TestCambios:
+    """Tests para el registro de cambios incremental."""
+
+    def test_escrituras_generan_eventos_ordenados(self, client: TestClient):
+        """Verifica que altas, modificaciones y bajas quedan en el registro"""
+        usuario = client.post(
+            "/api/usuarios/", json={"nombre": "Ana", "correo": "ana@example.com"}
+        ).json()
+        cancion = client.post(
+            "/api/canciones/", json={"titulo": "Tema", "artista": "Banda", "duracion": 100}
+        ).json()
+        favorito = client.post(
+            "/api/favoritos/", json={"usuario_id": usuario["id"], "cancion_id": cancion["id"]}
+        ).json()
+        client.patch(f"/api/canciones/{cancion['id']}", json={"titulo": "Tema 2"})
+        client.delete(f"/api/favoritos/{favorito['id']}")
+
+        response = client.get("/api/cambios/")
+        assert response.status_code == 200
+        data = response.json()
+        eventos = [(c["entidad"], c["operacion"]) for c in data["cambios"]]
+        assert eventos == [
+            ("usuario", "crear"),
+            ("cancion", "crear"),
+            ("favorito", "crear"),
+            ("cancion", "actualizar"),
+            ("favorito", "eliminar"),
+        ]
+        assert data["cambios"][3]["datos"]["titulo"] == "Tema 2"
+        assert data["cambios"][4]["datos"] is None
+        assert data["cursor"] == data["cambios"][-1]["id"]
+        assert data["hay_mas"] is False
+
+    def test_paginacion_por_cursor(self, client: TestClient):
+        """Verifica que el cursor retorna solo los eventos nuevos"""
+        for i in range(3):
+            client.post("/api/usuarios/", json={"nombre": f"U{i}", "correo": f"u{i}@example.com"})
+
+        primera = client.get("/api/cambios/?limit=2").json()
+        assert len(primera["cambios"]) == 2
+        assert primera["hay_mas"] is True
+
+        segunda = client.get(f"/api/cambios/?desde={primera['cursor']}").json()
+        assert [c["datos"]["nombre"] for c in segunda["cambios"]] == ["U2"]
+        assert segunda["hay_mas"] is False
+
+        vacia = client.get(f"/api/cambios/?desde={segunda['cursor']}").json()
+        assert vacia == {"cambios": [], "cursor": segunda["cursor"], "hay_mas": False}
+
+    def test_compactar_conserva_ultimo_evento(self, client: TestClient, session: Session):
+        """Verifica que la compactación deja solo el último evento por entidad"""
+        cancion = client.post(
+            "/api/canciones/", json={"titulo": "A", "artista": "B", "duracion": 10}
+        ).json()
+        for titulo in ("A1", "A2"):
+            client.patch(f"/api/canciones/{cancion['id']}", json={"titulo": titulo})
+
+        compactar_cambios(session, antes_de=datetime.now() + timedelta(seconds=1))
+
+        cambios = client.get("/api/cambios/").json()["cambios"]
+        assert len(cambios) == 1
+        assert cambios[0]["operacion"] == "actualizar"
+        assert cambios[0]["datos"]["titulo"] == "A2"
+
+
+# =============================================================================
+# TESTS DE COALESCENCIA
+# =============================================================================
+
+
+class TestEventos:
+    """Tests para la difusión de eventos SSE."""
+
+    def test_flujo_recibe_eventos_y_heartbeat(self):
+        """Verifica el formato SSE de los eventos y el heartbeat sin eventos"""
+
+        async def escenario():
+            broker = EventBroker(tamano_cola=10)
+            suscriptor = broker.suscribir()
+            flujo = flujo_eventos(broker, suscriptor, heartbeat=0.05)
+            assert await anext(flujo) == b"retry: 3000\n\n"
+
+            cambio = {"id": 7, "entidad": "cancion", "operacion": "crear", "datos": {"id": 1}}
+            broker.publicar(cambio)
+            mensaje = await anext(flujo)
+            assert mensaje.startswith(b"id: 7\nevent: cancion.crear\ndata: {")
+
+            assert await anext(flujo) == b": ping\n\n"
+            await flujo.aclose()
+            return broker.metricas()
+
+        metricas = asyncio.run(escenario())
+        assert metricas["suscriptores"] == 0
+        assert metricas["publicados"] == 1
+
+    def test_suscriptor_lento_se_descarta(self):
+        """Verifica que un cliente con la cola llena se desconecta"""
+
+        async def escenario():
+            broker = EventBroker(tamano_cola=2)
+            suscriptor = broker.suscribir()
+            flujo = flujo_eventos(broker, suscriptor, heartbeat=1)
+            await anext(flujo)
+            for i in range(3):
+                broker.publicar({"id": i, "entidad": "usuario", "operacion": "crear"})
+            await asyncio.sleep(0)
+            return broker, [mensaje async for mensaje in flujo]
+
+        broker, mensajes = asyncio.run(escenario())
+        assert mensajes[-1] == DESCONECTADO
+        assert broker.metricas()["descartados"] == 1
+        assert broker.metricas()["suscriptores"] == 0
+
+    def test_una_llamada_por_event_loop(self, monkeypatch):
+        """Verifica que un evento programa una sola entrega por loop para todos sus clientes"""
+
+        async def escenario():
+            broker = EventBroker()
+            suscriptores = [broker.suscribir() for _ in range(5)]
+            loop = asyncio.get_running_loop()
+            llamadas = []
+            programar = loop.call_soon_threadsafe
+
+            def contar(*args):
+                llamadas.append(args)
+                return programar(*args)
+
+            monkeypatch.setattr(loop, "call_soon_threadsafe", contar)
+            broker.publicar({"id": 1, "entidad": "usuario", "operacion": "crear"})
+            await asyncio.sleep(0)
+            return len(llamadas), [s.cola.qsize() for s in suscriptores]
+
+        llamadas, pendientes = asyncio.run(escenario())
+        assert llamadas == 1
+        assert pendientes == [1] * 5
+
+    def test_limite_de_suscriptores(self):
+        """Verifica que no se aceptan más clientes que el máximo"""
+
+        async def escenario():
+            broker = EventBroker(max_suscriptores=1)
+            return broker.suscribir(), broker.suscribir()
+
+        primero, segundo = asyncio.run(escenario())
+        assert primero is not None
+        assert segundo is None
+
+    def test_commit_publica_y_rollback_descarta(self, client: TestClient, monkeypatch):
+        """Verifica que solo se publican los cambios de transacciones confirmadas"""
+        publicados = []
+        monkeypatch.setattr("app.changefeed.broker.publicar", publicados.append)
+
+        client.post("/api/usuarios/", json={"nombre": "Ana", "correo": "ana@example.com"})
+        response = client.post("/api/favoritos/", json={"usuario_id": 999, "cancion_id": 999})
+        assert response.status_code == 404
+
+        assert [(e["entidad"], e["operacion"]) for e in publicados] == [("usuario", "crear")]
+        assert publicados[0]["datos"]["nombre"] == "Ana"
+
+
+class TestAdmision:
+    """Tests para el control de admisión."""
+
+    def test_cola_llena_rechaza(self):
+        """Verifica que se espera turno en orden y se rechaza con la cola llena"""
+
+        async def escenario():
+            grupo = GrupoAdmision("prueba", concurrencia=1, max_cola=1, espera_max=1)
+            assert await grupo.adquirir()
+
+            en_espera = asyncio.create_task(grupo.adquirir())
+            await asyncio.sleep(0)
+            assert grupo.en_cola == 1
+            assert await grupo.adquirir() is False
+
+            grupo.liberar()
+            assert await en_espera
+            grupo.liberar()
+            return grupo.metricas()
+
+        metricas = asyncio.run(escenario())
+        assert metricas["activas"] == 0
+        assert metricas["admitidas"] == 2
+        assert metricas["rechazadas"] == 1
+
+    def test_espera_maxima(self):
+        """Verifica que una petición que espera demasiado se rechaza"""
+
+        async def escenario():
+            grupo = GrupoAdmision("prueba", concurrencia=1, max_cola=5, espera_max=0.01)
+            await grupo.adquirir()
+            admitida = await grupo.adquirir()
+            return admitida, grupo.en_cola
+
+        assert asyncio.run(escenario()) == (False, 0)
+
+    def test_sobrecarga_responde_503(self, client: TestClient, monkeypatch):
+        """Verifica el 503 con Retry-After y que /health no se limita"""
+        saturado = GrupoAdmision("lectura", concurrencia=0, max_cola=0, espera_max=1)
+        monkeypatch.setitem(admision.grupos, "lectura", saturado)
+
+        response = client.get("/api/canciones/")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert response.headers["x-queue-depth"] == "0"
+
+        assert client.get("/health").status_code == 200
+        metricas = client.get("/api/admin/metricas").json()["admision"]
+        assert metricas["lectura"]["rechazadas"] == 1
+
+
+class TestConsultasLentas:
+    """Tests para el registro de consultas lentas."""
+
+    def test_huella_ignora_literales(self):
+        """Verifica que las consultas que solo cambian en valores comparten huella"""
+        assert huella_sql("SELECT * FROM t WHERE id IN (?, ?, ?) LIMIT 10") == huella_sql(
+            "SELECT *  FROM t WHERE id IN (?, ?)\nLIMIT 5"
+        )
+        assert huella_sql("SELECT 'a' FROM t") == "SELECT ? FROM t"
+
+    def test_registra_ruta_y_plan(self, client: TestClient, session: Session, tmp_path):
+        """Verifica que se registra la ruta de origen y el plan de ejecución"""
+        archivo = tmp_path / "lentas.log"
+        registro = RegistroConsultasLentas(umbral_ms=0, archivo=str(archivo))
+        engine = session.get_bind()
+        registro.instalar(engine)
+        try:
+            client.get("/api/canciones/?artista=Queen")
+        finally:
+            registro.desinstalar(engine)
+
+        peores = registro.peores()
+        consulta = next(e for e in peores if "FROM cancion" in e["sql"])
+        assert consulta["rutas"] == ["GET /api/canciones/"]
+        assert any("SCAN" in paso for paso in consulta["plan"])
+        assert archivo.read_text(encoding="utf-8").count("\n") >= 1
+
+    def test_umbral(self, client: TestClient, session: Session, tmp_path):
+        """Verifica que las consultas rápidas no se registran"""
+        registro = RegistroConsultasLentas(umbral_ms=10_000, archivo=str(tmp_path / "l.log"))
+        engine = session.get_bind()
+        registro.instalar(engine)
+        try:
+            client.get("/api/canciones/")
+        finally:
+            registro.desinstalar(engine)
+
+        assert registro.peores() == []
+        assert client.get("/api/admin/consultas-lentas").status_code == 200
+
+
+class TestPresupuestoConsultas:
+    """Tests que fijan el número de consultas SQL por endpoint (detectan N+1)."""
+
+    @staticmethod
+    def _crear_favoritos(session: Session, usuario: Usuario, cantidad: int) -> None:
+        canciones = [
+            Cancion(titulo=f"T{i}", artista="A", duracion=100 + i) for i in range(cantidad)
+        ]
+        session.add_all(canciones)
+        session.commit()
+        session.add_all(Favorito(usuario_id=usuario.id, cancion_id=c.id) for c in canciones)
+        session.commit()
+        session.expire_all()
+
+    @pytest.mark.parametrize("cantidad", [1, 25])
+    def test_favoritos_usuario(
+        self,
+        client: TestClient,
+        session: Session,
+        usuario_test: Usuario,
+        contar_consultas,
+        cantidad,
+    ):
+        """Verifica que listar los favoritos de un usuario no depende de cuántos tiene"""
+        self._crear_favoritos(session, usuario_test, cantidad)
+        url = f"/api/favoritos/usuario/{usuario_test.id}"
+
+        # La primera lectura crea la fila, construye la vista y la guarda
+        with contar_consultas() as consultas:
+            response = client.get(url)
+        assert len(response.json()) == cantidad
+        assert consultas.total <= 5, consultas.sentencias
+
+        # Las siguientes son una sola consulta por clave primaria
+        with contar_consultas() as consultas:
+            response = client.get(url)
+        assert len(response.json()) == cantidad
+        assert consultas.total == 1, consultas.sentencias
+
+    def test_listados(self, client: TestClient, session: Session, usuario_test, contar_consultas):
+        """Verifica que los listados ejecutan una sola consulta"""
+        self._crear_favoritos(session, usuario_test, 10)
+
+        for url in (
+            "/api/canciones/",
+            "/api/usuarios/",
+            "/api/favoritos/",
+            "/api/canciones/?ids=1,2,3",
+        ):
+            with contar_consultas() as consultas:
+                assert client.get(url).status_code == 200
+            assert consultas.total <= 1, (url, consultas.sentencias)
+
+    def test_estadisticas_en_cache(self, client: TestClient, contar_consultas):
+        """Verifica que las estadísticas en caché no consultan la base de datos"""
+        client.get("/api/estadisticas/")
+
+        with contar_consultas() as consultas:
+            client.get("/api/estadisticas/")
+        assert consultas.total == 0
+
+
+class TestPerfilado:
+    """Tests para el perfilado bajo demanda."""
+
+    @pytest.fixture(name="perfilado")
+    def perfilado_fixture(self, session: Session):
+        """App mínima con un endpoint síncrono que consulta la base de datos"""
+        mini = FastAPI()
+        mini.add_middleware(QueryContextMiddleware)
+        mini.add_middleware(ProfilingMiddleware)
+
+        @mini.get("/canciones/{cancion_id}")
+        def leer(cancion_id: int):
+            session.exec(select(Cancion).where(Cancion.id == cancion_id)).first()
+            return {"ok": True}
+
+        perfilador = Perfilador(token="secreto")
+        assert perfilador.instalar(mini, session.get_bind()) == 1
+        return TestClient(mini), perfilador
+
+    def test_sin_encabezado_no_perfila(self, perfilado):
+        """Verifica que sin el encabezado la petición no se perfila"""
+        client, perfilador = perfilado
+        response = client.get("/canciones/1")
+        assert response.json() == {"ok": True}
+        assert "x-profile-id" not in response.headers
+        assert perfilador.listar() == []
+
+    def test_token_incorrecto(self, perfilado):
+        """Verifica que solo se perfila con el token configurado"""
+        client, perfilador = perfilado
+        response = client.get("/canciones/1", headers={"X-Profile": "otro"})
+        assert "x-profile-id" not in response.headers
+
+    def test_reporte_con_sql(self, perfilado):
+        """Verifica el reporte de cProfile y las sentencias SQL de la petición"""
+        client, perfilador = perfilado
+        response = client.get("/canciones/1", headers={"X-Profile": "secreto"})
+
+        reporte = perfilador.obtener(response.headers["x-profile-id"])
+        assert reporte["ruta"] == "GET /canciones/{cancion_id}"
+        assert "cumulative" in reporte["perfil"]
+        assert len(reporte["sql"]) == 1
+        assert "FROM cancion" in reporte["sql"][0]["sql"]
+        assert perfilador.listar()[0]["id"] == reporte["id"]
+
+    def test_perfil_inexistente(self, client: TestClient):
+        """Verifica el 404 del endpoint de administración"""
+        response = client.get("/api/admin/perfiles/noexiste")
+        assert response.status_code == 404
+
+
+class TestTendencias:
+    """Tests para las canciones en tendencia."""
+
+    def test_ventana_descarta_intervalos_antiguos(self):
+        """Verifica que los favoritos salen de la ventana al avanzar el tiempo"""
+        ventana = VentanaDeslizante(duracion=60, intervalos=6)
+        ventana.sumar(1, momento=100, delta=1, ahora=100)
+        ventana.sumar(2, momento=125, delta=1, ahora=125)
+        ventana.sumar(2, momento=125, delta=1, ahora=125)
+
+        assert ventana.contar(ahora=130) == {1: 1, 2: 2}
+        assert ventana.contar(ahora=165) == {2: 2}
+        assert ventana.contar(ahora=200) == {}
+
+        ventana.sumar(1, momento=100, delta=1, ahora=200)
+        assert ventana.contar(ahora=200) == {}
+
+    def test_ranking_por_ventana(self, client: TestClient, session: Session, usuario_test):
+        """Verifica el orden y que cada ventana cuenta solo sus favoritos"""
+        canciones = [Cancion(titulo=f"T{i}", artista="A", duracion=100) for i in range(3)]
+        otro = Usuario(nombre="Otro", correo="otro@example.com")
+        session.add_all([*canciones, otro])
+        session.commit()
+        antiguo = datetime.now() - timedelta(hours=3)
+        session.add(
+            Favorito(usuario_id=otro.id, cancion_id=canciones[2].id, fecha_agregado=antiguo)
+        )
+        session.commit()
+
+        for usuario in (usuario_test, otro):
+            client.post(
+                "/api/favoritos/", json={"usuario_id": usuario.id, "cancion_id": canciones[0].id}
+            )
+        client.post(
+            "/api/favoritos/", json={"usuario_id": usuario_test.id, "cancion_id": canciones[1].id}
+        )
+
+        hora = client.get("/api/canciones/tendencias?ventana=1h").json()
+        assert [(t["cancion"]["id"], t["favoritos"]) for t in hora] == [
+            (canciones[0].id, 2),
+            (canciones[1].id, 1),
+        ]
+        dia = client.get("/api/canciones/tendencias?ventana=24h").json()
+        assert len(dia) == 3
+
+        client.delete(f"/api/favoritos/usuario/{otro.id}/cancion/{canciones[0].id}")
+        hora = client.get("/api/canciones/tendencias?ventana=1h&limite=1").json()
+        assert [(t["cancion"]["id"], t["favoritos"]) for t in hora] == [(canciones[0].id, 1)]
+
+    def test_ventana_invalida(self, client: TestClient):
+        """Verifica que solo se aceptan las ventanas definidas"""
+        assert client.get("/api/canciones/tendencias?ventana=2h").status_code == 422
+
+    def test_cambios_durante_la_construccion(self, monkeypatch):
+        """Verifica que los favoritos registrados mientras se lee la base se cuentan una vez"""
+        indice = TrendingIndex()
+        ahora = datetime.now()
+
+        def consultar(session, statement):
+            # (1, 5) ya está en la lectura y además se registra; (2, 5) llega después
+            indice.registrar(1, 5, ahora, 1)
+            indice.registrar(2, 5, ahora, 1)
+            indice.registrar(3, 6, ahora, -1)
+            return [(1, 5, ahora), (3, 6, ahora)]
+
+        monkeypatch.setattr(shards, "consultar", consultar)
+        indice.construir(None)
+        assert indice.ranking(None, "1h") == [(5, 2)]
+
+    def test_lecturas_en_frio_concurrentes(self, monkeypatch):
+        """Verifica que las consultas en frío esperan o repiten una construcción descartada"""
+        indice = TrendingIndex()
+        ahora = datetime.now()
+        lecturas = []
+        leyendo = threading.Event()
+        seguir = threading.Event()
+
+        def consultar(session, statement):
+            lecturas.append(statement)
+            if len(lecturas) == 1:
+                # La primera lectura se descarta por una invalidación concurrente
+                leyendo.set()
+                seguir.wait(5)
+                indice.invalidar()
+            return [(1, 5, ahora)]
+
+        monkeypatch.setattr(shards, "consultar", consultar)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            primera = pool.submit(indice.ranking, None, "1h")
+            leyendo.wait(5)
+            resto = [pool.submit(indice.ranking, None, "24h") for _ in range(3)]
+            seguir.set()
+            resultados = [primera.result(5)] + [futuro.result(5) for futuro in resto]
+        assert resultados == [[(5, 1)]] * 4
+        assert len(lecturas) == 2
+
+
+class TestSimilitud:
+    """Tests para favoritos comunes y usuarios similares."""
+
+    @pytest.fixture(name="gustos")
+    def gustos_fixture(self, client: TestClient, session: Session):
+        """Tres usuarios con favoritos que se solapan parcialmente"""
+        canciones = [Cancion(titulo=f"T{i}", artista="A", duracion=100) for i in range(4)]
+        usuarios = [Usuario(nombre=f"U{i}", correo=f"u{i}@example.com") for i in range(3)]
+        session.add_all([*canciones, *usuarios])
+        session.commit()
+        gustos = {0: [0, 1, 2], 1: [0, 1], 2: [2, 3]}
+        for usuario, indices in gustos.items():
+            for indice in indices:
+                client.post(
+                    "/api/favoritos/",
+                    json={"usuario_id": usuarios[usuario].id, "cancion_id": canciones[indice].id},
+                )
+        return usuarios, canciones
+
+    def test_ids_grandes(self):
+        """Verifica que IDs de canciones muy grandes no agrandan el índice"""
+        indice = SimilarityIndex()
+        indice.construir = lambda session: None
+        indice._construido = True
+        for cancion_id in (3, 10**12, 2**62):
+            indice.agregar(1, cancion_id)
+        indice.agregar(2, 2**62)
+        indice.agregar(2, 3)
+        indice.agregar(3, 10**12)
+        assert indice.comunes(None, 1, 2) == [3, 2**62]
+        assert indice.similares(None, 1) == [(2, 0.6667, 2), (3, 0.3333, 1)]
+        indice.eliminar(2, 3)
+        assert indice.comunes(None, 2, 1) == [2**62]
+
+    def test_favoritos_comunes(self, client: TestClient, gustos):
+        """Verifica las canciones compartidas por dos usuarios"""
+        usuarios, canciones = gustos
+        response = client.get(f"/api/usuarios/{usuarios[0].id}/comunes/{usuarios[1].id}")
+        assert response.status_code == 200
+        assert [c["id"] for c in response.json()] == [canciones[0].id, canciones[1].id]
+
+        response = client.get(f"/api/usuarios/{usuarios[1].id}/comunes/{usuarios[2].id}")
+        assert response.json() == []
+
+    def test_usuarios_similares(self, client: TestClient, gustos):
+        """Verifica el orden por similitud de Jaccard y la actualización al eliminar"""
+        usuarios, canciones = gustos
+        data = client.get(f"/api/usuarios/{usuarios[0].id}/similares").json()
+        assert [(s["usuario"]["id"], s["similitud"], s["canciones_comunes"]) for s in data] == [
+            (usuarios[1].id, round(2 / 3, 4), 2),
+            (usuarios[2].id, 0.25, 1),
+        ]
+
+        client.delete(f"/api/favoritos/usuario/{usuarios[2].id}/cancion/{canciones[2].id}")
+        data = client.get(f"/api/usuarios/{usuarios[0].id}/similares").json()
+        assert [s["usuario"]["id"] for s in data] == [usuarios[1].id]
+
+    def test_usuario_inexistente(self, client: TestClient, usuario_test: Usuario):
+        """Verifica el 404 cuando alguno de los usuarios no existe"""
+        assert client.get(f"/api/usuarios/{usuario_test.id}/comunes/999").status_code == 404
+        assert client.get("/api/usuarios/999/similares").status_code == 404
+
+    def test_cambios_durante_la_construccion(self, monkeypatch):
+        """Verifica que los favoritos que cambian mientras se lee la base no se pierden"""
+        indice = SimilarityIndex()
+
+        def consultar(session, statement):
+            indice.agregar(2, 5)
+            indice.eliminar(1, 5)
+            return [(1, 5), (1, 6)]
+
+        monkeypatch.setattr(shards, "consultar", consultar)
+        indice.construir(None)
+        assert indice.comunes(None, 2, 2) == [5]
+        assert indice.comunes(None, 1, 1) == [6]
+
+    def test_lecturas_en_frio_concurrentes(self, monkeypatch):
+        """Verifica que una construcción descartada no deja consultas sin resultados"""
+        indice = SimilarityIndex()
+        lecturas = []
+        leyendo = threading.Event()
+        seguir = threading.Event()
+
+        def consultar(session, statement):
+            lecturas.append(statement)
+            if len(lecturas) == 1:
+                # La primera lectura se descarta por una invalidación concurrente
+                leyendo.set()
+                seguir.wait(5)
+                indice.invalidar()
+            return [(1, 5), (2, 5)]
+
+        monkeypatch.setattr(shards, "consultar", consultar)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            primera = pool.submit(indice.comunes, None, 1, 2)
+            leyendo.wait(5)
+            resto = [pool.submit(indice.comunes, None, 2, 1) for _ in range(3)]
+            seguir.set()
+            resultados = [primera.result(5)] + [futuro.result(5) for futuro in resto]
+        assert resultados == [[5]] * 4
+        assert len(lecturas) == 2
+
+
+class TestDuplicados:
+    """Tests para la detección de canciones duplicadas."""
+
+    def test_generar_slug(self):
+        """Verifica la normalización de textos"""
+        assert generar_slug("  Canción  Número 1 (Remix)! ") == "cancion-numero-1-remix"
+        assert generar_slug("Beyoncé & Jay-Z") == "beyonce-jay-z"
+        assert generar_slug("--") == ""
+
+    def test_clave_conserva_otros_alfabetos(self):
+        """Verifica que títulos no latinos o solo con signos no generan claves iguales"""
+        assert clave_cancion("群青", "YOASOBI") != clave_cancion("夜に駆ける", "YOASOBI")
+        assert clave_cancion("Группа крови", "Кино") != clave_cancion("Звезда", "Кино")
+        assert clave_cancion("!!!", "X") != clave_cancion("???", "X")
+        assert clave_cancion("か", "X") != clave_cancion("が", "X")
+        assert clave_cancion("ГРУППА  крови!", "кино") == clave_cancion("Группа крови", "Кино")
+        assert clave_cancion("Canción", "Bandá") == clave_cancion("cancion", "BANDA")
+
+    def test_permite_titulos_no_latinos(self, client: TestClient):
+        """Verifica que dos canciones japonesas del mismo artista no se rechazan"""
+        for titulo in ("群青", "夜に駆ける"):
+            response = client.post(
+                "/api/canciones/", json={"titulo": titulo, "artista": "YOASOBI", "duracion": 200}
+            )
+            assert response.status_code == 201
+        response = client.post(
+            "/api/canciones/", json={"titulo": "群青", "artista": "yoasobi", "duracion": 200}
+        )
+        assert response.status_code == 409
+
+    def test_rechaza_duplicado(self, client: TestClient, cancion_test: Cancion):
+        """Verifica el 409 con la política reject (por defecto)"""
+        response = client.post(
+            "/api/canciones/",
+            json={"titulo": "CANCION test", "artista": "artista  test!", "duracion": 10},
+        )
+        assert response.status_code == 409
+        assert str(cancion_test.id) in response.json()["detail"]
+
+    def test_fusiona_duplicado(self, client: TestClient, session: Session, monkeypatch):
+        """Verifica que merge completa los campos vacíos y retorna la existente"""
+        monkeypatch.setattr(get_settings(), "duplicate_policy", "merge")
+        original = client.post(
+            "/api/canciones/", json={"titulo": "Tema", "artista": "Banda", "duracion": 100}
+        ).json()
+
+        response = client.post(
+            "/api/canciones/",
+            json={"titulo": "tema", "artista": "Bandá", "duracion": 99, "album": "Disco"},
+        )
+        assert response.status_code == 200
+        assert response.json()["id"] == original["id"]
+        assert response.json()["album"] == "Disco"
+        assert response.json()["duracion"] == 100
+
+    def test_permite_duplicado(self, client: TestClient, cancion_test: Cancion, monkeypatch):
+        """Verifica que allow crea la canción repetida"""
+        monkeypatch.setattr(get_settings(), "duplicate_policy", "allow")
+        response = client.post(
+            "/api/canciones/",
+            json={"titulo": "Canción Test", "artista": "Artista Test", "duracion": 10},
+        )
+        assert response.status_code == 201
+        assert response.json()["id"] != cancion_test.id
+
+    def test_importar(self, client: TestClient, cancion_test: Cancion):
+        """Verifica que la importación omite duplicados del catálogo y del lote"""
+        lote = [
+            {"titulo": "Nueva", "artista": "X", "duracion": 10},
+            {"titulo": "nueva", "artista": "x", "duracion": 11},
+            {"titulo": "Canción Test", "artista": "Artista Test", "duracion": 10},
+            {"titulo": "Otra", "artista": "X", "duracion": 12},
+        ]
+        response = client.post("/api/canciones/importar", json=lote)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["creadas"]) == 2
+        assert data["fusionadas"] == []
+        assert data["rechazadas"] == 2
+        assert len(client.get("/api/canciones/").json()) == 3
+
+    def test_deduplicar_reasigna_favoritos(self, client: TestClient, session: Session):
+        """Verifica que la deduplicación conserva la más antigua y mueve los favoritos"""
+        ana = Usuario(nombre="Ana", correo="ana@example.com")
+        beto = Usuario(nombre="Beto", correo="beto@example.com")
+        canciones = [
+            Cancion(titulo="Tema", artista="Banda", duracion=100),
+            Cancion(titulo="TEMA", artista="banda", duracion=100, genero="Rock"),
+            Cancion(titulo="Tema!", artista="Bandá", duracion=100),
+        ]
+        session.add_all([ana, beto, *canciones])
+        session.commit()
+        session.add_all(
+            [
+                Favorito(usuario_id=ana.id, cancion_id=canciones[0].id),
+                Favorito(usuario_id=ana.id, cancion_id=canciones[1].id),
+                Favorito(usuario_id=beto.id, cancion_id=canciones[2].id),
+            ]
+        )
+        session.commit()
+
+        response = client.post("/api/canciones/deduplicar")
+        assert response.status_code == 200
+        assert response.json() == {"grupos": 1, "eliminadas": 2, "reasignados": 1, "descartados": 1}
+
+        restantes = client.get("/api/canciones/").json()
+        assert [(c["id"], c["genero"]) for c in restantes] == [(canciones[0].id, "Rock")]
+        favoritos = client.get("/api/favoritos/").json()
+        assert {(f["usuario_id"], f["cancion_id"]) for f in favoritos} == {
+            (ana.id, canciones[0].id),
+            (beto.id, canciones[0].id),
+        }
+
+
+class TestTrabajos:
+    """Tests para los trabajos en segundo plano."""
+
+    @pytest.fixture(name="trabajos")
+    def trabajos_fixture(self, client: TestClient, tmp_path):
+        """Runner y sesiones sobre una base de datos en archivo compartida entre hilos"""
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'trabajos.db'}", connect_args={"check_same_thread": False}
+        )
+        SQLModel.metadata.create_all(engine)
+        runner = JobRunner(engine, hilos=1)
+        runner.iniciar()
+
+        def get_session_override():
+            with Session(engine) as session:
+                yield session
+
+        app.dependency_overrides[get_session] = get_session_override
+        app.dependency_overrides[get_jobs] = lambda: runner
+        yield engine
+        runner.detener()
+
+    @staticmethod
+    def _esperar(client: TestClient, trabajo_id: int) -> dict:
+        for _ in range(200):
+            trabajo = client.get(f"/api/jobs/{trabajo_id}").json()
+            if trabajo["estado"] in ("completado", "fallido"):
+                return trabajo
+            time.sleep(0.01)
+        raise AssertionError(f"El trabajo {trabajo_id} no terminó")
+
+    def test_trabajo_completado(self, client: TestClient, trabajos):
+        """Verifica que un trabajo se encola con 202 y termina con su resultado"""
+        client.post("/api/canciones/", json={"titulo": "A", "artista": "B", "duracion": 60})
+
+        response = client.post("/api/jobs/", json={"tipo": "estadisticas"})
+        assert response.status_code == 202
+        assert response.json()["estado"] == "pendiente"
+
+        trabajo = self._esperar(client, response.json()["id"])
+        assert trabajo["estado"] == "completado"
+        assert trabajo["resultado"]["canciones"] == 1
+        assert trabajo["fecha_inicio"] is not None
+
+    def test_vacuum(self, client: TestClient, trabajos):
+        """Verifica el trabajo de VACUUM"""
+        trabajo_id = client.post("/api/jobs/", json={"tipo": "vacuum"}).json()["id"]
+        assert self._esperar(client, trabajo_id)["resultado"] == {"ok": True}
+
+    def test_validacion(self, client: TestClient, trabajos):
+        """Verifica los errores de tipo y parámetros desconocidos"""
+        assert client.post("/api/jobs/", json={"tipo": "nada"}).status_code == 400
+        response = client.post("/api/jobs/", json={"tipo": "vacuum", "parametros": {"x": 1}})
+        assert response.status_code == 400
+        assert client.get("/api/jobs/999").status_code == 404
+
+    def test_interrumpidos_al_reiniciar(self, trabajos):
+        """Verifica que solo quedan fallidos los trabajos cuyo lease venció"""
+        ahora = datetime.now()
+        with Session(trabajos) as session:
+            session.add_all(
+                [
+                    Trabajo(tipo="vacuum", estado="ejecutando"),
+                    Trabajo(
+                        tipo="vacuum",
+                        estado="ejecutando",
+                        propietario="otro:1:a",
+                        latido=ahora - timedelta(minutes=5),
+                    ),
+                    Trabajo(
+                        tipo="vacuum", estado="pendiente", propietario="otro:2:b", latido=ahora
+                    ),
+                ]
+            )
+            session.commit()
+
+        runner = JobRunner(trabajos, lease=30)
+        runner.iniciar()
+        runner.detener()
+        with Session(trabajos) as session:
+            estados = session.exec(select(Trabajo.estado).order_by(Trabajo.id)).all()
+        assert estados == ["fallido", "fallido", "pendiente"]
+
+    def test_latidos_renuevan_el_lease(self, trabajos):
+        """Verifica que el runner renueva el latido de sus trabajos sin terminar"""
+        runner = JobRunner(trabajos, lease=0.3)
+        with Session(trabajos) as session:
+            inicio = datetime.now()
+            trabajo = Trabajo(tipo="vacuum", propietario=runner.propietario, latido=inicio)
+            session.add(trabajo)
+            session.commit()
+            trabajo_id = trabajo.id
+
+        runner.iniciar()
+        time.sleep(0.2)
+        runner.detener()
+        with Session(trabajos) as session:
+            trabajo = session.get(Trabajo, trabajo_id)
+            assert trabajo.estado == "pendiente"
+            assert trabajo.latido > inicio
+
+    def test_proceso_marca_ejecutando_al_empezar(self, tmp_path, monkeypatch):
+        """Verifica que un trabajo de proceso pasa a ejecutando cuando el pool lo toma"""
+        monkeypatch.setattr(get_settings(), "export_dir", str(tmp_path / "exports"))
+        url = f"sqlite:///{tmp_path / 'proceso.db'}"
+        engine = create_engine(url)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            trabajo = Trabajo(tipo="exportar")
+            session.add(trabajo)
+            session.commit()
+            trabajo_id = trabajo.id
+
+        def exportar(database_url: str, trabajo_id: int) -> dict:
+            with Session(engine) as session:
+                trabajo = session.get(Trabajo, trabajo_id)
+                return {"estado": trabajo.estado, "inicio": trabajo.fecha_inicio is not None}
+
+        assert _ejecutar_en_proceso(exportar, url, trabajo_id) == {
+            "estado": "ejecutando",
+            "inicio": True,
+        }
+
+    def test_backup(self, client: TestClient, trabajos, tmp_path, monkeypatch):
+        """Verifica el trabajo de respaldo"""
+        monkeypatch.setattr(get_settings(), "backup_dir", str(tmp_path / "respaldos"))
+        trabajo_id = client.post("/api/jobs/", json={"tipo": "backup"}).json()["id"]
+        trabajo = self._esperar(client, trabajo_id)
+        assert trabajo["estado"] == "completado"
+        assert verificar(Path(trabajo["resultado"]["archivo"]))
+
+    def test_exportar_catalogo(self, tmp_path, monkeypatch):
+        """Verifica la función de exportación que se ejecuta en el pool de procesos"""
+        monkeypatch.setattr(get_settings(), "export_dir", str(tmp_path / "exports"))
+        url = f"sqlite:///{tmp_path / 'catalogo.db'}"
+        engine = create_engine(url)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add(Cancion(titulo="Ñandú", artista="B", duracion=60))
+            session.commit()
+
+        resultado = exportar_catalogo(url, trabajo_id=7)
+        assert resultado["canciones"] == 1
+        with open(resultado["archivo"], encoding="utf-8") as archivo:
+            assert json.load(archivo)[0]["titulo"] == "Ñandú"
+
+
+class TestRespaldos:
+    """Tests para los respaldos en línea y la restauración verificada"""
+
+    @pytest.fixture(autouse=True)
+    def directorio(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(get_settings(), "backup_dir", str(tmp_path / "respaldos"))
+        monkeypatch.setattr(get_settings(), "backup_sleep_ms", 0)
+        monkeypatch.setattr(get_settings(), "backup_restore_enabled", True)
+
+    def test_respaldo_por_pasos(self, tmp_path, monkeypatch):
+        """Verifica que la copia por pasos de una página produce un respaldo completo"""
+        monkeypatch.setattr(get_settings(), "backup_pages", 1)
+        engine = create_engine(f"sqlite:///{tmp_path / 'origen.db'}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            for i in range(200):
+                session.add(Cancion(titulo=f"Canción {i}", artista="Artista", duracion=60))
+            session.commit()
+
+        resultado = crear_respaldo(engine)
+        assert resultado["paginas"] > 1
+        assert not list((tmp_path / "respaldos").glob("*.parcial"))
+        with sqlite3.connect(resultado["archivo"]) as copia:
+            assert copia.execute("SELECT COUNT(*) FROM cancion").fetchone()[0] == 200
+
+    def test_rotacion(self, session: Session, monkeypatch):
+        """Verifica que solo se conservan los últimos backup_keep respaldos"""
+        monkeypatch.setattr(get_settings(), "backup_keep", 2)
+        archivos = [crear_respaldo(session.get_bind())["archivo"] for _ in range(3)]
+        assert [r["archivo"] for r in listar_respaldos()] == archivos[:0:-1]
+
+    def test_restaurar(self, client: TestClient, session: Session):
+        """Verifica la restauración y que los cachés no conservan datos posteriores"""
+        cancion_id = client.post(
+            "/api/canciones/", json={"titulo": "A", "artista": "B", "duracion": 60}
+        ).json()["id"]
+        nombre = Path(crear_respaldo(session.get_bind())["archivo"]).name
+
+        client.delete(f"/api/canciones/{cancion_id}")
+        assert client.get("/api/estadisticas/").json()["totales"]["canciones"] == 0
+
+        response = client.post(f"/api/admin/respaldos/{nombre}/restaurar")
+        assert response.status_code == 200
+        assert client.get(f"/api/canciones/{cancion_id}").status_code == 200
+        assert client.get("/api/estadisticas/").json()["totales"]["canciones"] == 1
+        assert client.get("/api/admin/respaldos").json()[0]["nombre"] == nombre
+
+    def test_restaurar_invalido(self, client: TestClient, tmp_path):
+        """Verifica que no se restaura un respaldo inexistente o dañado"""
+        assert client.post("/api/admin/respaldos/nada.db/restaurar").status_code == 404
+
+        danado = tmp_path / "respaldos" / "musica-danado.db"
+        danado.parent.mkdir()
+        danado.write_bytes(b"no es una base de datos")
+        assert client.post(f"/api/admin/respaldos/{danado.name}/restaurar").status_code == 422
+
+    def test_copia_reiniciada_pasa_a_un_solo_paso(self, tmp_path, monkeypatch):
+        """Verifica que tras demasiados reinicios la copia se hace en un solo paso"""
+        monkeypatch.setattr(get_settings(), "backup_max_restarts", 1)
+        real = sqlite3.connect(tmp_path / "origen.db")
+        real.execute("CREATE TABLE t (x)")
+        real.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(100)])
+        real.commit()
+
+        class OrigenConEscrituras:
+            """Simula una copia por pasos que se reinicia por escrituras concurrentes"""
+
+            def __init__(self):
+                self.pasos = []
+
+            def backup(self, destino, pages, progress=None, sleep=0):
+                self.pasos.append(pages)
+                if pages == -1:
+                    return real.backup(destino)
+                for restantes in (5, 3, 5, 3, 5, 3):
+                    progress(sqlite3.SQLITE_OK, restantes, 10)
+
+            def execute(self, sql):
+                return real.execute(sql)
+
+        origen = OrigenConEscrituras()
+        destino = sqlite3.connect(tmp_path / "copia.db")
+        paginas, reinicios = _copiar(origen, destino)
+        assert origen.pasos == [get_settings().backup_pages, -1]
+        assert reinicios == 2
+        assert paginas == real.execute("PRAGMA page_count").fetchone()[0]
+        assert destino.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 100
+
+    def test_restaurar_requiere_habilitarla(self, client: TestClient, session, monkeypatch):
+        """Verifica la configuración y el token que protegen la restauración"""
+        nombre = Path(crear_respaldo(session.get_bind())["archivo"]).name
+        url = f"/api/admin/respaldos/{nombre}/restaurar"
+
+        monkeypatch.setattr(get_settings(), "backup_restore_enabled", False)
+        assert client.post(url).status_code == 403
+
+        monkeypatch.setattr(get_settings(), "backup_restore_enabled", True)
+        monkeypatch.setattr(get_settings(), "backup_restore_token", "secreto")
+        assert client.post(url).status_code == 403
+        assert client.post(url, headers={"X-Restore-Token": "otro"}).status_code == 403
+        assert client.post(url, headers={"X-Restore-Token": "secreto"}).status_code == 200
+
+    def test_restaurar_con_peticiones_en_curso(self, client: TestClient, session: Session):
+        """Verifica que no se restaura con otras peticiones en curso ni se atiende durante ella"""
+        nombre = Path(crear_respaldo(session.get_bind())["archivo"]).name
+        url = f"/api/admin/respaldos/{nombre}/restaurar"
+
+        assert mantenimiento.entrar()
+        try:
+            response = client.post(url)
+        finally:
+            mantenimiento.salir()
+        assert response.status_code == 409
+
+        with mantenimiento.exclusivo():
+            response = client.get("/api/canciones/")
+        assert response.status_code == 503
+        assert client.get("/api/canciones/").status_code == 200
+
+
+class TestCacheIdentidad:
+    """Tests para la caché por ID de las consultas de detalle"""
+
+    def test_detalle_en_cache(self, client: TestClient, contar_consultas):
+        """Verifica que la segunda consulta de un ID no llega a la base de datos"""
+        cancion_id = client.post(
+            "/api/canciones/", json={"titulo": "A", "artista": "B", "duracion": 60}
+        ).json()["id"]
+        usuario_id = client.post(
+            "/api/usuarios/", json={"nombre": "Ana", "correo": "ana@example.com"}
+        ).json()["id"]
+        primera = client.get(f"/api/canciones/{cancion_id}").json()
+        client.get(f"/api/usuarios/{usuario_id}")
+
+        with contar_consultas() as consultas:
+            assert client.get(f"/api/canciones/{cancion_id}").json() == primera
+            assert client.get(f"/api/usuarios/{usuario_id}").json()["nombre"] == "Ana"
+        assert consultas.total == 0
+
+    def test_cache_negativa(self, client: TestClient, contar_consultas):
+        """Verifica que los 404 se recuerdan y que crear el ID los invalida"""
+        assert client.get("/api/canciones/1").status_code == 404
+        with contar_consultas() as consultas:
+            assert client.get("/api/canciones/1").status_code == 404
+        assert consultas.total == 0
+
+        client.post("/api/canciones/", json={"titulo": "A", "artista": "B", "duracion": 60})
+        assert client.get("/api/canciones/1").status_code == 200
+
+    def test_cache_negativa_expira(self):
+        """Verifica que las entradas negativas expiran tras su TTL"""
+        cache = IdentityCache(CancionRead, ttl_negativo=0)
+        cargas = []
+        for _ in range(2):
+            assert cache.obtener(1, lambda: cargas.append(1)) is None
+        assert len(cargas) == 2
+
+    def test_invalidacion_por_id(self, client: TestClient):
+        """Verifica que PATCH y DELETE invalidan solo el ID modificado"""
+        ids = [
+            client.post(
+                "/api/usuarios/", json={"nombre": f"U{i}", "correo": f"u{i}@example.com"}
+            ).json()["id"]
+            for i in range(2)
+        ]
+        for usuario_id in ids:
+            client.get(f"/api/usuarios/{usuario_id}")
+        hits = client.get("/api/admin/metricas").json()["cache_identidad"]["usuarios"]["hits"]
+
+        client.patch(f"/api/usuarios/{ids[0]}", json={"nombre": "Nuevo"})
+        assert client.get(f"/api/usuarios/{ids[0]}").json()["nombre"] == "Nuevo"
+        client.delete(f"/api/usuarios/{ids[0]}")
+        assert client.get(f"/api/usuarios/{ids[0]}").status_code == 404
+
+        metricas = client.get("/api/admin/metricas").json()["cache_identidad"]["usuarios"]
+        assert metricas["entradas"] == 2
+        assert metricas["hits"] == hits
+
+    def test_lru_acotado(self):
+        """Verifica que se descartan las entradas menos usadas al superar maxsize"""
+        cache = IdentityCache(CancionRead, maxsize=2)
+        for cancion_id in (1, 2, 1, 3):
+            cache.obtener(cancion_id, lambda: None)
+        assert list(cache._entradas) == [1, 3]
+
+
+class TestVistaFavoritos:
+    """Tests para la vista materializada de los favoritos de cada usuario"""
+
+    @pytest.fixture(name="catalogo")
+    def catalogo_fixture(self, client: TestClient) -> tuple[int, list[int]]:
+        usuario_id = client.post(
+            "/api/usuarios/", json={"nombre": "Ana", "correo": "ana@example.com"}
+        ).json()["id"]
+        canciones = [
+            client.post(
+                "/api/canciones/", json={"titulo": f"C{i}", "artista": "A", "duracion": 60}
+            ).json()["id"]
+            for i in range(3)
+        ]
+        return usuario_id, canciones
+
+    @staticmethod
+    def _fila(session: Session, usuario_id: int) -> FavoritosMaterializados:
+        """Fila guardada en la vista para el usuario"""
+        return session.get(FavoritosMaterializados, usuario_id, populate_existing=True)
+
+    def test_escrituras_aplican_el_cambio(
+        self, client: TestClient, session: Session, catalogo, contar_consultas
+    ):
+        """Verifica que altas y bajas actualizan la vista sin que la lectura reconstruya"""
+        usuario_id, canciones = catalogo
+        url = f"/api/favoritos/usuario/{usuario_id}"
+        assert client.get(url).json() == []
+        fila = self._fila(session, usuario_id)
+        assert (fila.version, fila.version_datos) == (1, 1)
+
+        favoritos = [
+            client.post(
+                "/api/favoritos/", json={"usuario_id": usuario_id, "cancion_id": cancion_id}
+            ).json()
+            for cancion_id in canciones
+        ]
+        client.delete(f"/api/favoritos/{favoritos[0]['id']}")
+        client.delete(f"/api/favoritos/usuario/{usuario_id}/cancion/{canciones[2]}")
+        fila = self._fila(session, usuario_id)
+        assert (fila.version, fila.version_datos) == (6, 6)
+        assert [f["id"] for f in json.loads(fila.datos)] == [favoritos[1]["id"]]
+
+        misses = vista_favoritos.misses
+        with contar_consultas() as consultas:
+            respuesta = client.get(url).json()
+        assert consultas.total == 1
+        assert vista_favoritos.misses == misses
+        assert [f["cancion_id"] for f in respuesta] == [canciones[1]]
+        assert respuesta[0]["cancion"]["titulo"] == "C1"
+
+    def test_actualizar_cancion(self, client: TestClient, catalogo):
+        """Verifica que modificar una canción desactualiza las vistas que la incluyen"""
+        usuario_id, canciones = catalogo
+        url = f"/api/favoritos/usuario/{usuario_id}"
+        for cancion_id in canciones[:2]:
+            client.post(
+                "/api/favoritos/", json={"usuario_id": usuario_id, "cancion_id": cancion_id}
+            )
+        client.get(url)
+
+        client.patch(f"/api/canciones/{canciones[0]}", json={"titulo": "Nuevo"})
+        assert [f["cancion"]["titulo"] for f in client.get(url).json()] == ["Nuevo", "C1"]
+
+    def test_escritura_durante_la_construccion(
+        self, client: TestClient, session: Session, catalogo, monkeypatch
+    ):
+        """Verifica que una construcción concurrente con una escritura no guarda datos viejos"""
+        usuario_id, canciones = catalogo
+        construir = vista_favoritos._construir
+
+        def construir_y_escribir(*args):
+            elementos = construir(*args)
+            session.add(Favorito(usuario_id=usuario_id, cancion_id=canciones[0]))
+            vista_favoritos.invalidar(session, usuario_id)
+            session.commit()
+            return elementos
+
+        monkeypatch.setattr(vista_favoritos, "_construir", construir_y_escribir)
+        assert json.loads(vista_favoritos.obtener(session, usuario_id)) == []
+        monkeypatch.undo()
+
+        fila = self._fila(session, usuario_id)
+        assert fila.version_datos != fila.version
+        url = f"/api/favoritos/usuario/{usuario_id}"
+        assert [f["cancion_id"] for f in client.get(url).json()] == [canciones[0]]
+
+    def test_eliminar_usuario(self, client: TestClient, catalogo):
+        """Verifica que eliminar al usuario descarta su vista"""
+        usuario_id, _ = catalogo
+        url = f"/api/favoritos/usuario/{usuario_id}"
+        assert client.get(url).json() == []
+
+        client.delete(f"/api/usuarios/{usuario_id}")
+        assert client.get(url).status_code == 404
+        assert client.get("/api/admin/metricas").json()["vista_favoritos"]["misses"] >= 2
+
+
+class TestShards:
+    """Tests para el reparto de favoritos entre varios archivos SQLite"""
+
+    @pytest.fixture(autouse=True)
+    def dos_shards(self, client: TestClient):
+        """Reparte los favoritos en dos bases de datos en memoria durante el test"""
+        originales = shards.engines
+        engines = [
+            create_engine(
+                "sqlite:///:memory:",
+                connect_args={"check_same_thread": False},
+                poolclass=StaticPool,
+            )
+            for _ in range(2)
+        ]
+        shards.configurar(engines)
+        shards.crear_tablas()
+        yield engines
+        shards.detener_escritores()
+        shards.configurar(originales)
+
+    @pytest.fixture(name="catalogo")
+    def catalogo_fixture(self, client: TestClient) -> tuple[list[int], list[int]]:
+        usuarios = [
+            client.post(
+                "/api/usuarios/", json={"nombre": f"U{i}", "correo": f"u{i}@example.com"}
+            ).json()["id"]
+            for i in range(4)
+        ]
+        canciones = [
+            client.post(
+                "/api/canciones/", json={"titulo": f"C{i}", "artista": "A", "duracion": 60}
+            ).json()["id"]
+            for i in range(3)
+        ]
+        return usuarios, canciones
+
+    @staticmethod
+    def _agregar(client: TestClient, usuario_id: int, cancion_id: int) -> dict:
+        response = client.post(
+            "/api/favoritos/", json={"usuario_id": usuario_id, "cancion_id": cancion_id}
+        )
+        assert response.status_code == 201
+        return response.json()
+
+    def test_ids_globales(self):
+        """Verifica que el ID global codifica el shard"""
+        assert shards.shard_de(5) == 1
+        assert shards.id_global(1, 3) == 7
+        assert shards.ubicar(7) == (1, 3)
+
+    def test_escrituras_en_el_shard_del_usuario(
+        self, client: TestClient, session: Session, dos_shards, catalogo
+    ):
+        """Verifica que cada favorito se guarda en el shard de su usuario"""
+        usuarios, canciones = catalogo
+        favoritos = [self._agregar(client, usuario_id, canciones[0]) for usuario_id in usuarios]
+
+        assert len({favorito["id"] for favorito in favoritos}) == 4
+        for favorito in favoritos:
+            assert shards.ubicar(favorito["id"])[0] == favorito["usuario_id"] % 2
+        for shard, engine in enumerate(dos_shards):
+            with Session(engine) as sesion_shard:
+                ids = sesion_shard.exec(select(Favorito.usuario_id)).all()
+            assert sorted(ids) == [u for u in usuarios if u % 2 == shard]
+        assert session.exec(select(Favorito)).all() == []
+
+        duplicado = client.post(
+            "/api/favoritos/", json={"usuario_id": usuarios[0], "cancion_id": canciones[0]}
+        )
+        assert duplicado.status_code == 400
+
+    def test_eventos_en_el_shard(self, client: TestClient, session: Session, dos_shards, catalogo):
+        """Verifica que los eventos de favoritos se guardan en el shard y se trasladan al leer"""
+        usuarios, canciones = catalogo
+        favorito = self._agregar(client, usuarios[1], canciones[0])
+        assert session.exec(select(Cambio).where(Cambio.entidad == "favorito")).all() == []
+        shard = usuarios[1] % 2
+        with Session(dos_shards[shard]) as sesion_shard:
+            pendiente = sesion_shard.exec(select(Cambio)).one()
+        assert pendiente.entidad_id == favorito["id"]
+
+        # Un traslado interrumpido tras el commit de la principal no duplica eventos
+        session.add(
+            Cambio(
+                entidad="favorito",
+                entidad_id=favorito["id"],
+                operacion="crear",
+                origen=shard,
+                origen_id=pendiente.id,
+            )
+        )
+        session.commit()
+        self._agregar(client, usuarios[1], canciones[1])
+
+        cambios = client.get("/api/cambios/?entidad=favorito").json()["cambios"]
+        assert [c["entidad_id"] for c in cambios] == [favorito["id"], favorito["id"] + 2]
+        for engine in dos_shards:
+            with Session(engine) as sesion_shard:
+                assert sesion_shard.exec(select(Cambio)).all() == []
+
+    def test_lecturas(self, client: TestClient, catalogo):
+        """Verifica el listado global, el de un usuario y los agregados"""
+        usuarios, canciones = catalogo
+        for usuario_id in usuarios:
+            for cancion_id in canciones[: usuario_id % 3 + 1]:
+                self._agregar(client, usuario_id, cancion_id)
+
+        todos = client.get("/api/favoritos/?limit=100").json()
+        ids = [favorito["id"] for favorito in todos]
+        assert ids == sorted(ids) and len(ids) == 8
+        pagina = client.get("/api/favoritos/?skip=3&limit=4").json()
+        assert [favorito["id"] for favorito in pagina] == ids[3:7]
+
+        propios = client.get(f"/api/favoritos/usuario/{usuarios[1]}").json()
+        assert {f["cancion"]["id"] for f in propios} == set(canciones[: usuarios[1] % 3 + 1])
+        assert {f["id"] for f in propios} <= set(ids)
+
+        estadisticas = client.get("/api/estadisticas/").json()
+        assert estadisticas["totales"]["favoritos"] == 8
+        assert estadisticas["favoritos_por_usuario"][0]["favoritos"] == 3
+
+        similares = client.get(f"/api/usuarios/{usuarios[0]}/similares").json()
+        assert similares
+
+    def test_eliminar_y_registro_de_cambios(self, client: TestClient, catalogo):
+        """Verifica las bajas por ID global y que los eventos usan ese ID"""
+        usuarios, canciones = catalogo
+        primero = self._agregar(client, usuarios[1], canciones[0])
+        self._agregar(client, usuarios[1], canciones[1])
+
+        assert client.delete(f"/api/favoritos/{primero['id']}").status_code == 204
+        assert client.delete(f"/api/favoritos/{primero['id']}").status_code == 404
+        url = f"/api/favoritos/usuario/{usuarios[1]}/cancion/{canciones[1]}"
+        assert client.delete(url).status_code == 204
+        assert client.get("/api/favoritos/").json() == []
+
+        cambios = client.get("/api/cambios/?entidad=favorito").json()["cambios"]
+        assert [(c["operacion"], c["entidad_id"]) for c in cambios][:2] == [
+            ("crear", primero["id"]),
+            ("crear", primero["id"] + 2),
+        ]
+        assert cambios[2] == {**cambios[2], "operacion": "eliminar", "entidad_id": primero["id"]}
+
+    def test_vista_favoritos_con_ids_globales(self, client: TestClient, catalogo):
+        """Verifica que la vista de un usuario usa los IDs globales de su shard"""
+        usuarios, canciones = catalogo
+        url = f"/api/favoritos/usuario/{usuarios[1]}"
+        assert client.get(url).json() == []
+
+        favoritos = [self._agregar(client, usuarios[1], cancion_id) for cancion_id in canciones]
+        assert client.get(url).json() == [
+            {**favorito, "cancion": client.get(f"/api/canciones/{favorito['cancion_id']}").json()}
+            for favorito in favoritos
+        ]
+
+        assert client.delete(f"/api/favoritos/{favoritos[1]['id']}").status_code == 204
+        assert [f["id"] for f in client.get(url).json()] == [
+            favoritos[0]["id"],
+            favoritos[2]["id"],
+        ]
+
+        # Los favoritos de una canción eliminada salen de la vista
+        assert client.delete(f"/api/canciones/{canciones[0]}").status_code == 204
+        assert [f["id"] for f in client.get(url).json()] == [favoritos[2]["id"]]
+
+    def test_eliminar_usuario_borra_sus_favoritos(self, client: TestClient, dos_shards, catalogo):
+        """Verifica que no quedan favoritos huérfanos en los shards"""
+        usuarios, canciones = catalogo
+        self._agregar(client, usuarios[1], canciones[0])
+        assert client.delete(f"/api/usuarios/{usuarios[1]}").status_code == 204
+        with Session(dos_shards[usuarios[1] % 2]) as sesion_shard:
+            assert sesion_shard.exec(select(Favorito)).all() == []
+
+    def test_bajas_en_bloque_registran_eventos(
+        self, client: TestClient, session: Session, catalogo
+    ):
+        """Verifica que borrar un usuario o una canción registra la baja de sus favoritos"""
+        usuarios, canciones = catalogo
+        del_usuario = self._agregar(client, usuarios[1], canciones[0])
+        de_cancion = self._agregar(client, usuarios[2], canciones[1])
+        assert client.delete(f"/api/usuarios/{usuarios[1]}").status_code == 204
+        assert client.delete(f"/api/canciones/{canciones[1]}").status_code == 204
+        trasladar_cambios(session)
+
+        cambios = client.get("/api/cambios/").json()["cambios"]
+        eventos = [(c["entidad"], c["operacion"], c["entidad_id"]) for c in cambios]
+        for favorito, entidad, entidad_id in (
+            (del_usuario, "usuario", usuarios[1]),
+            (de_cancion, "cancion", canciones[1]),
+        ):
+            creado = eventos.index(("favorito", "crear", favorito["id"]))
+            baja = eventos.index((entidad, "eliminar", entidad_id))
+            assert creado < baja < eventos.index(("favorito", "eliminar", favorito["id"]))
+
+    def test_traslado_mezcla_los_shards_por_fecha(self, session: Session, dos_shards, monkeypatch):
+        """Verifica que los eventos de los shards llegan a la principal en orden de fecha"""
+        monkeypatch.setattr(changefeed, "LOTE_TRASLADO", 2)
+        base = datetime(2024, 1, 1)
+        minutos = {0: [1, 2, 3, 7], 1: [4, 5, 6]}
+        for shard, lista in minutos.items():
+            with Session(dos_shards[shard]) as sesion_shard:
+                for minuto in lista:
+                    sesion_shard.add(
+                        Cambio(
+                            entidad="favorito",
+                            entidad_id=minuto,
+                            operacion="crear",
+                            fecha=base + timedelta(minutes=minuto),
+                        )
+                    )
+                sesion_shard.commit()
+
+        assert trasladar_cambios(session) == 7
+        ids = session.exec(select(Cambio.entidad_id).order_by(Cambio.id)).all()
+        assert ids == [1, 2, 3, 4, 5, 6, 7]
+
+    def test_commit_agrupado_por_shard(self, client: TestClient, catalogo):
+        """Verifica que cada shard usa su propio escritor con commit agrupado"""
+        usuarios, canciones = catalogo
+        shards.iniciar_escritores()
+        for usuario_id in usuarios:
+            self._agregar(client, usuario_id, canciones[0])
+
+        metricas = client.get("/api/admin/metricas").json()["commit_agrupado"]
+        assert [escritor["operaciones"] for escritor in metricas] == [2, 2]
+
+    def test_respaldo_incluye_los_shards(
+        self, client: TestClient, session: Session, catalogo, tmp_path, monkeypatch
+    ):
+        """Verifica que el respaldo copia y restaura los shards como un conjunto"""
+        monkeypatch.setattr(get_settings(), "backup_dir", str(tmp_path / "respaldos"))
+        monkeypatch.setattr(get_settings(), "backup_restore_enabled", True)
+        usuarios, canciones = catalogo
+        favorito = self._agregar(client, usuarios[1], canciones[0])
+        resultado = crear_respaldo(session.get_bind())
+        archivo = Path(resultado["archivo"])
+        assert resultado["shards"] == 2
+        assert all(verificar(archivo_shard(archivo, shard)) for shard in range(2))
+        assert [(r["nombre"], r["shards"]) for r in listar_respaldos()] == [(archivo.name, 2)]
+
+        client.delete(f"/api/favoritos/{favorito['id']}")
+        assert client.post(f"/api/admin/respaldos/{archivo.name}/restaurar").status_code == 200
+        restaurados = client.get(f"/api/favoritos/usuario/{usuarios[1]}").json()
+        assert [f["id"] for f in restaurados] == [favorito["id"]]
+
+        # Un conjunto incompleto no se restaura
+        archivo_shard(archivo, 1).unlink()
+        assert client.post(f"/api/admin/respaldos/{archivo.name}/restaurar").status_code == 422
+
+
+class TestReplay:
+    """Tests para el reproductor de tráfico de benchmarks/replay.py"""
+
+    def test_parsear_lineas(self, tmp_path):
+        """Verifica los formatos de log soportados"""
+        log = tmp_path / "app.log"
+        log.write_text(
+            "2024-05-01 10:00:00 - app - INFO - Sistema de logging inicializado\n"
+            '2024-05-01 10:00:01 - uvicorn.access - INFO - 127.0.0.1:5000 - "GET /api/canciones/'
+            '?limit=5 HTTP/1.1" 200 OK\n'
+            "2024-05-01 10:00:02 - httpx - INFO - HTTP Request: GET http://testserver/api/"
+            'usuarios/7 "HTTP/1.1 404 Not Found"\n'
+            '2024-05-01 10:00:03 - uvicorn.access - INFO - 127.0.0.1:5000 - "POST /api/usuarios/'
+            ' HTTP/1.1" 201 Created\n'
+            '{"fecha": "2024-05-01T10:00:04", "metodo": "POST", "ruta": "/api/favoritos/", '
+            '"body": {"usuario_id": 1, "cancion_id": 1}}\n',
+            encoding="utf-8",
+        )
+
+        peticiones = replay.cargar_workload([log])
+        assert [(p.metodo, p.ruta) for p in peticiones] == [
+            ("GET", "/api/canciones/?limit=5"),
+            ("GET", "/api/usuarios/7"),
+        ]
+        assert peticiones[1].momento - peticiones[0].momento == 1
+        assert len(replay.cargar_workload([log], escrituras=True)) == 3
+        assert replay.plantilla_ruta("/api/usuarios/7/comunes/12?x=1") == (
+            "/api/usuarios/{id}/comunes/{id}"
+        )
+
+    def test_programar_y_percentiles(self):
+        """Verifica los horarios de cada modo y el cálculo de percentiles"""
+        peticiones = [replay.Peticion("GET", "/", momento) for momento in (100, 101, 103)]
+        assert replay.programar(peticiones, "original", velocidad=2) == [0, 0.5, 1.5]
+        assert replay.programar(peticiones, "abierto", rps=10) == [0, 0.1, 0.2]
+        assert replay.programar(peticiones, "cerrado") == [None] * 3
+        assert replay.percentil(list(range(1, 101)), 99) == 99
+        assert replay.percentil([5.0], 50) == 5.0
+
+    def test_reproducir_contra_la_app(self, client: TestClient):
+        """Reproduce un workload contra la aplicación y agrupa por ruta"""
+        client.post("/api/canciones/", json={"titulo": "A", "artista": "B", "duracion": 60})
+        peticiones = [
+            replay.Peticion("GET", ruta)
+            for ruta in ["/api/canciones/1", "/api/canciones/2", "/api/canciones/"] * 3
+        ]
+
+        async def ejecutar():
+            transporte = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+                return await replay.reproducir(peticiones, cliente, concurrencia=2)
+
+        resumen = replay.resumir(asyncio.run(ejecutar()), segundos=1)
+        assert resumen["TOTAL"]["peticiones"] == 9
+        assert resumen["/api/canciones/{id}"]["4xx"] == 3
+        assert resumen["/api/canciones/"]["errores"] == 0
+
+
+class TestRegistroAcceso:
+    """Tests para el registro de acceso estructurado"""
+
+    @pytest.fixture(name="lineas")
+    def lineas_fixture(self):
+        """Captura las líneas JSON del registro de acceso"""
+        lineas = []
+
+        class Capturar(logging.Handler):
+            def emit(self, record):
+                lineas.append(json.loads(record.getMessage()))
+
+        handler = Capturar()
+        registro_acceso.setLevel(logging.INFO)
+        registro_acceso.addHandler(handler)
+        yield lineas
+        registro_acceso.removeHandler(handler)
+
+    def test_linea_por_peticion(self, client: TestClient, lineas):
+        """Verifica los campos de la línea de acceso"""
+        cancion_id = client.post(
+            "/api/canciones/", json={"titulo": "A", "artista": "B", "duracion": 60}
+        ).json()["id"]
+        client.get(f"/api/canciones/{cancion_id}")
+        response = client.get(f"/api/canciones/{cancion_id}")
+
+        crear, primera, segunda = lineas
+        assert crear["metodo"] == "POST" and crear["estado"] == 201
+        assert crear["consultas"] >= 2 and crear["db_ms"] > 0
+        assert primera["plantilla"] == "/api/canciones/{cancion_id}"
+        assert primera["consultas"] == 1 and primera["cache_hits"] == 0
+        assert segunda["consultas"] == 0 and segunda["cache_hits"] == 1
+        assert segunda["bytes"] == len(response.content)
+        assert segunda["request_id"] == response.headers["X-Request-ID"]
+        assert segunda["duracion_ms"] >= segunda["db_ms"]
+
+    def test_request_id(self, client: TestClient, lineas):
+        """Verifica que se respeta un X-Request-ID válido y se reemplaza uno inválido"""
+        response = client.get("/api/usuarios/", headers={"X-Request-ID": "abc-123"})
+        assert response.headers["X-Request-ID"] == "abc-123"
+        response = client.get("/api/usuarios/", headers={"X-Request-ID": "no es valido; id"})
+        assert len(response.headers["X-Request-ID"]) == 32
+        assert [linea["request_id"] for linea in lineas] == [
+            "abc-123",
+            response.headers["X-Request-ID"],
+        ]
+
+    def test_correlacion_en_app_log(self, client: TestClient):
+        """Verifica que las líneas de log de la petición llevan su ID"""
+        registros = []
+
+        class Capturar(logging.Handler):
+            def emit(self, record):
+                registros.append(record.request_id)
+
+        handler = Capturar()
+        handler.addFilter(RequestIdFilter())
+        router_logger = logging.getLogger("app.routers.usuarios")
+        router_logger.addHandler(handler)
+        router_logger.setLevel(logging.INFO)
+        try:
+            client.get("/api/usuarios/", headers={"X-Request-ID": "correlado"})
+        finally:
+            router_logger.removeHandler(handler)
+        assert registros and set(registros) == {"correlado"}
+
+
+class TestCoalescencia:
+    """Tests para la agrupación de lecturas idénticas concurrentes."""
+
+    def test_llamadas_concurrentes_comparten_resultado(self):
+        """Verifica que las llamadas con la misma clave ejecutan la función una vez"""
+        grupo = SingleFlight()
+        liberar = threading.Event()
+        ejecuciones = []
+
+        def consulta():
+            ejecuciones.append(1)
+            liberar.wait(timeout=5)
+            return ["resultado"]
+
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(grupo.do("clave", consulta)))
+            for _ in range(5)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        while grupo.metricas()["coalescidas"] < 4:
+            time.sleep(0.001)
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+
+        assert len(ejecuciones) == 1
+        assert resultados == [["resultado"]] * 5
+        assert grupo.metricas()["ejecutadas"] == 1
+
+    def test_error_se_propaga_a_todas_las_llamadas(self):
+        """Verifica que una excepción del líder no deja la clave bloqueada"""
+        grupo = SingleFlight()
+
+        def falla():
+            raise ValueError("fallo")
+
+        with pytest.raises(ValueError):
+            grupo.do("clave", falla)
+        assert grupo.do("clave", lambda: 42) == 42
+
+    def test_lectura_tras_escritura_no_se_une(self):
+        """Verifica que una lectura posterior a una escritura no comparte una consulta anterior"""
+        liberar = threading.Event()
+        cuerpos = iter([b"antes", b"despues"])
+
+        def consulta():
+            cuerpo = next(cuerpos)
+            if cuerpo == b"antes":
+                liberar.wait(timeout=5)
+            return Response(content=cuerpo)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            primera = pool.submit(responder_coalescido, "clave-escritura", consulta)
+            while coalescer.metricas()["en_curso"] == 0:
+                time.sleep(0.001)
+            CacheManager.clear_all()
+            segunda = responder_coalescido("clave-escritura", consulta)
+            liberar.set()
+            assert primera.result(5).body == b"antes"
+        assert segunda.body == b"despues"
+
+    def test_metricas_de_coalescencia(self, client: TestClient, cancion_test: Cancion):
+        """Verifica el endpoint de métricas y que el listado sigue respondiendo"""
+        response = client.get("/api/canciones/?genero=Rock&limit=100")
+        assert response.status_code == 200
+        assert response.json()[0]["id"] == cancion_test.id
+
+        response = client.get("/api/admin/metricas")
+        assert response.status_code == 200
+        assert response.json()["coalescencia"]["ejecutadas"] >= 1
+
+
+# =============================================================================
+# TESTS DE COMMIT AGRUPADO
+# =============================================================================
+
+
+class TestCommitAgrupado:
+    """Tests para el escritor con commit agrupado de favoritos."""
+
+    @pytest.fixture(name="escritor")
+    def escritor_fixture(self, tmp_path):
+        """Crea un escritor sobre una base de datos temporal con datos de prueba"""
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'group_commit.db'}",
+            connect_args={"check_same_thread": False},
+        )
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add(Usuario(nombre="Usuario Test", correo="test@example.com"))
+            for i in range(20):
+                session.add(Cancion(titulo=f"Canción {i}", artista="Artista", duracion=100))
+            session.commit()
+
+        escritor = GroupCommitWriter(engine, max_lote=50, intervalo_ms=20)
+        escritor.iniciar()
+        yield escritor
+        escritor.detener()
+        engine.dispose()
+
+    def test_operaciones_concurrentes_en_pocos_lotes(self, escritor: GroupCommitWriter):
+        """Verifica que las escrituras concurrentes se confirman juntas"""
+        resultados = []
+
+        def agregar(cancion_id):
+            favorito = FavoritoCreate(usuario_id=1, cancion_id=cancion_id)
+            resultados.append(escritor.ejecutar(lambda s: _agregar_favorito(s, favorito)))
+
+        hilos = [threading.Thread(target=agregar, args=(i,)) for i in range(1, 21)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert len(resultados) == 20
+        assert all(favorito.id is not None for favorito in resultados)
+        assert escritor.lotes < 20
+        with Session(escritor.engine) as session:
+            assert len(session.exec(select(Favorito)).all()) == 20
+
+    def test_error_de_validacion_no_afecta_al_lote(self, escritor: GroupCommitWriter):
+        """Verifica que una operación inválida solo falla para su llamador"""
+        favorito = FavoritoCreate(usuario_id=1, cancion_id=1)
+        escritor.ejecutar(lambda s: _agregar_favorito(s, favorito))
+
+        with pytest.raises(HTTPException) as error:
+            escritor.ejecutar(lambda s: _agregar_favorito(s, favorito))
+        assert error.value.status_code == 400
+
+        otro = FavoritoCreate(usuario_id=1, cancion_id=2)
+        assert escritor.ejecutar(lambda s: _agregar_favorito(s, otro)).cancion_id == 2
+
+    def test_timeout_cancela_la_operacion(self, escritor: GroupCommitWriter):
+        """Verifica que el llamador no espera indefinidamente a un escritor atascado"""
+        atascado = GroupCommitWriter(escritor.engine, timeout=0.05)
+        favorito = FavoritoCreate(usuario_id=1, cancion_id=3)
+        with pytest.raises(EscrituraNoConfirmadaError) as error:
+            atascado.ejecutar(lambda s: _agregar_favorito(s, favorito))
+        assert error.value.aplicada_posiblemente is False
+
+        # Al arrancar, el escritor descarta la operación cancelada
+        atascado.iniciar()
+        atascado.detener()
+        assert atascado.metricas()["agotadas"] == 1
+        with Session(escritor.engine) as session:
+            assert session.exec(select(Favorito)).all() == []
+
+    def test_base_bloqueada_falla_todo_el_lote(self, tmp_path):
+        """Verifica que un error de la base de datos llega a cada llamador del lote"""
+        ruta = tmp_path / "bloqueada.db"
+        engine = create_engine(f"sqlite:///{ruta}", connect_args={"timeout": 0.05})
+        SQLModel.metadata.create_all(engine)
+        escritor = GroupCommitWriter(engine, max_lote=10, intervalo_ms=100)
+        escritor.iniciar()
+
+        bloqueo = sqlite3.connect(ruta)
+        bloqueo.execute("BEGIN EXCLUSIVE")
+        errores = []
+
+        def agregar(cancion_id):
+            favorito = Favorito(usuario_id=1, cancion_id=cancion_id)
+            try:
+                escritor.ejecutar(lambda s: s.add(favorito))
+            except Exception as exc:
+                errores.append(exc)
+
+        hilos = [threading.Thread(target=agregar, args=(i,)) for i in range(3)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        bloqueo.rollback()
+        bloqueo.close()
+        escritor.detener()
+        engine.dispose()
+
+        assert len(errores) == 3
+        assert all(isinstance(error, OperationalError) for error in errores)
+
+
 # =============================================================================
 # TESTS ADICIONALES
 # =============================================================================
@@ -350,6 +2271,113 @@ class TestEndpointsBasicos:
         assert data["status"] == "healthy"
         assert "version" in data
 
+    def test_liveness(self, client: TestClient):
+        """Verifica el liveness probe"""
+        response = client.get("/health/live")
+        assert response.status_code == 200
+        assert response.json() == {"status": "alive"}
+
+    def test_readiness(self, client: TestClient):
+        """Verifica el readiness probe con la base de datos disponible"""
+        antes = client.get("/health/ready").json()["cache"]["calcular_estadisticas"]["hits"]
+        client.get("/api/estadisticas/")
+        client.get("/api/estadisticas/")
+
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["database"]["status"] == "ok"
+        assert data["database"]["latencia_ms"] >= 0
+        assert set(data["pool"]) == {"tipo", "tamano", "en_uso", "desbordadas"}
+        assert data["cache"]["calcular_estadisticas"]["hits"] == antes + 1
+
+    def test_readiness_sin_esquema(self, client: TestClient):
+        """Verifica que el readiness probe falla si la base de datos no tiene tablas"""
+        engine = create_engine(
+            "sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        with Session(engine) as vacia:
+            app.dependency_overrides[get_session] = lambda: vacia
+            response = client.get("/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "degraded"
+        assert response.json()["database"]["status"] == "error"
+
+
+class TestEsquema:
+    """Tests para la inicialización del esquema al arrancar."""
+
+    def test_omite_ddl_si_la_huella_coincide(self, tmp_path):
+        """Verifica que el segundo arranque no ejecuta DDL"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'esquema.db'}")
+
+        assert inicializar_esquema(engine) is True
+        assert inicializar_esquema(engine) is False
+        with engine.connect() as conexion:
+            version = conexion.exec_driver_sql("PRAGMA user_version").scalar()
+        assert version == huella_esquema()
+
+    def test_agrega_columnas_faltantes(self, tmp_path):
+        """Verifica que un esquema anterior se completa sin perder datos"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'antiguo.db'}")
+        with engine.begin() as conexion:
+            conexion.exec_driver_sql(
+                "CREATE TABLE cambio (id INTEGER PRIMARY KEY, entidad VARCHAR NOT NULL, "
+                "entidad_id INTEGER NOT NULL, operacion VARCHAR NOT NULL, fecha DATETIME NOT NULL)"
+            )
+            conexion.exec_driver_sql(
+                "INSERT INTO cambio VALUES (1, 'usuario', 1, 'crear', '2024-01-01 00:00:00')"
+            )
+
+        assert inicializar_esquema(engine) is True
+
+        with engine.connect() as conexion:
+            columnas = {fila[1] for fila in conexion.exec_driver_sql("PRAGMA table_info(cambio)")}
+            total = conexion.exec_driver_sql("SELECT COUNT(*) FROM cambio").scalar()
+        assert "datos" in columnas
+        assert total == 1
+
+    def test_columna_obligatoria_sin_valor_por_defecto(self, tmp_path, caplog):
+        """Verifica que una columna que no se puede agregar se advierte y no se guarda la huella"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'obligatoria.db'}")
+        with engine.begin() as conexion:
+            conexion.exec_driver_sql(
+                "CREATE TABLE cambio (id INTEGER PRIMARY KEY, entidad_id INTEGER NOT NULL, "
+                "operacion VARCHAR NOT NULL, fecha DATETIME NOT NULL)"
+            )
+
+        with caplog.at_level(logging.WARNING, logger="app.database"):
+            assert inicializar_esquema(engine) is True
+        assert "cambio.entidad" in caplog.text
+        with engine.connect() as conexion:
+            assert conexion.exec_driver_sql("PRAGMA user_version").scalar() == 0
+        assert inicializar_esquema(engine) is True
+
+    def test_rellena_claves_normalizadas(self, tmp_path):
+        """Verifica que la migración calcula la clave de las canciones existentes"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'claves.db'}")
+        with engine.begin() as conexion:
+            conexion.exec_driver_sql(
+                "CREATE TABLE cancion (id INTEGER PRIMARY KEY, titulo VARCHAR NOT NULL, "
+                "artista VARCHAR NOT NULL, album VARCHAR, duracion INTEGER NOT NULL, "
+                "año INTEGER, genero VARCHAR, fecha_creacion DATETIME NOT NULL)"
+            )
+            conexion.exec_driver_sql(
+                "INSERT INTO cancion (id, titulo, artista, duracion, fecha_creacion) VALUES "
+                "(1, 'Canción', 'Bandá', 60, '2024-01-01'), "
+                "(2, '群青', 'YOASOBI', 60, '2024-01-01')"
+            )
+
+        assert inicializar_esquema(engine) is True
+
+        with engine.connect() as conexion:
+            claves = conexion.exec_driver_sql(
+                "SELECT clave_normalizada FROM cancion ORDER BY id"
+            ).scalars()
+            assert list(claves) == ["banda:cancion", "yoasobi:群青"]
+
 
 class TestIntegracion:
     """Tests de integración que prueban flujos completos."""
@@ -3,6 +3,7 @@ Módulo de utilidades para la aplicación.
 Contiene funciones auxiliares utilizadas en diferentes partes de la aplicación.
 """
 import re
+import unicodedata
 
 
 def validar_correo(correo):
@@ -45,18 +46,58 @@ def generar_slug(texto):
     Returns:
         str: Slug generado
     """
-    # TODO: Convertir a minúsculas
-    slug = texto
+    # Convertir a minúsculas y quitar tildes (é -> e, ñ -> n)
+    slug = unicodedata.normalize("NFKD", texto.casefold())
+    slug = "".join(c for c in slug if not unicodedata.combining(c))
 
-    # TODO: Reemplazar espacios con guiones
+    # Reemplazar espacios con guiones
+    slug = re.sub(r"\s+", "-", slug)
 
-    # TODO: Eliminar caracteres no alfanuméricos (excepto guiones)
+    # Eliminar caracteres no alfanuméricos (excepto guiones)
+    slug = re.sub(r"[^a-z0-9-]", "", slug)
 
-    # TODO: Reemplazar múltiples guiones con uno solo
+    # Reemplazar múltiples guiones con uno solo
+    slug = re.sub(r"-+", "-", slug)
 
-    # TODO: Eliminar guiones al inicio y final
+    # Eliminar guiones al inicio y final
+    return slug.strip("-")
 
-    return slug
+
+# Versión del algoritmo de normalizar_texto; al cambiarla se recalculan las claves guardadas
+VERSION_NORMALIZACION = 2
+
+
+def normalizar_texto(texto):
+    """
+    Normaliza un texto para compararlo sin importar mayúsculas, tildes ni signos.
+    A diferencia de generar_slug conserva las letras de cualquier alfabeto
+    (ej: japonés o cirílico); solo se quitan los diacríticos de las letras
+    latinas. Si el texto no tiene letras ni dígitos se conserva en minúsculas
+    para que dos textos distintos hechos solo de signos no coincidan.
+
+    Args:
+        texto (str): Texto a normalizar
+
+    Returns:
+        str: Palabras normalizadas separadas por guiones
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto.casefold())
+    caracteres = []
+    base_latina = False
+    for c in descompuesto:
+        if unicodedata.combining(c):
+            # é -> e, pero se conservan marcas como el dakuten japonés (が != か)
+            if base_latina:
+                continue
+        else:
+            base_latina = unicodedata.name(c, "").startswith("LATIN")
+        caracteres.append(c)
+    normalizado = unicodedata.normalize("NFC", "".join(caracteres))
+
+    palabras = re.findall(r"[^\W_]+", normalizado)
+    if palabras:
+        return "-".join(palabras)
+    return " ".join(normalizado.split())
 
 
 def obtener_año_actual():